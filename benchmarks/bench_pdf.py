@@ -0,0 +1,76 @@
+# benchmarks/bench_pdf.py
+# Compare le rendu PDF de référence (FPDF complet) et le rendu par gabarit.
+#   python benchmarks/bench_pdf.py [-n 2000]
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pdf_recap  # noqa: E402
+
+RECAPS = {
+    "Assur'Education": {
+        "product": "Assur'Education",
+        "title": "Assur'Education - Récapitulatif",
+        "inputs": {
+            "Type de cotisation": "Prestation",
+            "Année de naissance": 1985,
+            "Âge": 41,
+            "Durée cotisation (ans)": 10,
+            "Nombre de rentes": 3,
+            "Montant rente annuelle": 50000.0,
+        },
+        "results": {"Taux": 0.024762671617704252, "Cotisation mensuelle": "1,238.13"},
+    },
+    "IBEKELIA": {
+        "product": "IBEKELIA",
+        "title": "IBEKELIA - Récapitulatif",
+        "inputs": {"Année de naissance": 1980, "Âge": 46, "Périodicité": "M", "Capital obsèques": 1000000},
+        "results": {"Prime": "10,358.00"},
+    },
+    "FER+": {
+        "product": "FER+",
+        "title": "FER+ - Récapitulatif",
+        "inputs": {"Choix grille": "C", "Durée (ans)": 10, "Cot mens ep (épargne)": 30000.0,
+                   "Cot mens prev (décès)": 6000.0, "Cot mens tot": 36000.0},
+        "results": {"TauxP": 143.47721134904953, "Capital acquis": "4,304,316.34", "Capital décès garanti": "6,000,000"},
+    },
+    "Emprunteur": {
+        "product": "Emprunteur",
+        "title": "Emprunteur - Récapitulatif",
+        "inputs": {"Année de naissance": 1980, "Âge": 46, "Durée (mois)": 240, "Capital emprunté": 5000000.0},
+        "results": {"TauxPrime": 0.13046469, "Prime unique": "652,323.46"},
+    },
+}
+
+
+def measure(fn, recap, n):
+    fn(recap)  # échauffement (gabarits, polices)
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn(recap)
+    per_call = (time.perf_counter() - t0) / n
+    tracemalloc.start()
+    fn(recap)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return per_call, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", type=int, default=2000, help="rendus par produit et par méthode")
+    args = parser.parse_args(argv)
+
+    print(f"{'produit':<16} {'référence':>12} {'gabarit':>12} {'gain':>6} {'pic réf.':>10} {'pic gab.':>10}")
+    for product, recap in RECAPS.items():
+        t_ref, m_ref = measure(pdf_recap.generate_pdf_bytes_fpdf, recap, args.n)
+        t_tpl, m_tpl = measure(pdf_recap.generate_pdf_bytes, recap, args.n)
+        print(f"{product:<16} {t_ref * 1e6:>10.1f}us {t_tpl * 1e6:>10.1f}us {t_ref / t_tpl:>5.1f}x "
+              f"{m_ref / 1024:>8.0f}KB {m_tpl / 1024:>8.0f}KB")
+
+
+if __name__ == "__main__":
+    main()
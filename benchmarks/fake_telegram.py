@@ -0,0 +1,96 @@
+# benchmarks/fake_telegram.py
+# Couche réseau factice pour faire tourner l'Application sans Telegram :
+# FakeRequest répond localement aux appels de l'API Bot, make_update / make_callback_update
+# fabriquent des updates.
+import json
+import asyncio
+import itertools
+
+from telegram import Update
+from telegram.request import BaseRequest
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "SunuVie", "username": "sunuvie_bot"}
+
+
+class FakeRequest(BaseRequest):
+    """Répond aux méthodes de l'API Bot utilisées par le bot (getMe, sendMessage, sendDocument...)
+    et compte les appels par méthode."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = {}
+        self._message_ids = itertools.count(1)
+
+    @property
+    def read_timeout(self):
+        return 5.0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        api = url.rsplit("/", 1)[-1]
+        self.calls[api] = self.calls.get(api, 0) + 1
+        params = request_data.parameters if request_data is not None else {}
+        if api == "getMe":
+            result = BOT_USER
+        elif api in ("deleteWebhook", "setWebhook", "answerCallbackQuery", "answerInlineQuery", "setMyCommands"):
+            result = True
+        else:
+            chat_id = int(params.get("chat_id", 0) or 0)
+            result = {
+                "message_id": next(self._message_ids),
+                "date": 0,
+                "chat": {"id": chat_id, "type": "private"},
+                "from": BOT_USER,
+            }
+            if "text" in params:
+                result["text"] = params["text"]
+            if api == "sendDocument":
+                n = result["message_id"]
+                result["document"] = {"file_id": f"FAKE-{n}", "file_unique_id": f"U{n}", "file_name": "recap.pdf"}
+        return 200, json.dumps({"ok": True, "result": result}).encode("utf-8")
+
+
+_update_ids = itertools.count(1)
+
+
+def make_update(bot, user_id: int, text: str, first_name: str = "Agent") -> Update:
+    """Update de message privé ; les textes commençant par '/' portent l'entité bot_command."""
+    message = {
+        "message_id": next(_update_ids),
+        "date": 0,
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": first_name},
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return Update.de_json({"update_id": message["message_id"], "message": message}, bot)
+
+
+def make_callback_update(bot, user_id: int, data: str, first_name: str = "Agent") -> Update:
+    """Update d'appui sur un bouton inline (callback_data `data`) d'un message du bot."""
+    update_id = next(_update_ids)
+    user = {"id": user_id, "is_bot": False, "first_name": first_name}
+    query = {
+        "id": str(update_id),
+        "from": user,
+        "chat_instance": str(user_id),
+        "data": data,
+        # date 0 : message inaccessible pour PTB (ni modifiable ni lisible)
+        "message": {
+            "message_id": update_id,
+            "date": 1,
+            "chat": {"id": user_id, "type": "private"},
+            "from": BOT_USER,
+            "text": "...",
+        },
+    }
+    return Update.de_json({"update_id": update_id, "callback_query": query}, bot)
@@ -0,0 +1,207 @@
+# benchmarks/load_harness.py
+# Charge hors ligne : N utilisateurs simulés déroulent des parcours complets contre
+# l'Application construite par main.build_application, avec une couche réseau factice.
+#   python benchmarks/load_harness.py [--users 1000] [--concurrency 8] [--latency-ms 0] [--trace-memory]
+#                                     [--buttons | --commands]
+#
+# Chaque utilisateur envoie le message suivant quand le précédent est traité (comme un agent
+# qui attend la réponse). Latence mesurée : traitement d'une update par l'Application
+# (handler compris) et bout en bout (file d'attente comprise).
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import resource
+import tempfile
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# configuration hors ligne, avant l'import de main
+_TMP = tempfile.mkdtemp(prefix="sunuvie_load_")
+os.environ.setdefault("TARIF_WATCH_INTERVAL", "0")
+os.environ.setdefault("PERSISTENCE_BACKEND", "memory")
+os.environ.setdefault("PDF_FILE_IDS_DB", os.path.join(_TMP, "file_ids.sqlite3"))
+os.environ.setdefault("PDF_CACHE_DIR", "")
+os.environ.setdefault("IDLE_TIMEOUT_MINUTES", "0")
+# débit brut du bot : pas de limitation anti-flood des envois (OUTBOUND_*_RATE pour la simuler)
+os.environ.setdefault("OUTBOUND_GLOBAL_RATE", "0")
+os.environ.setdefault("OUTBOUND_CHAT_RATE", "0")
+
+import logging  # noqa: E402
+
+logging.disable(logging.WARNING)
+
+from telegram.ext import Application  # noqa: E402
+
+import main as bot  # noqa: E402
+from update_processor import ChatOrderedUpdateProcessor  # noqa: E402
+from flows import CALLBACK_SEP  # noqa: E402
+from fake_telegram import FakeRequest, make_update, make_callback_update  # noqa: E402
+
+# parcours complets (depuis le menu)
+SCENARIOS = {
+    "assur": ["/start", "1", "1", "1985", "10", "3", "50000", "Oui"],
+    "ibekelia": ["/start", "2", "1980", "M", "2", "Non"],
+    "fer": ["/start", "3", "C", "10", "Non"],
+    "emprunteur": ["/start", "4", "1980", "240", "5000000", "Non"],
+}
+
+# mêmes parcours, choix fixes par boutons inline (--buttons) : ("état", "valeur") = appui
+BUTTON_SCENARIOS = {
+    "assur": ["/start", "1", (bot.TYPCOT, "1"), "1985", "10", "3", "50000", (bot.ASK_PDF, "oui")],
+    "ibekelia": ["/start", "2", "1980", (bot.PERIODE_I, "M"), (bot.CAPOBSQ_I, "2"), (bot.ASK_PDF, "non")],
+    "fer": ["/start", "3", (bot.FER_CHOIX, "C"), "10", (bot.ASK_PDF, "non")],
+    "emprunteur": ["/start", "4", "1980", "240", "5000000", (bot.ASK_PDF, "non")],
+}
+
+# commandes en une ligne (--commands)
+COMMAND_SCENARIOS = {
+    "assur": ["/assur P 1985 10 3 50000", "Oui"],
+    "ibekelia": ["/ibekelia 1980 M 2", "Non"],
+    "fer": ["/fer C 10", "Non"],
+    "emprunteur": ["/emp 1980 240 5000000", "Non"],
+}
+
+
+class TimedProcessor(ChatOrderedUpdateProcessor):
+    """Mesure la durée de traitement de chaque update et signale sa fin au simulateur."""
+
+    __slots__ = ("durations", "waiters")
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self.durations = []
+        self.waiters = {}
+
+    async def do_process_update(self, update, coroutine):
+        try:
+            await super().do_process_update(update, coroutine)
+        finally:
+            fut = self.waiters.pop(update.update_id, None)
+            if fut is not None and not fut.done():
+                fut.set_result(None)
+
+    async def _run(self, coroutine):
+        t0 = time.perf_counter()
+        try:
+            await super()._run(coroutine)
+        finally:
+            self.durations.append(time.perf_counter() - t0)
+
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(q / 100.0 * (len(values) - 1)))))
+    return values[k]
+
+
+async def simulate_user(app, processor, user_id, script, e2e, think):
+    loop = asyncio.get_running_loop()
+    for text in script:
+        if isinstance(text, tuple):
+            update = make_callback_update(app.bot, user_id, f"{text[0]}{CALLBACK_SEP}{text[1]}")
+        else:
+            update = make_update(app.bot, user_id, text)
+        fut = loop.create_future()
+        processor.waiters[update.update_id] = fut
+        t0 = time.perf_counter()
+        await app.update_queue.put(update)
+        await fut
+        e2e.append(time.perf_counter() - t0)
+        if think:
+            await asyncio.sleep(think * random.random())
+
+
+async def run(users: int, concurrency: int, latency: float, think: float, mix, scenarios=SCENARIOS):
+    request = FakeRequest(latency=latency)
+    processor = TimedProcessor(concurrency)
+    app = bot.build_application(
+        "123456:OFFLINE",
+        Application.builder().request(request).updater(None),
+        persistence=bot.make_persistence(),
+        update_processor=processor,
+    )
+    await app.initialize()
+    await app.start()
+
+    e2e = []
+    rng = random.Random(42)
+    scripts = [scenarios[rng.choice(mix)] for _ in range(users)]
+    t0 = time.perf_counter()
+    await asyncio.gather(*(
+        simulate_user(app, processor, 10_000 + i, script, e2e, think) for i, script in enumerate(scripts)
+    ))
+    wall = time.perf_counter() - t0
+    live_users = len(app.user_data)
+    # mémoire avec les conversations encore en place (avant l'arrêt de l'Application)
+    traced = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else None
+
+    await app.stop()
+    await app.shutdown()
+    return {
+        "wall": wall,
+        "updates": len(processor.durations),
+        "handler": processor.durations,
+        "e2e": e2e,
+        "calls": dict(request.calls),
+        "live_users": live_users,
+        "traced": traced,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Charge hors ligne du bot (parcours synthétiques).")
+    parser.add_argument("--users", type=int, default=1000, help="utilisateurs simulés")
+    parser.add_argument("--concurrency", type=int, default=bot.CONCURRENT_UPDATES,
+                        help="updates traitées en parallèle (BOT_CONCURRENT_UPDATES)")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="latence simulée de l'API Bot")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="temps de réflexion max entre deux messages")
+    parser.add_argument("--mix", default=",".join(SCENARIOS), help="parcours tirés au hasard, ex. assur,fer")
+    style = parser.add_mutually_exclusive_group()
+    style.add_argument("--buttons", action="store_true", help="choix fixes par boutons inline plutôt qu'au clavier")
+    style.add_argument("--commands", action="store_true", help="cotations par commande en une ligne (/fer C 10)")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="mémoire allouée par tracemalloc (ralentit nettement la mesure)")
+    args = parser.parse_args(argv)
+    mix = [m.strip() for m in args.mix.split(",") if m.strip()]
+
+    bot.load_tables()
+    bot.warm_templates()
+    if args.trace_memory:
+        tracemalloc.start()
+    rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    scenarios = BUTTON_SCENARIOS if args.buttons else COMMAND_SCENARIOS if args.commands else SCENARIOS
+    res = asyncio.run(run(args.users, args.concurrency, args.latency_ms / 1000, args.think_ms / 1000, mix, scenarios))
+    rss1 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    per_k = 1000.0 / max(1, args.users)
+    print(f"utilisateurs        : {args.users} ({', '.join(mix)}), concurrence {args.concurrency}")
+    print(f"updates traitées    : {res['updates']} en {res['wall']:.2f}s "
+          f"-> {res['updates'] / res['wall']:.0f} updates/s, {args.users / res['wall']:.0f} parcours/s")
+    for label, values in (("handler", res["handler"]), ("bout en bout", res["e2e"])):
+        print(f"latence {label:<12}: p50 {percentile(values, 50) * 1e3:.2f}ms  "
+              f"p95 {percentile(values, 95) * 1e3:.2f}ms  p99 {percentile(values, 99) * 1e3:.2f}ms")
+    print(f"appels API          : {res['calls']}")
+    sent = sum(n for method, n in res["calls"].items() if method.startswith("send"))
+    print(f"envois par parcours : {sent / max(1, args.users):.2f} (sendMessage + sendDocument)")
+    edits = sum(n for method, n in res["calls"].items() if method.startswith("edit"))
+    if edits:
+        print(f"modifs par parcours : {edits / max(1, args.users):.2f} (messages des boutons appuyés)")
+    print(f"RSS max             : +{(rss1 - rss0) / 1024 * per_k:.1f} Mo pour 1 000 utilisateurs "
+          f"(user_data vivants en fin de run : {res['live_users']})")
+    if res["traced"] is not None:
+        current, peak = res["traced"]
+        tracemalloc.stop()
+        print(f"tracemalloc         : {current / 1024 * per_k:.0f} Ko résidents, pic {peak / 1024 * per_k:.0f} Ko "
+              f"pour 1 000 utilisateurs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+# benchmarks/microbench.py
+# Micro-benchmarks sur les classeurs livrés : import des modules, normalisation des tables,
+# recherches unitaires et vectorisées, calcul des devis, requêtes inline, rendu PDF.
+#   python benchmarks/microbench.py                 # mesure et compare à baseline.json
+#   python benchmarks/microbench.py --save          # enregistre la mesure comme référence
+#   python benchmarks/microbench.py -k lookup --threshold 0.3
+#
+# Code de sortie 1 si une métrique suivie se dégrade de plus de `threshold` (25 % par défaut)
+# par rapport à la référence. Les temps sont par opération (minimum sur plusieurs répétitions)
+# et sont ramenés à la vitesse de la machine de référence par une boucle d'étalonnage.
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import datetime
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+os.environ.setdefault("TARIF_WATCH_INTERVAL", "0")
+
+BASELINE = os.path.join(HERE, "baseline.json")
+DEFAULT_THRESHOLD = float(os.getenv("BENCH_THRESHOLD", "0.25"))
+
+
+def per_op(fn, n_ops: int = 1, repeat: int = 7, min_time: float = 0.05):
+    """Temps par opération : `fn()` exécute `n_ops` opérations ; minimum sur `repeat` séries."""
+    fn()
+    loops = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_time or loops >= 1 << 20:
+            break
+        loops *= 2
+    best = elapsed
+    for _ in range(repeat - 1):
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        best = min(best, time.perf_counter() - t0)
+    return best / (loops * n_ops)
+
+
+def calibrate() -> float:
+    """Durée d'une charge Python fixe (dicts, flottants, chaînes) : sert à corriger
+    l'écart de vitesse entre la machine de référence et la machine courante."""
+    def work():
+        d = {}
+        acc = 0.0
+        for i in range(2000):
+            d[str(i)] = i * 1.5
+            acc += d[str(i)] / (i + 1)
+        return acc
+
+    return per_op(work, repeat=9)
+
+
+def import_time(module: str, repeat: int = 3) -> float:
+    """Durée d'import dans un interpréteur neuf (démarrage de Python déduit)."""
+    def run(code):
+        best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            best = min(best, time.perf_counter() - t0)
+        return best
+
+    return max(0.0, run(f"import {module}") - run("pass"))
+
+
+# -------------------------
+# Jeux de données
+# -------------------------
+def sample_inputs(tables, n: int = 1000, seed: int = 7):
+    rng = random.Random(seed)
+    lo, hi = tables.taux_ages
+    plo, phi = tables.prime_ages
+    emp_ages = sorted(tables.emp_ages)
+    emp_durees = sorted(tables.emp_durees)
+    durees = sorted(tables.taux_durees)
+    choix = sorted(tables.fer_choix_valides - {"H"})
+    return {
+        "taux": [(rng.randint(lo, hi), rng.randint(1, 7), rng.choice(durees)) for _ in range(n)],
+        "prime": [(rng.randint(plo, phi), rng.choice("MAU"), rng.choice((1, 2, 3, 4, 5)) * 1000000) for _ in range(n)],
+        "emp": [(rng.choice(emp_ages), rng.choice(emp_durees)) for _ in range(n)],
+        "fer": [rng.randint(1, 47) for _ in range(n)],
+        "fer_choix": [(rng.choice(choix), rng.randint(1, 47)) for _ in range(n)],
+    }
+
+
+def bench_tables(results, selected):
+    import tarifs
+
+    if selected("tables.parse_workbooks"):
+        results["tables.parse_workbooks"] = per_op(lambda: tarifs.parse_workbooks(tarifs.BASE_DIR), repeat=3, min_time=0)
+    frames = tarifs.load_tables()
+    if selected("tables.load_cache"):
+        results["tables.load_cache"] = per_op(lambda: tarifs.load_tables(), repeat=5)
+    if selected("tables.build"):
+        results["tables.build"] = per_op(lambda: tarifs.TarifTables(frames), repeat=5)
+    return tarifs.TarifTables(frames)
+
+
+def bench_lookups(results, selected, tables, data):
+    n = len(data["taux"])
+    cases = {
+        "lookup.taux": lambda: [tables.taux(a, nb, d) for a, nb, d in data["taux"]],
+        "lookup.prime": lambda: [tables.prime(a, p, c) for a, p, c in data["prime"]],
+        "lookup.emp": lambda: [tables.emp(a, d) for a, d in data["emp"]],
+        "lookup.fer": lambda: [tables.fer(d) for d in data["fer"]],
+    }
+    for name, fn in cases.items():
+        if selected(name):
+            results[name] = per_op(fn, n)
+
+
+def bench_quotes(results, selected, tables, data):
+    import quotation
+
+    n = len(data["taux"])
+    cases = {
+        "quote.assur": lambda: [quotation.quote_assur(tables, 1, a, d, nb, 50000.0) for a, nb, d in data["taux"]],
+        "quote.ibekelia": lambda: [quotation.quote_ibekelia(tables, a, p, c) for a, p, c in data["prime"]],
+        "quote.fer": lambda: [quotation.quote_fer(tables, c, d) for c, d in data["fer_choix"]],
+        "quote.fer_h": lambda: [quotation.quote_fer(tables, "H", d, 150000.0) for d in data["fer"]],
+        "quote.emprunteur": lambda: [quotation.quote_emprunteur(tables, a, d, 5000000.0) for a, d in data["emp"]],
+    }
+    for name, fn in cases.items():
+        if selected(name):
+            results[name] = per_op(fn, n)
+
+    # calculs vectorisés (par ligne, sur 10 000 demandes)
+    import numpy as np
+
+    m = 10000
+    rep = m // n
+    age, nb, duree = (np.array(col * rep) for col in zip(*data["taux"]))
+    p_age, per, cap = (np.array(col * rep) for col in zip(*data["prime"]))
+    e_age, e_duree = (np.array(col * rep) for col in zip(*data["emp"]))
+    choix, f_duree = (np.array(col * rep) for col in zip(*data["fer_choix"]))
+    bulk = {
+        "bulk.assur": lambda: quotation.batch_assur(tables, np.ones(m, dtype=int), age, duree, nb, np.full(m, 50000.0)),
+        "bulk.ibekelia": lambda: quotation.batch_ibekelia(tables, p_age, per, cap),
+        "bulk.fer": lambda: quotation.batch_fer(tables, choix, f_duree),
+        "bulk.emprunteur": lambda: quotation.batch_emprunteur(tables, e_age, e_duree, np.full(m, 5000000.0)),
+    }
+    for name, fn in bulk.items():
+        if selected(name):
+            results[name] = per_op(fn, m)
+
+
+def bench_devis(results, selected, data):
+    """Devis complets du bot (calcul + textes + récapitulatif), tels que servis par les parcours."""
+    if not any(selected(f"devis.{p}") for p in ("assur", "ibekelia", "fer", "fer_h", "emprunteur")):
+        return
+    import main as bot
+
+    tables = bot.load_tables()
+    n = len(data["taux"])
+    cases = {
+        "devis.assur": lambda: [bot.devis_assur({"typCot": 2, "age": a, "dureeCot": d, "nbRente": nb, "montant": 20000.0}, tables)
+                                for a, nb, d in data["taux"]],
+        "devis.ibekelia": lambda: [bot.devis_ibekelia({"age": a, "perCot": p, "capObsq": c}, tables) for a, p, c in data["prime"]],
+        "devis.fer": lambda: [bot.devis_fer({"fer_choix": c, "fer_duree": d, "fer_tauxP": tables.fer(d)}, tables)
+                              for c, d in data["fer_choix"]],
+        "devis.fer_h": lambda: [bot.devis_fer({"fer_choix": "H", "fer_duree": d, "fer_tauxP": tables.fer(d), "fer_montant": 150000.0}, tables)
+                                for d in data["fer"]],
+        "devis.emprunteur": lambda: [bot.devis_emprunteur({"age": a, "dureePret": d, "capPret": 5000000.0}, tables)
+                                     for a, d in data["emp"]],
+    }
+    for name, fn in cases.items():
+        if selected(name):
+            results[name] = per_op(fn, n)
+
+
+def bench_inline(results, selected):
+    """Réponse à une requête inline : calculée (grammaire, contrôles, devis, résultats) ou mémorisée."""
+    if not (selected("inline.computed") or selected("inline.memo")):
+        return
+    import main as bot
+    from inline import InlineQuoter
+
+    bot.load_tables()
+    queries = ["fer C 10", "emp 1980 240 3000000", "assur p 1985 10 3 50000", "ibekelia 1985 m 2"]
+    if selected("inline.computed"):
+        # mémoire de taille nulle : chaque requête est recalculée
+        quoter = InlineQuoter(bot.FLOWS, bot.INLINE_QUOTES.aliases, memo_size=0)
+        results["inline.computed"] = per_op(lambda: [quoter.results(q) for q in queries], len(queries))
+    if selected("inline.memo"):
+        quoter = InlineQuoter(bot.FLOWS, bot.INLINE_QUOTES.aliases)
+        results["inline.memo"] = per_op(lambda: [quoter.results(q) for q in queries], len(queries))
+
+
+def bench_pdf(results, selected):
+    import pdf_recap
+    from bench_pdf import RECAPS
+
+    pdf_recap.warm_templates()
+    for product, recap in RECAPS.items():
+        key = "pdf." + product.lower().replace("'", "").replace("+", "_plus")
+        if selected(key):
+            results[key] = per_op(lambda: pdf_recap.generate_pdf_bytes(recap))
+    if selected("pdf.reference"):
+        recap = RECAPS["Assur'Education"]
+        results["pdf.reference"] = per_op(lambda: pdf_recap.generate_pdf_bytes_fpdf(recap), repeat=3)
+
+
+def run_all(selected) -> dict:
+    results = {}
+    for module in ("tarifs", "quotation", "pdf_recap", "main"):
+        name = f"import.{module}"
+        if selected(name):
+            results[name] = import_time(module)
+    tables = bench_tables(results, selected)
+    data = sample_inputs(tables)
+    bench_lookups(results, selected, tables, data)
+    bench_quotes(results, selected, tables, data)
+    bench_devis(results, selected, data)
+    bench_inline(results, selected)
+    bench_pdf(results, selected)
+    return results
+
+
+# -------------------------
+# Référence et comparaison
+# -------------------------
+def load_baseline(path: str):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(path: str, results: dict, calibration: float):
+    payload = {
+        "meta": {
+            "calibration": calibration,
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def _fmt(seconds: float) -> str:
+    if seconds >= 1:
+        return f"{seconds:.2f}s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f}ms"
+    if seconds >= 1e-6:
+        return f"{seconds * 1e6:.2f}us"
+    return f"{seconds * 1e9:.0f}ns"
+
+
+def compare(results: dict, baseline: dict, threshold: float, calibration: float):
+    """Affiche le tableau de comparaison ; renvoie la liste des métriques dégradées."""
+    base = (baseline or {}).get("results", {})
+    base_cal = (baseline or {}).get("meta", {}).get("calibration")
+    # > 1 : la machine courante est plus lente que celle de la référence
+    speed = calibration / base_cal if base_cal else 1.0
+    regressions = []
+    print(f"étalonnage : {_fmt(calibration)} (facteur machine {speed:.2f})")
+    print(f"{'métrique':<26} {'mesure':>10} {'référence':>10} {'écart':>8}")
+    for name in sorted(results):
+        value = results[name]
+        ref = base.get(name)
+        if ref:
+            delta = value / (ref * speed) - 1
+            flag = ""
+            if delta > threshold:
+                flag = "  <-- régression"
+                regressions.append(name)
+            print(f"{name:<26} {_fmt(value):>10} {_fmt(ref):>10} {delta:>+7.0%}{flag}")
+        else:
+            print(f"{name:<26} {_fmt(value):>10} {'-':>10} {'':>8}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks (tables, recherches, devis, PDF).")
+    parser.add_argument("-k", dest="pattern", default="", help="ne mesurer que les métriques contenant ce texte")
+    parser.add_argument("--baseline", default=BASELINE, help="fichier JSON de référence")
+    parser.add_argument("--save", action="store_true", help="enregistrer la mesure comme nouvelle référence")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="dégradation tolérée (0.25 = +25 %%) avant échec")
+    args = parser.parse_args(argv)
+
+    selected = (lambda name: args.pattern in name) if args.pattern else (lambda name: True)
+    calibration = calibrate()
+    results = run_all(selected)
+    # second étalonnage : on garde le plus rapide des deux (moins sensible aux à-coups)
+    calibration = min(calibration, calibrate())
+    regressions = compare(results, load_baseline(args.baseline), args.threshold, calibration)
+
+    if args.save:
+        if args.pattern:
+            # mise à jour partielle : les autres métriques de la référence sont conservées
+            merged = dict((load_baseline(args.baseline) or {}).get("results", {}))
+            merged.update(results)
+            results = merged
+        save_baseline(args.baseline, results, calibration)
+        print(f"Référence enregistrée : {args.baseline}")
+        return 0
+    if regressions:
+        print(f"{len(regressions)} régression(s) au-delà de {args.threshold:.0%} : {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+# compose.py
+# Composition des réponses : les textes envoyés pendant un même tour de handler sont mis
+# en attente puis regroupés en un seul sendMessage à la fin du tour (ex. résultat de
+# cotation + question PDF, message d'erreur + menu). Le clavier retenu est celui du dernier
+# texte, qui aurait de toute façon remplacé les précédents côté client.
+#
+# Quand le tour répond à un appui sur un bouton inline, le premier texte du tour remplace le
+# message portant le bouton (editMessageText, clavier compris) si son clavier le permet,
+# sans appel supplémentaire. Sinon le message reste tel quel : un nouvel appui sur ses
+# boutons est traité par flows.expired_choice.
+import functools
+import contextvars
+
+from telegram import InlineKeyboardMarkup
+from telegram.error import BadRequest
+
+import outbound
+
+# limite Telegram d'un message texte
+MAX_TEXT = 4096
+SEPARATOR = "\n\n"
+
+_outbox = contextvars.ContextVar("outbox", default=None)
+
+
+class Outbox:
+    """Textes en attente pour le message auquel le handler répond."""
+
+    __slots__ = ("message", "parts", "tapped")
+
+    def __init__(self, message, tapped: bool = False):
+        self.message = message
+        # [texte, clavier, priorité outbound]
+        self.parts = []
+        # `message` porte le bouton qui vient d'être appuyé, pas encore modifié
+        self.tapped = tapped
+
+    def add(self, text: str, reply_markup, priority: int):
+        if self.parts:
+            last = self.parts[-1]
+            # un clavier inline reste attaché à son propre message
+            if not isinstance(last[1], InlineKeyboardMarkup) and len(last[0]) + len(SEPARATOR) + len(text) <= MAX_TEXT:
+                last[0] += SEPARATOR + text
+                if reply_markup is not None:
+                    last[1] = reply_markup
+                last[2] = min(last[2], priority)
+                return
+        self.parts.append([text, reply_markup, priority])
+
+    async def flush(self):
+        """Envoie les textes en attente ; le premier remplace le message du bouton appuyé si possible."""
+        parts, self.parts = self.parts, []
+        for text, reply_markup, priority in parts:
+            tapped, self.tapped = self.tapped, False
+            with outbound.lane(priority):
+                # editMessageText n'accepte qu'un clavier inline (ou aucun)
+                if tapped and (reply_markup is None or isinstance(reply_markup, InlineKeyboardMarkup)):
+                    if await _edit_text(self.message, text, reply_markup):
+                        continue
+                await self.message.reply_text(text, reply_markup=reply_markup)
+
+
+async def _edit_text(message, text: str, reply_markup) -> bool:
+    try:
+        await message.edit_text(text, reply_markup=reply_markup)
+    except BadRequest:
+        # message trop ancien, supprimé ou identique : nouveau message à la place
+        return False
+    return True
+
+
+async def remove_keyboard(message):
+    """Retire le clavier inline d'un message du bot (sans effet s'il n'en a plus)."""
+    try:
+        await message.edit_reply_markup(reply_markup=None)
+    except BadRequest:
+        pass
+
+
+async def reply_text(update, text: str, reply_markup=None):
+    """update.message.reply_text, regroupé avec les autres textes du tour s'il est composé."""
+    box = _outbox.get()
+    if box is None:
+        return await update.effective_message.reply_text(text, reply_markup=reply_markup)
+    box.add(text, reply_markup, outbound.current_lane())
+
+
+async def reply_document(update, document, **kwargs):
+    """Document envoyé tout de suite, après les textes déjà en attente (ordre conservé)."""
+    box = _outbox.get()
+    if box is not None:
+        await box.flush()
+        # textes suivants : après le document, jamais à la place du message du bouton
+        box.tapped = False
+    return await update.effective_message.reply_document(document=document, **kwargs)
+
+
+def composed(callback):
+    """Handler dont les reply_text sont regroupés et envoyés à la fin du tour."""
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        message = update.effective_message
+        if message is None or _outbox.get() is not None:
+            return await callback(update, context)
+        query = update.callback_query
+        box = Outbox(message, tapped=query is not None and query.message is not None and query.message.is_accessible)
+        token = _outbox.set(box)
+        try:
+            return await callback(update, context)
+        finally:
+            _outbox.reset(token)
+            await box.flush()
+
+    return wrapper
+
+
+def compose_conversation(conv_handler):
+    """Applique `composed` à tous les callbacks d'un ConversationHandler déjà construit."""
+    handlers = list(conv_handler.entry_points) + list(conv_handler.fallbacks)
+    for state_handlers in conv_handler.states.values():
+        handlers.extend(state_handlers)
+    for handler in handlers:
+        handler.callback = composed(handler.callback)
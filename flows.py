@@ -0,0 +1,378 @@
+# flows.py
+# Moteur de parcours déclaratif : chaque produit est une suite d'étapes typées
+# (année, entier borné, choix, montant) suivie d'une fonction de calcul.
+# Le moteur construit les états du ConversationHandler et valide toutes les saisies
+# par un seul chemin : parse -> dérivés -> contrôles -> stockage -> étape suivante ou calcul.
+# Les étapes à choix fixe proposent aussi un clavier inline (callback_data "état|valeur").
+# Commande en une ligne (/fer C 12) : une saisie par étape, validées par le même chemin.
+import re
+import datetime
+import logging
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardRemove
+from telegram.ext import CallbackQueryHandler, MessageHandler, filters
+
+import logs
+import outbound
+from compose import reply_text, remove_keyboard
+
+logger = logging.getLogger(__name__)
+
+# action en cas de contrôle refusé
+STAY = "stay"   # redemander la même saisie
+MENU = "menu"   # message puis retour au menu
+
+# séparateur état / valeur dans callback_data (64 octets au plus côté Telegram)
+CALLBACK_SEP = "|"
+
+
+# -------------------------
+# Parseurs (lèvent ValueError si la saisie est invalide)
+# -------------------------
+def parse_year(text: str) -> int:
+    year = int(text)
+    if year < 1900 or year > datetime.datetime.now().year:
+        raise ValueError(text)
+    return year
+
+
+def age_from_year(year: int) -> int:
+    return datetime.datetime.now().year - year
+
+
+def parse_amount(text: str) -> float:
+    """Montant décimal, virgule acceptée comme séparateur décimal (12000,5)."""
+    return float(text.replace(",", "."))
+
+
+def parse_amount_grouped(text: str) -> float:
+    """Montant avec virgules de milliers ignorées (5,000,000)."""
+    return float(text.replace(",", ""))
+
+
+def parse_choice(options, upper: bool = False):
+    """Parseur de choix : `options` est un conteneur de réponses admises,
+    ou un dict réponse -> valeur stockée."""
+    mapping = options if isinstance(options, dict) else None
+
+    def parse(text):
+        key = text.upper() if upper else text
+        if key not in options:
+            raise ValueError(text)
+        return mapping[key] if mapping is not None else key
+
+    return parse
+
+
+def in_range(lo, hi, message: str):
+    """Contrôle de bornes inclusives ; `message` peut utiliser {value}."""
+    def check(value, data, tables):
+        if not (lo <= value <= hi):
+            return message.format(value=value)
+        return None
+
+    return check
+
+
+# -------------------------
+# Claviers inline
+# -------------------------
+def choice_keyboard(state, rows) -> InlineKeyboardMarkup:
+    """`rows` : [[(libellé, valeur), ...], ...] ; la valeur est la saisie texte équivalente."""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(label, callback_data=f"{state}{CALLBACK_SEP}{value}") for label, value in row]
+        for row in rows
+    ])
+
+
+def choice_pattern(state) -> str:
+    """Filtre CallbackQueryHandler des boutons de l'état `state` (boutons périmés exclus)."""
+    return "^" + re.escape(f"{state}{CALLBACK_SEP}")
+
+
+async def answer_choice(update) -> str:
+    """Acquitte le bouton (fin du sablier côté client) et renvoie sa valeur."""
+    query = update.callback_query
+    await query.answer()
+    return query.data.partition(CALLBACK_SEP)[2]
+
+
+async def expired_choice(update, context):
+    """Bouton d'un message antérieur à l'état courant de la conversation : acquitté, et le
+    clavier périmé retiré pour qu'il ne serve plus."""
+    query = update.callback_query
+    await query.answer("Ce choix n'est plus disponible.")
+    if query.message is not None and query.message.is_accessible:
+        await remove_keyboard(query.message)
+
+
+# -------------------------
+# Description des parcours
+# -------------------------
+class Step:
+    """Une saisie du parcours.
+
+    state   : état du ConversationHandler associé
+    key     : clé de context.user_data où ranger la valeur
+    prompt  : question posée pour entrer dans l'étape (str ou fonction(data) -> str)
+    parse   : texte -> valeur (ValueError => message `invalid`, on reste sur l'étape)
+    derive  : fonction(value, data, tables) -> dict de valeurs dérivées (ex. âge)
+    checks  : [(fonction(value, data, tables) -> message d'erreur ou None, STAY|MENU)]
+              `data` contient déjà la valeur et ses dérivés
+    when    : fonction(data) -> bool ; étape sautée si False
+    buttons : [[(libellé, valeur), ...], ...] ; clavier inline joint à la question
+    """
+
+    __slots__ = ("state", "key", "prompt", "parse", "invalid", "derive", "checks", "when", "upper", "keyboard")
+
+    def __init__(self, state, key, prompt, parse, invalid, derive=None, checks=(), when=None, upper=False,
+                 buttons=None):
+        self.state = state
+        self.key = key
+        self.prompt = prompt
+        self.parse = parse
+        self.invalid = invalid
+        self.derive = derive
+        self.checks = tuple(checks)
+        self.when = when
+        self.upper = upper
+        self.keyboard = choice_keyboard(state, buttons) if buttons else None
+
+
+def year_step(state, prompt, ages, out_of_grid: str, action=STAY, invalid=None):
+    """Étape année de naissance : stocke ddNaiss et age ; `ages(tables)` renvoie
+    (min, max) ou l'ensemble des âges tarifés ; `out_of_grid` peut utiliser {age}, {min}, {max}."""
+    def check(value, data, tables):
+        grid = ages(tables)
+        age = data["age"]
+        if isinstance(grid, tuple):
+            lo, hi = grid
+            if age < lo or age > hi:
+                return out_of_grid.format(age=age, min=lo, max=hi)
+        elif age not in grid:
+            return out_of_grid.format(age=age)
+        return None
+
+    return Step(
+        state, "ddNaiss", prompt, parse_year,
+        invalid or "Année invalide. Entrez l'année de naissance au format AAAA (ex: 1985).",
+        derive=lambda value, data, tables: {"age": age_from_year(value)},
+        checks=[(check, action)],
+    )
+
+
+class Quote:
+    """Résultat d'un calcul : texte de réponse, récapitulatif PDF, clavier éventuel."""
+
+    __slots__ = ("text", "recap", "reply_markup")
+
+    def __init__(self, text: str, recap: dict, reply_markup=None):
+        self.text = text
+        self.recap = recap
+        self.reply_markup = reply_markup
+
+
+class Product:
+    """Un parcours : message d'accueil, étapes, calcul final.
+
+    compute(data, tables) -> Quote, ou None si aucun tarif (message `no_quote`, retour au menu).
+    usage : syntaxe de la commande en une ligne (ex. "/fer A..H durée") ; None la désactive.
+    """
+
+    __slots__ = ("name", "intro", "steps", "compute", "no_quote", "usage", "grammar")
+
+    def __init__(self, name: str, intro: str, steps, compute, no_quote: str, usage: str = None):
+        self.name = name
+        self.intro = intro
+        self.steps = tuple(steps)
+        self.compute = compute
+        self.no_quote = no_quote
+        self.usage = usage
+        self.grammar = self._compile_grammar()
+
+    def _compile_grammar(self):
+        # un jeton par étape, dans l'ordre ; jeton facultatif pour les étapes conditionnelles
+        parts = []
+        for i, step in enumerate(self.steps):
+            token = (r"\s+" if i else "") + rf"(?P<{step.key}>\S+)"
+            parts.append(f"(?:{token})?" if step.when is not None else token)
+        return re.compile(r"^\s*" + "".join(parts) + r"\s*$")
+
+    def read_command(self, text: str, tables):
+        """Arguments de la commande en une ligne -> (valeurs de toutes les étapes, None)
+        ou (None, message d'erreur). Sans effet de bord."""
+        match = self.grammar.match(text)
+        if match is None:
+            return None, None
+        data = {}
+        for step in self.steps:
+            token = match.group(step.key)
+            if step.when is not None and not step.when(data):
+                if token is not None:
+                    return None, None
+                continue
+            if token is None:
+                return None, None
+            values, error = self.validate(step, token, data, tables)
+            if error is not None:
+                return None, error[0]
+            data.update(values)
+        return data, None
+
+    def next_step(self, index: int, data):
+        """Première étape applicable après la position `index` (None : tout est saisi)."""
+        for step in self.steps[index + 1:]:
+            if step.when is None or step.when(data):
+                return step
+        return None
+
+    def validate(self, step, text: str, data, tables):
+        """Valide une saisie sans effet de bord.
+        Renvoie (valeurs à stocker, None) ou (None, (message, STAY|MENU))."""
+        try:
+            value = step.parse(text.upper() if step.upper else text)
+        except (ValueError, TypeError):
+            return None, (step.invalid, STAY)
+        values = {step.key: value}
+        if step.derive is not None:
+            values.update(step.derive(value, data, tables))
+        if step.checks:
+            candidate = {**data, **values}
+            for check, action in step.checks:
+                message = check(value, candidate, tables)
+                if message:
+                    return None, (message, action)
+        return values, None
+
+
+# -------------------------
+# Moteur
+# -------------------------
+class FlowEngine:
+    """Construit les états du ConversationHandler à partir des produits.
+
+    tables       : fonction sans argument renvoyant les tables tarifaires courantes
+    back_to_menu : coroutine(update, context) -> état (retour au menu)
+    on_quote     : coroutine(update, context) -> état, appelée après l'envoi du résultat
+    """
+
+    def __init__(self, products, tables, back_to_menu, on_quote):
+        self.products = {p.name: p for p in products}
+        self.tables = tables
+        self.back_to_menu = back_to_menu
+        self.on_quote = on_quote
+        # état -> (produit, position de l'étape, étape)
+        self._by_state = {}
+        for product in products:
+            for index, step in enumerate(product.steps):
+                if step.state in self._by_state:
+                    raise ValueError(f"État {step.state} utilisé par deux étapes.")
+                self._by_state[step.state] = (product, index, step)
+
+    def states(self) -> dict:
+        """États pour ConversationHandler(states=...) : saisie texte, plus les boutons
+        des étapes à choix fixe."""
+        states = {}
+        for state, (_, _, step) in self._by_state.items():
+            handlers = [MessageHandler(filters.TEXT & ~filters.COMMAND, self._handler(state))]
+            if step.keyboard is not None:
+                handlers.append(CallbackQueryHandler(self._button_handler(state), pattern=choice_pattern(state)))
+            states[state] = handlers
+        return states
+
+    def products_by_state(self) -> dict:
+        """État -> nom du produit (labels des métriques)."""
+        return {state: product.name for state, (product, _, _) in self._by_state.items()}
+
+    def _handler(self, state):
+        async def handle(update, context):
+            return await self.handle(update, context, state)
+
+        product, _, step = self._by_state[state]
+        handle.__name__ = f"flow_{product.name}_{step.key}"
+        return handle
+
+    def _button_handler(self, state):
+        async def handle(update, context):
+            # valeur déjà canonique : ni nettoyage du texte ni détour par /menu
+            return await self.accept(update, context, state, await answer_choice(update))
+
+        product, _, step = self._by_state[state]
+        handle.__name__ = f"flow_{product.name}_{step.key}_button"
+        return handle
+
+    def entry(self, name: str):
+        """Coroutine de démarrage d'un parcours (commande ou choix au menu)."""
+        product = self.products[name]
+        first = product.steps[0]
+
+        async def start(update, context):
+            args = getattr(context, "args", None)
+            if args and product.usage is not None:
+                return await self.one_shot(update, context, product, " ".join(args))
+            # seul message du parcours qui retire le clavier du menu (sauf si l'étape a des boutons)
+            await reply_text(update, product.intro, reply_markup=first.keyboard or ReplyKeyboardRemove())
+            return first.state
+
+        start.__name__ = f"start_{name}"
+        return start
+
+    async def one_shot(self, update, context, product, text: str):
+        """Commande en une ligne : calcul direct, ou erreur sans changer d'état."""
+        tables = self.tables()
+        data, error = product.read_command(text, tables)
+        if data is None:
+            await reply_text(update, f"{error}\n\nFormat : {product.usage}" if error else f"Format : {product.usage}")
+            return None
+        context.user_data.clear()
+        context.user_data.update(data)
+        return await self.finish(update, context, product, tables)
+
+    async def handle(self, update, context, state):
+        text = update.message.text.strip()
+        if text == "/menu":
+            return await self.back_to_menu(update, context)
+        return await self.accept(update, context, state, text)
+
+    async def accept(self, update, context, state, text: str):
+        """Saisie (texte ou valeur de bouton) pour l'étape `state`."""
+        product, index, step = self._by_state[state]
+        data = context.user_data
+        tables = self.tables()
+
+        values, error = product.validate(step, text, data, tables)
+        if error is not None:
+            message, action = error
+            if action == MENU:
+                await reply_text(update, message)
+                return await self.back_to_menu(update, context)
+            # les boutons sont reproposés avec le message d'erreur
+            await reply_text(update, message, reply_markup=step.keyboard)
+            return state
+        data.update(values)
+
+        nxt = product.next_step(index, data)
+        if nxt is not None:
+            prompt = nxt.prompt(data) if callable(nxt.prompt) else nxt.prompt
+            # pas de ReplyKeyboardRemove ici (l'accueil s'en charge) : après un appui sur un
+            # bouton, la question suivante peut ainsi remplacer le message du bouton (cf. compose)
+            await reply_text(update, prompt, reply_markup=nxt.keyboard)
+            return nxt.state
+        return await self.finish(update, context, product, tables)
+
+    async def finish(self, update, context, product, tables):
+        quote = product.compute(context.user_data, tables)
+        if quote is None:
+            # case absente des grilles : message limité/échantillonné par logs.SamplingFilter
+            logger.warning(
+                "Aucun tarif pour la saisie",
+                extra={"product": product.name, "user": logs.user_hash(update.effective_user.id),
+                       "inputs": {step.key: context.user_data.get(step.key) for step in product.steps}},
+            )
+            await reply_text(update, product.no_quote)
+            return await self.back_to_menu(update, context)
+        # résultat de cotation : prioritaire sur les menus et relances (cf. outbound)
+        with outbound.lane(outbound.HIGH):
+            await reply_text(update, quote.text, reply_markup=quote.reply_markup)
+        context.user_data["last_recap"] = quote.recap
+        return await self.on_quote(update, context)
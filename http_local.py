@@ -0,0 +1,133 @@
+# http_local.py
+# Petit serveur HTTP/1.1 asyncio (sans dépendance) pour le webhook et les endpoints locaux.
+import asyncio
+import logging
+from http import HTTPStatus
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY = 1024 * 1024
+MAX_HEADER_LINES = 100
+
+
+class Request:
+    __slots__ = ("method", "path", "query", "headers", "body")
+
+    def __init__(self, method: str, target: str, headers: dict, body: bytes):
+        self.method = method
+        self.path, _, self.query = target.partition("?")
+        self.headers = headers
+        self.body = body
+
+
+async def _readline(reader, status):
+    """Ligne de la requête ; au-delà de la limite du StreamReader (64 Kio), erreur `status`."""
+    try:
+        return await reader.readline()
+    except (ValueError, asyncio.LimitOverrunError):
+        raise _HttpError(status)
+
+
+class HttpServer:
+    """Serveur HTTP minimal : `routes` associe (méthode, chemin) à une coroutine
+    `handler(request) -> (status, headers: dict, body: bytes)`.
+    Connexions persistantes (keep-alive) gérées ; corps limité à MAX_BODY octets.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8080, routes: dict = None):
+        self.host = host
+        self.port = port
+        self.routes = dict(routes or {})
+        self._server = None
+
+    def route(self, method: str, path: str, handler):
+        self.routes[(method.upper(), path)] = handler
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        sock = self._server.sockets[0].getsockname()
+        # port 0 : port libre choisi par le système
+        self.port = sock[1]
+        logger.info("Serveur HTTP local en écoute sur %s:%s", sock[0], sock[1])
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _read_request(self, reader):
+        line = await _readline(reader, HTTPStatus.REQUEST_URI_TOO_LONG)
+        if not line:
+            return None
+        try:
+            method, target, _version = line.decode("latin-1").split()
+        except ValueError:
+            raise _HttpError(HTTPStatus.BAD_REQUEST)
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            raw = await _readline(reader, HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+            if raw in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = raw.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        else:
+            raise _HttpError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            raise _HttpError(HTTPStatus.BAD_REQUEST)
+        if length < 0:
+            raise _HttpError(HTTPStatus.BAD_REQUEST)
+        if length > MAX_BODY:
+            raise _HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        body = await reader.readexactly(length) if length else b""
+        return Request(method.upper(), target, headers, body)
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except _HttpError as e:
+                    await self._respond(writer, e.status, {}, b"", close=True)
+                    break
+                if request is None:
+                    break
+                handler = self.routes.get((request.method, request.path))
+                if handler is None:
+                    status, headers, body = HTTPStatus.NOT_FOUND, {}, b""
+                else:
+                    try:
+                        status, headers, body = await handler(request)
+                    except Exception:
+                        logger.exception("Erreur dans le handler HTTP %s %s", request.method, request.path)
+                        status, headers, body = HTTPStatus.INTERNAL_SERVER_ERROR, {}, b""
+                close = request.headers.get("connection", "").lower() == "close"
+                await self._respond(writer, status, headers, body, close)
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    @staticmethod
+    async def _respond(writer, status, headers: dict, body: bytes, close: bool):
+        status = HTTPStatus(status)
+        lines = [f"HTTP/1.1 {status.value} {status.phrase}", f"Content-Length: {len(body)}"]
+        lines += [f"{k}: {v}" for k, v in headers.items()]
+        if close:
+            lines.append("Connection: close")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+
+class _HttpError(Exception):
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
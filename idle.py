@@ -0,0 +1,107 @@
+# idle.py
+# Expiration des conversations inactives (parcours abandonnés en cours de saisie).
+# Pas de JobQueue (APScheduler) : une tâche de balayage périodique termine les
+# conversations sans activité depuis `timeout` secondes et libère le user_data associé.
+import time
+import asyncio
+import logging
+
+from telegram import Update
+from telegram.ext import ConversationHandler, TypeHandler
+
+import logs
+import metrics
+import outbound
+
+logger = logging.getLogger(__name__)
+
+NOTICE_TEXT = "Session expirée après {minutes} min d'inactivité. Tapez /start pour recommencer une cotation."
+
+
+class IdleSweeper:
+    """Suit la dernière activité de chaque conversation (clé (chat_id, user_id))
+    et termine celles restées inactives plus de `timeout` secondes.
+
+    `state_names` : {valeur d'état: nom} pour la jauge conversations_live{state}.
+    `notice` : prévenir l'utilisateur (sauf s'il était simplement au menu, état `quiet_states`).
+    """
+
+    def __init__(self, conv_handler: ConversationHandler, timeout: float, state_names: dict,
+                 notice: bool = True, quiet_states=(), interval: float = None):
+        self.conv_handler = conv_handler
+        self.timeout = timeout
+        self.state_names = state_names
+        self.notice = notice
+        self.quiet_states = frozenset(quiet_states)
+        self.interval = interval or max(1.0, min(60.0, timeout / 4))
+        self._last_seen = {}
+        for value, name in state_names.items():
+            metrics.gauge("conversations_live", fn=self._counter(value), state=name)
+        metrics.gauge("conversations_tracked", fn=lambda: len(self._last_seen))
+
+    def _counter(self, value):
+        return lambda: sum(1 for s in self.conv_handler._conversations.values() if s == value)
+
+    def live_by_state(self) -> dict:
+        """Nombre de conversations en cours par nom d'état."""
+        counts = {}
+        for state in self.conv_handler._conversations.values():
+            name = self.state_names.get(state, str(state))
+            counts[name] = counts.get(name, 0) + 1
+        return counts
+
+    async def touch(self, update: Update, context):
+        chat, user = update.effective_chat, update.effective_user
+        if chat is not None and user is not None:
+            self._last_seen[(chat.id, user.id)] = time.monotonic()
+
+    def install(self, application):
+        # groupe -1 : vu avant le ConversationHandler, sans l'empêcher de traiter l'update
+        application.add_handler(TypeHandler(Update, self.touch), group=-1)
+
+    async def sweep(self, application, now: float = None):
+        """Termine les conversations inactives ; renvoie leurs clés."""
+        now = time.monotonic() if now is None else now
+        limit = now - self.timeout
+        conversations = self.conv_handler._conversations
+        expired = []
+        for key, state in list(conversations.items()):
+            seen = self._last_seen.get(key)
+            if seen is None:
+                # conversation restaurée par la persistance : le délai part du premier balayage
+                self._last_seen[key] = now
+            elif seen < limit:
+                expired.append((key, state))
+        # clés dont la conversation est déjà terminée (retour au menu, /cancel...)
+        for key in [k for k in self._last_seen if k not in conversations]:
+            del self._last_seen[key]
+
+        for key, _ in expired:
+            # API interne de PTB : même chemin que la fin normale d'une conversation (persistance comprise)
+            self.conv_handler._update_state(ConversationHandler.END, key)
+            self._last_seen.pop(key, None)
+        # user_data est par utilisateur : conservé tant qu'il a une conversation en cours ailleurs
+        live_users = {user_id for _, user_id in conversations}
+        for key, state in expired:
+            chat_id, user_id = key
+            if user_id not in live_users:
+                application.drop_user_data(user_id)
+            metrics.counter("conversations_expired_total", state=self.state_names.get(state, str(state))).inc()
+            if self.notice and state not in self.quiet_states:
+                try:
+                    # avis non urgent : derrière les réponses aux utilisateurs actifs
+                    with outbound.lane(outbound.LOW):
+                        await application.bot.send_message(chat_id, NOTICE_TEXT.format(minutes=round(self.timeout / 60)))
+                except Exception as e:
+                    logger.info("Avis d'expiration non envoyé à %s : %s", logs.user_hash(chat_id), e)
+        if expired:
+            logger.info("%d conversation(s) inactive(s) expirée(s).", len(expired))
+        return [key for key, _ in expired]
+
+    async def run(self, application):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sweep(application)
+            except Exception:
+                logger.exception("Erreur pendant le balayage des conversations inactives")
@@ -0,0 +1,143 @@
+# inline.py
+# Cotations en mode inline ("@bot fer C 10" depuis n'importe quelle discussion) : même
+# grammaire et mêmes contrôles que les commandes en une ligne (Product.read_command), même
+# calcul que les parcours (Product.compute).
+#
+# Telegram envoie une requête par frappe : les requêtes d'un utilisateur sont regroupées
+# (seule la dernière d'une rafale de `debounce` secondes est répondue), les listes de
+# résultats sont mémorisées (LRU par requête normalisée, vidée quand les tables changent)
+# et `cache_time` laisse Telegram resservir la même requête sans nous solliciter.
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+
+from telegram import InlineQueryResultArticle, InputTextMessageContent
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class InlineQuoter:
+    """Handler d'InlineQueryHandler.
+
+    flows    : FlowEngine (produits et tables courantes)
+    aliases  : {premier mot de la requête: nom du produit}, ex. {"emp": "emprunteur"}
+    timer    : enveloppe de la réponse envoyée (ex. instrument.timed_callback), chronométrée
+               après la rafale, sans le délai de regroupement
+    """
+
+    def __init__(self, flows, aliases: dict, memo_size: int = 1024, debounce: float = 0.3, cache_time: int = 60,
+                 timer=None):
+        self.flows = flows
+        self.aliases = {word.lower(): name for word, name in aliases.items()}
+        self.memo_size = memo_size
+        self.debounce = debounce
+        self.cache_time = cache_time
+        self._memo = OrderedDict()
+        self._memo_tables = None
+        self._reply = timer(self.reply) if timer is not None else self.reply
+        # utilisateur -> tâche de réponse encore en attente de la fin de rafale
+        self._pending = {}
+        # toutes les tâches de réponse en cours : la boucle ne garde qu'une référence faible
+        self._tasks = set()
+        self._hits = metrics.counter("inline_queries_total", outcome="memo")
+        self._misses = metrics.counter("inline_queries_total", outcome="computed")
+        self._superseded = metrics.counter("inline_queries_total", outcome="superseded")
+        metrics.gauge("inline_memo_entries", fn=lambda: len(self._memo))
+
+    # -------------------------
+    # Résultats
+    # -------------------------
+    def results(self, query: str) -> list:
+        """Liste de résultats pour le texte de la requête (mémorisée)."""
+        key = " ".join(query.lower().split())
+        tables = self.flows.tables()
+        if tables is not self._memo_tables:
+            self._memo.clear()
+            self._memo_tables = tables
+        results = self._memo.get(key)
+        if results is not None:
+            self._memo.move_to_end(key)
+            self._hits.inc()
+            return results
+        self._misses.inc()
+        results = self._compute(key, tables)
+        self._memo[key] = results
+        if len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+        return results
+
+    def _compute(self, key: str, tables) -> list:
+        word, _, args = key.partition(" ")
+        name = self.aliases.get(word)
+        if name is None:
+            # requête vide ou produit inconnu : syntaxe de chaque produit
+            return [self._help(product) for product in self.flows.products.values() if product.usage]
+        product = self.flows.products[name]
+        data, error = product.read_command(args, tables) if args else (None, None)
+        if data is None:
+            return [self._help(product, error)]
+        quote = product.compute(data, tables)
+        if quote is None:
+            return [self._help(product, product.no_quote)]
+        title = quote.recap.get("product", product.name)
+        return [InlineQueryResultArticle(
+            id=_result_id(product.name, key),
+            title=title,
+            description=quote.text,
+            input_message_content=InputTextMessageContent(quote.text),
+        )]
+
+    @staticmethod
+    def _help(product, error: str = None):
+        # syntaxe des commandes en une ligne, sans la barre oblique
+        usage = product.usage.replace("/", "")
+        return InlineQueryResultArticle(
+            id=_result_id("aide", product.name),
+            title=error.splitlines()[0] if error else f"Format : {usage}",
+            description=usage,
+            input_message_content=InputTextMessageContent(f"Cotation rapide en mode inline : {usage}"),
+        )
+
+    # -------------------------
+    # Handler
+    # -------------------------
+    async def handle(self, update, context):
+        """Répond à la dernière requête de chaque rafale ; les précédentes restent sans réponse
+        (le client Telegram les a déjà abandonnées)."""
+        query = update.inline_query
+        user_id = query.from_user.id
+        pending = self._pending.get(user_id)
+        if pending is not None and not pending.done():
+            pending.cancel()
+            self._superseded.inc()
+        task = asyncio.get_running_loop().create_task(self._answer(update, context, user_id))
+        self._pending[user_id] = task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _answer(self, update, context, user_id):
+        try:
+            if self.debounce > 0:
+                await asyncio.sleep(self.debounce)
+        finally:
+            # au-delà de ce point la réponse part, même si une nouvelle frappe arrive
+            if self._pending.get(user_id) is asyncio.current_task():
+                del self._pending[user_id]
+        await self._reply(update, context)
+
+    async def reply(self, update, context):
+        """Calcule et envoie la liste de résultats de la requête."""
+        query = update.inline_query
+        try:
+            await query.answer(self.results(query.query), cache_time=self.cache_time)
+        except Exception as e:
+            # requête expirée (plus de 10 s) ou réseau : l'utilisateur a de toute façon continué
+            logger.warning("Réponse inline impossible : %s", e)
+
+
+def _result_id(*parts) -> str:
+    # identifiant de résultat : 64 octets au plus
+    return hashlib.blake2b("|".join(parts).encode(), digest_size=16).hexdigest()
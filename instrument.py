@@ -0,0 +1,161 @@
+# instrument.py
+# Instrumentation du chemin critique : latence et erreurs de chaque handler de conversation
+# (par handler, état et produit), durée des appels sortants à l'API Bot (par méthode),
+# et endpoint local /metrics au format Prometheus.
+#
+# Le temps passé à attendre Telegram pendant un handler est décompté à part :
+# handler_seconds (total) - handler_self_seconds (calcul, tables, PDF...) = attente API.
+import asyncio
+import logging
+import functools
+import contextvars
+import random
+import time
+from http import HTTPStatus
+
+from telegram.ext import ApplicationHandlerStop, BaseRateLimiter
+
+import logs
+import metrics
+from http_local import HttpServer
+
+logger = logging.getLogger(__name__)
+
+# les handlers sans appel réseau tournent en quelques centaines de microsecondes
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005) + metrics.DEFAULT_BUCKETS
+
+# au-delà, l'update est toujours journalisée (WARNING) ; sinon une sur 1/logs.SAMPLE_RATE (INFO)
+SLOW_HANDLER_SECONDS = 2.0
+
+# temps cumulé des appels API du handler en cours ([secondes]) ; None hors handler instrumenté
+_api_time = contextvars.ContextVar("api_time", default=None)
+
+
+# -------------------------
+# Handlers
+# -------------------------
+def timed_callback(callback, **labels):
+    """Enveloppe une coroutine de handler ; les métriques sont résolues une fois ici, pas à chaque appel."""
+    total = metrics.histogram("handler_seconds", buckets=LATENCY_BUCKETS, **labels)
+    own = metrics.histogram("handler_self_seconds", buckets=LATENCY_BUCKETS, **labels)
+    errors = metrics.counter("handler_errors_total", **labels)
+    fields = {"handler": labels.get("handler"), "state": labels.get("state"), "product": labels.get("product")}
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        api = [0.0]
+        token = _api_time.set(api)
+        t0 = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except ApplicationHandlerStop:
+            raise
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - t0
+            _api_time.reset(token)
+            total.observe(elapsed)
+            own.observe(max(0.0, elapsed - api[0]))
+            if elapsed >= SLOW_HANDLER_SECONDS or random.random() < logs.SAMPLE_RATE:
+                _log_update(update, fields, elapsed, api[0])
+
+    return wrapper
+
+
+def _log_update(update, fields, elapsed, api):
+    user = getattr(update, "effective_user", None)
+    event = dict(
+        fields,
+        user=logs.user_hash(user.id) if user is not None else None,
+        duration_ms=round(elapsed * 1e3, 3),
+        api_ms=round(api * 1e3, 3),
+    )
+    if elapsed >= SLOW_HANDLER_SECONDS:
+        logger.warning("Update lente", extra=event)
+    else:
+        event["sample_rate"] = logs.SAMPLE_RATE
+        logger.info("Update traitée", extra=event)
+
+
+def instrument_conversation(conv_handler, state_names: dict, state_products: dict = None):
+    """Instrumente les callbacks d'un ConversationHandler déjà construit.
+
+    Labels : handler (nom de la coroutine), state (nom lisible, "entry" ou "fallback"),
+    product (`state_products[état]`, "-" sinon).
+    """
+    state_products = state_products or {}
+
+    def wrap(handlers, state, product):
+        for handler in handlers:
+            handler.callback = timed_callback(
+                handler.callback, handler=handler.callback.__name__, state=state, product=product
+            )
+
+    wrap(conv_handler.entry_points, "entry", "-")
+    for state, handlers in conv_handler.states.items():
+        wrap(handlers, state_names.get(state, str(state)), state_products.get(state, "-"))
+    wrap(conv_handler.fallbacks, "fallback", "-")
+
+
+# -------------------------
+# Appels sortants à l'API Bot
+# -------------------------
+class ApiTimer(BaseRateLimiter):
+    """Crochet autour de chaque requête à l'API Bot (getUpdates exclu par PTB) :
+    durée et erreurs par méthode, sans limitation de débit."""
+
+    __slots__ = ("_series",)
+
+    def __init__(self):
+        self._series = {}
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _metrics(self, endpoint: str):
+        series = self._series.get(endpoint)
+        if series is None:
+            series = self._series[endpoint] = (
+                metrics.histogram("telegram_api_seconds", method=endpoint),
+                metrics.counter("telegram_api_errors_total", method=endpoint),
+            )
+        return series
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        hist, errors = self._metrics(endpoint)
+        t0 = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - t0
+            hist.observe(elapsed)
+            api = _api_time.get()
+            if api is not None:
+                api[0] += elapsed
+
+
+# -------------------------
+# Endpoint /metrics
+# -------------------------
+async def _metrics_endpoint(request):
+    body = metrics.render_prometheus().encode("utf-8")
+    return HTTPStatus.OK, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}, body
+
+
+async def serve_metrics(host: str = "127.0.0.1", port: int = 9108):
+    """Sert GET /metrics jusqu'à l'annulation de la tâche (rendu uniquement à la lecture)."""
+    server = HttpServer(host, port)
+    server.route("GET", "/metrics", _metrics_endpoint)
+    await server.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
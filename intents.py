@@ -0,0 +1,100 @@
+# intents.py
+# Routage des choix du menu : table construite une fois (alias normalisés -> cible),
+# une recherche dans un dict pour le cas courant, repli approximatif par trigrammes
+# pour les fautes de frappe ("ibekalia", "emprunter", "selction medicale").
+import unicodedata
+
+import metrics
+
+# score de Dice minimal (trigrammes communs) pour accepter une correspondance approximative
+FUZZY_MIN_SCORE = 0.5
+# écart minimal avec la meilleure cible concurrente, sinon la saisie est jugée ambiguë
+FUZZY_MARGIN = 0.1
+
+
+def fold(text: str) -> str:
+    """Minuscules, sans accents, apostrophes typographiques unifiées, espaces réduits."""
+    text = unicodedata.normalize("NFKD", text.strip().lower().replace("’", "'"))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.split())
+
+
+def trigrams(text: str):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class IntentRouter:
+    """`aliases` : {cible: [saisies admises]} pour le texte libre et les boutons ;
+    `commands` : {cible: [commandes sans '/']} pour les saisies commençant par '/'.
+    Les cibles sont des objets quelconques (ici les coroutines de démarrage des parcours).
+    """
+
+    def __init__(self, aliases: dict, commands: dict = None):
+        self._exact = {}
+        # saisies telles que tapées (minuscules) : évite la normalisation Unicode dans le cas courant
+        self._raw = {}
+        for target, words in aliases.items():
+            for word in words:
+                self._exact[fold(word)] = target
+                self._raw[word.strip().lower()] = target
+        self._commands = {}
+        for target, words in (commands or {}).items():
+            for word in words:
+                self._commands[fold(word)] = target
+
+        # index inversé trigramme -> alias (les numéros de menu n'y figurent pas)
+        self._fuzzy_keys = [key for key in self._exact if not key.isdigit()]
+        self._fuzzy_sizes = []
+        self._index = {}
+        for i, key in enumerate(self._fuzzy_keys):
+            grams = trigrams(key)
+            self._fuzzy_sizes.append(len(grams))
+            for gram in grams:
+                self._index.setdefault(gram, []).append(i)
+
+    def route(self, text: str):
+        """Cible correspondant à la saisie, ou None."""
+        text = text.strip()
+        if text.startswith("/"):
+            target = self._commands.get(fold(text[1:]))
+            if target is not None:
+                metrics.counter("menu_intents_total", match="command").inc()
+                return target
+        target = self._raw.get(text.lower())
+        if target is not None:
+            metrics.counter("menu_intents_total", match="exact").inc()
+            return target
+        key = fold(text)
+        target = self._exact.get(key)
+        if target is not None:
+            metrics.counter("menu_intents_total", match="exact").inc()
+            return target
+        target = self.fuzzy(key)
+        metrics.counter("menu_intents_total", match="fuzzy" if target is not None else "none").inc()
+        return target
+
+    def fuzzy(self, key: str):
+        """Meilleure cible par similarité de trigrammes (Dice), si elle est nette."""
+        if len(key) < 3:
+            return None
+        grams = trigrams(key)
+        shared = {}
+        for gram in grams:
+            for i in self._index.get(gram, ()):
+                shared[i] = shared.get(i, 0) + 1
+        best = {}
+        for i, n in shared.items():
+            score = 2.0 * n / (len(grams) + self._fuzzy_sizes[i])
+            target = self._exact[self._fuzzy_keys[i]]
+            if score > best.get(target, 0.0):
+                best[target] = score
+        if not best:
+            return None
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)
+        target, score = ranked[0]
+        if score < FUZZY_MIN_SCORE:
+            return None
+        if len(ranked) > 1 and score - ranked[1][1] < FUZZY_MARGIN:
+            return None
+        return target
@@ -0,0 +1,152 @@
+# logs.py
+# Journalisation structurée et asynchrone : les handlers asyncio ne font que déposer
+# l'enregistrement dans une file ; un thread de fond le met en forme (JSON par défaut)
+# et l'écrit. Les messages répétitifs sont limités par site d'appel puis échantillonnés.
+#
+# Variables d'environnement :
+#   LOG_LEVEL        INFO (défaut), DEBUG, WARNING...
+#   LOG_FORMAT       json (défaut) ou text
+#   LOG_BURST        messages identiques acceptés par période (défaut 10)
+#   LOG_PERIOD       période de limitation en secondes (défaut 60)
+#   LOG_SAMPLE_EVERY au-delà de la rafale, 1 message identique sur N est gardé (défaut 100)
+#   LOG_SAMPLE_RATE  part des updates journalisées avec leur durée (défaut 0.01, cf. instrument)
+#   LOG_USER_SALT    clé du hachage des identifiants Telegram
+import os
+import sys
+import json
+import copy
+import queue
+import atexit
+import hashlib
+import logging
+import datetime
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+_USER_SALT = os.getenv("LOG_USER_SALT", "").encode()
+
+# attributs standard d'un LogRecord : tout le reste vient de `extra=` et part dans le JSON
+_RECORD_ATTRS = frozenset(logging.makeLogRecord({}).__dict__) | {"message", "asctime"}
+
+
+def user_hash(user_id) -> str:
+    """Identifiant Telegram haché (les journaux ne contiennent pas d'identifiant en clair)."""
+    return hashlib.blake2b(str(user_id).encode(), key=_USER_SALT, digest_size=6).hexdigest()
+
+
+# -------------------------
+# Mise en forme
+# -------------------------
+class JsonFormatter(logging.Formatter):
+    """Un objet JSON par ligne : ts, level, logger, msg, champs `extra` (product, state,
+    user, duration_ms...), exc si une exception est attachée."""
+
+    def format(self, record):
+        event = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                event[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            event["exc"] = record.exc_text
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(QueueHandler):
+    """Fige message et trace au moment de l'appel ; la mise en forme (JSON ou texte) se fait
+    dans le thread d'écriture, pas dans la boucle asyncio."""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+# -------------------------
+# Limitation et échantillonnage
+# -------------------------
+class SamplingFilter(logging.Filter):
+    """Par site d'appel (logger + gabarit du message) : `burst` messages par `period` secondes,
+    puis 1 sur `sample_every`. Le premier message gardé après des suppressions porte le
+    champ `suppressed` (nombre de messages écartés). Les niveaux >= `always_level` (erreurs et
+    traces d'exception par défaut) passent toujours."""
+
+    MAX_KEYS = 1000
+
+    def __init__(self, burst: int = 10, period: float = 60.0, sample_every: int = 100, always_level=logging.ERROR):
+        super().__init__()
+        self.burst = burst
+        self.period = period
+        self.sample_every = max(1, sample_every)
+        self.always_level = always_level
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= self.always_level:
+            return True
+        key = (record.name, record.msg if isinstance(record.msg, str) else type(record.msg))
+        now = record.created
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.period:
+                if len(self._windows) >= self.MAX_KEYS:
+                    self._windows.clear()
+                # [début de fenêtre, messages vus, messages écartés non encore signalés]
+                window = self._windows[key] = [now, 0, window[2] if window is not None else 0]
+            window[1] += 1
+            seen = window[1]
+            if seen > self.burst and (seen - self.burst) % self.sample_every:
+                window[2] += 1
+                return False
+            suppressed, window[2] = window[2], 0
+        if suppressed:
+            record.suppressed = suppressed
+        if seen > self.burst:
+            record.sampled = f"1/{self.sample_every}"
+        return True
+
+
+# -------------------------
+# Installation
+# -------------------------
+def setup_logging(level: str = None, fmt: str = None):
+    """Remplace la configuration par défaut : file + thread d'écriture vers stderr.
+    Renvoie le QueueListener (arrêté, et donc vidé, à la sortie du processus)."""
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    fmt = (fmt or os.getenv("LOG_FORMAT", "json")).lower()
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+    listener = QueueListener(queue.SimpleQueue(), output, respect_handler_level=False)
+
+    handler = _QueueHandler(listener.queue)
+    handler.addFilter(SamplingFilter(
+        burst=int(os.getenv("LOG_BURST", "10")),
+        period=float(os.getenv("LOG_PERIOD", "60")),
+        sample_every=int(os.getenv("LOG_SAMPLE_EVERY", "100")),
+    ))
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level)
+    # une ligne par requête HTTP (getUpdates toutes les quelques secondes) : seulement les problèmes
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -1,27 +1,57 @@
 # bot_completed_with_emprunteur_v2_with_pdf.py
+import startup  # en premier : origine du profil de démarrage (python main.py --profile-startup)
 import os
+import sys
 import logging
-import pandas as pd
 import datetime
 import io
-from fpdf import FPDF
+import asyncio
+import functools
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+import tarifs
+import quotation
+import logs
+from webhook import run_webhook, check_exposure
+from update_processor import ChatOrderedUpdateProcessor
+from idle import IdleSweeper
+from instrument import instrument_conversation, serve_metrics, timed_callback
+from compose import reply_text, reply_document, compose_conversation
+import outbound
+from outbound import OutboundScheduler
+from intents import IntentRouter
+from inline import InlineQuoter
+from flows import (FlowEngine, Product, Step, Quote, STAY, MENU, year_step, in_range, parse_choice, parse_amount,
+                   parse_amount_grouped, choice_keyboard, choice_pattern, answer_choice, expired_choice)
+from persistence import CompactPersistence, SqliteStateStore, MemoryStateStore, evict_idle_loop
+from pdf_recap import generate_pdf_bytes, warm_templates, recap_digest, PdfCache, PdfRenderPool, PdfQueueFull, FileIdStore
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove, InputFile
+from telegram.error import BadRequest
+from telegram.warnings import PTBUserWarning
 from telegram.ext import (
     Application,
+    CallbackQueryHandler,
     CommandHandler,
+    InlineQueryHandler,
     MessageHandler,
     filters,
     ContextTypes,
     ConversationHandler,
 )
 
+# conversation suivie par chat et non par message : voulu, l'état visé par un bouton est
+# porté par son callback_data (cf. flows.choice_keyboard)
+warnings.filterwarnings("ignore", message="If 'per_message=False'", category=PTBUserWarning)
+
+# pandas (lecture des tables) et fpdf (PDF) ne sont importés qu'au préchargement ou au premier usage
+startup.mark("imports (python-telegram-bot, numpy, modules)")
+
 # -------------------------
 # Configuration / Logging
 # -------------------------
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO,
-)
+# configuration des logs faite par main() : importer ce module (tests, benchmarks, outils)
+# ne remplace pas les handlers du processus hôte
 logger = logging.getLogger(__name__)
 
 # -------------------------
@@ -52,85 +82,59 @@ logger = logging.getLogger(__name__)
 ) = range(17)
 
 # -------------------------
-# Charger les fichiers Excel (avec protections)
+# Tables tarifaires (cache binaire compilé, sinon fichiers Excel)
+# Chargées par le préchargement de main() pendant la connexion à Telegram,
+# ou au premier usage (outils hors ligne, benchmarks).
 # -------------------------
-try:
-    df_taux = pd.read_excel("T_taux_Etudes.xlsx", sheet_name="T_taux_Etudes")
-    df_prime = pd.read_excel("T_Prime_IBEKELIA.xlsx", sheet_name="T_Prime_IBEKELIA")
-    # FER+ sheets (doit exister)
-    df_fer_grille = pd.read_excel("table_taux_FER+.xlsx", sheet_name="grille_FER+")
-    df_fer_table = pd.read_excel("table_taux_FER+.xlsx", sheet_name="table_taux_FER+")
-    # EMPRUNTEUR rates
-    df_emp = pd.read_excel("tauxEmp.xlsx", sheet_name="tauxEmp")
-except Exception as e:
-    logger.exception("Erreur en lisant les fichiers Excel. Vérifie qu'ils sont présents et nommés correctement.")
-    raise SystemExit(e)
+TABLES = None
+
+
+def _install_tables(tables: tarifs.TarifTables):
+    """Installe un jeu de tables (démarrage ou rechargement à chaud par TarifRegistry)."""
+    global TABLES
+    # seule source de vérité : grilles denses et DataFrames (tables.frames) changent
+    # ensemble, en une seule affectation
+    TABLES = tables
+    # les PDF déjà envoyés ne sont plus valables avec d'autres tables
+    if FILE_IDS is not None:
+        FILE_IDS.set_tarif(tables.digest)
+
+
+# file_id Telegram des PDF déjà envoyés (cf. pdf_choice) ; ouvert par build_application,
+# pas à l'import (aucun fichier créé par un simple `import main`)
+FILE_IDS = None
+
+
+def open_file_ids():
+    """Ouvre la table des file_id PDF (une seule fois) et la purge des tables tarifaires périmées."""
+    global FILE_IDS
+    if FILE_IDS is None:
+        FILE_IDS = FileIdStore(os.getenv("PDF_FILE_IDS_DB", os.path.join(tarifs.BASE_DIR, ".cache_pdf", "file_ids.sqlite3")))
+        # tables déjà installées par le préchargement : leurs file_id seuls restent valables
+        if TABLES is not None:
+            FILE_IDS.set_tarif(TABLES.digest)
+    return FILE_IDS
+
+
+# intervalle de surveillance des classeurs (secondes) ; 0 désactive le rechargement à chaud
+TARIF_WATCH_INTERVAL = float(os.getenv("TARIF_WATCH_INTERVAL", "5"))
+REGISTRY = tarifs.TarifRegistry(interval=TARIF_WATCH_INTERVAL or 5.0, on_swap=_install_tables)
+_TABLES_LOCK = threading.Lock()
+
+
+def load_tables() -> tarifs.TarifTables:
+    """Charge les tables si aucune n'est encore installée. Lève TarifError."""
+    with _TABLES_LOCK:
+        if TABLES is None:
+            REGISTRY.load()
+    return TABLES
+
+
+def current_tables() -> tarifs.TarifTables:
+    """Tables en vigueur (chargées à la demande si le préchargement n'a pas eu lieu)."""
+    tables = TABLES
+    return tables if tables is not None else load_tables()
 
-# -------------------------
-# Normaliser : convertir en str les colonnes et nettoyer les index
-# -------------------------
-# Taux (Assur'Education)
-if "DureeCot-Nbrente" not in df_taux.columns:
-    raise SystemExit("La colonne 'DureeCot-Nbrente' n'existe pas dans T_taux_Etudes.xlsx.")
-df_taux["DureeCot-Nbrente"] = df_taux["DureeCot-Nbrente"].astype(str).str.strip()
-df_taux.set_index("DureeCot-Nbrente", inplace=True)
-df_taux.columns = df_taux.columns.astype(str)
-
-# Prime IBEKELIA
-if "T_Prime_IBEKELIA" not in df_prime.columns:
-    raise SystemExit("La colonne 'T_Prime_IBEKELIA' n'existe pas dans T_Prime_IBEKELIA.xlsx.")
-df_prime["T_Prime_IBEKELIA"] = df_prime["T_Prime_IBEKELIA"].astype(str).str.strip()
-df_prime.set_index("T_Prime_IBEKELIA", inplace=True)
-df_prime.columns = df_prime.columns.astype(str)
-
-# FER+ grille (A..G rows)
-required_fer_cols = {"choixCot", "cotMensEp", "cotMensPrev", "cotMensTot", "capDec"}
-if not required_fer_cols.issubset(set(df_fer_grille.columns)):
-    logger.error("La feuille 'grille_FER+' doit contenir les colonnes : %s", required_fer_cols)
-    raise SystemExit("grille_FER+ incorrecte")
-
-# normaliser et indexer grille FER+
-df_fer_grille["choixCot"] = df_fer_grille["choixCot"].astype(str).str.strip().str.upper()
-df_fer_grille.set_index("choixCot", inplace=True)
-# convertir colonnes numériques
-for c in ("cotMensEp", "cotMensPrev", "cotMensTot", "capDec"):
-    df_fer_grille[c] = pd.to_numeric(df_fer_grille[c], errors="coerce")
-
-# FER+ table taux : dureeCot -> tauxP
-if "dureeCot" not in df_fer_table.columns or "tauxP" not in df_fer_table.columns:
-    logger.error("La feuille 'table_taux_FER+' doit contenir 'dureeCot' et 'tauxP'")
-    raise SystemExit("table_taux_FER+ incorrecte")
-df_fer_table["dureeCot"] = pd.to_numeric(df_fer_table["dureeCot"], errors="coerce").astype(int)
-df_fer_table["tauxP"] = pd.to_numeric(df_fer_table["tauxP"], errors="coerce")
-df_fer_table.set_index("dureeCot", inplace=True)
-
-# EMPRUNTEUR : normaliser le tableau des taux
-if "age" not in df_emp.columns:
-    # si la colonne s'appelle différemment, tente de trouver la première colonne non-numérique
-    raise SystemExit("Le fichier tauxEmp.xlsx doit contenir une colonne 'age'.")
-# convertir l'index age
-df_emp = df_emp.copy()
-df_emp["age"] = df_emp["age"].astype(int)
-# Les colonnes restantes représentent la durée (en mois probablement). On les convertit en int.
-cols = [c for c in df_emp.columns if c != "age"]
-# certaines colonnes sont des nombres d'entiers (1..360)
-new_cols = {}
-for c in cols:
-    try:
-        new_c = int(c)
-        new_cols[c] = new_c
-    except Exception:
-        # tenter convertir en float puis int
-        try:
-            new_cols[c] = int(float(c))
-        except Exception:
-            # ignorer colonne
-            logger.warning("Colonne non reconnue dans tauxEmp: %s", c)
-            new_cols[c] = c
-# Renommer les colonnes
-df_emp.rename(columns=new_cols, inplace=True)
-# indexer par age
-df_emp.set_index("age", inplace=True)
 
 # -------------------------
 # Mapping capital obsèques (choix 1..5 -> montant)
@@ -142,76 +146,45 @@ CAP_OBSEQUES = {
     "4": 4000000,
     "5": 5000000
 }
+# libellés des boutons (1 000 000...)
+CAP_LABELS = {key: f"{value:,}".replace(",", " ") for key, value in CAP_OBSEQUES.items()}
 
 # -------------------------
 # Helpers pour validation / recherche
 # -------------------------
 def available_ages_taux():
-    ages = sorted({int(idx.split("-")[0]) for idx in df_taux.index})
-    return min(ages), max(ages)
+    return current_tables().taux_ages
 
 
 def available_ages_prime():
-    ages = sorted({int(idx.split("-")[0]) for idx in df_prime.index})
-    return min(ages), max(ages)
+    return current_tables().prime_ages
 
 
 def get_taux(age: int, nb_rente: int, duree: int):
-    key = f"{age}-{nb_rente}"
-    col = str(duree)
-    if key not in df_taux.index or col not in df_taux.columns:
-        return None
-    try:
-        return float(df_taux.loc[key, col])
-    except Exception:
-        logger.exception("Erreur get_taux")
-        return None
+    return current_tables().taux(age, nb_rente, duree)
 
 
 def get_prime(age: int, per_cot: str, cap_obsq: int):
-    key = f"{age}-{per_cot}"
-    col = str(cap_obsq)
-    if key not in df_prime.index or col not in df_prime.columns:
-        return None
-    try:
-        return float(df_prime.loc[key, col])
-    except Exception:
-        logger.exception("Erreur get_prime")
-        return None
+    return current_tables().prime(age, per_cot, cap_obsq)
 
 # FER+ helpers
 def get_fer_grille(choix: str):
+    grille = current_tables().frames["df_fer_grille"]
     choix = choix.strip().upper()
-    if choix not in df_fer_grille.index:
+    if choix not in grille.index:
         return None
-    return df_fer_grille.loc[choix]
+    return grille.loc[choix]
 
 
 def get_fer_taux(duree: int):
-    if duree not in df_fer_table.index:
-        return None
-    try:
-        return float(df_fer_table.loc[duree, "tauxP"])
-    except Exception:
-        logger.exception("Erreur get_fer_taux")
-        return None
+    return current_tables().fer(duree)
 
 # EMPRUNTEUR helper
 def get_emp_taux(age: int, duree_mois: int):
     """Retourne le taux (float) pour l'age et la durée en mois.
     Les colonnes du fichier tauxEmp.xlsx sont supposées être des entiers représentant des durées (1..360).
     """
-    if age not in df_emp.index:
-        return None
-    # si la colonne n'existe pas, retourner None
-    if duree_mois not in df_emp.columns:
-        return None
-    try:
-        val = df_emp.loc[age, duree_mois]
-        return float(val) if pd.notna(val) else None
-    except Exception:
-        logger.exception("Erreur get_emp_taux")
-        return None
+    return current_tables().emp(age, duree_mois)
 
 # -------------------------
 # UI: menu keyboard (command-style buttons pour éviter ambiguité avec saisies numériques)
@@ -228,11 +201,8 @@ MENU_KEYBOARD = ReplyKeyboardMarkup(
 # -------------------------
 # Helpers conversationnels
 # -------------------------
-async def back_to_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    # nettoyer le contexte pour éviter de réutiliser d'anciennes valeurs
-    context.user_data.clear()
-    user = update.effective_user
-    await update.message.reply_text(
+def menu_text(user) -> str:
+    return (
         f"Bonjour {user.first_name or ''} !\n\n"
         "Vous souhaitez faire une cotation de :\n"
         "1- Assur'Education\n"
@@ -242,17 +212,26 @@ async def back_to_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "5- Sélection Médical\n"
         "6- Autres produits\n\n"
         "Vous pouvez aussi utiliser les commandes rapides ci-dessous :\n"
-        "/assur  /ibekelia  /fer  /emprunteur  /selection  /autres\n\n"
-        "Répondez par 1, 2, 3, 4, 5 ou 6, ou tapez une commande.",
-        reply_markup=MENU_KEYBOARD,
+        "/assur  /ibekelia  /fer  /emprunteur  /selection  /autres\n"
+        "Cotation directe : /assur P 1985 10 3 50000, /ibekelia 1985 M 2, /fer C 12, /emp 1980 240 5000000\n\n"
+        "Répondez par 1, 2, 3, 4, 5 ou 6, ou tapez une commande."
     )
+
+
+async def back_to_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # nettoyer le contexte pour éviter de réutiliser d'anciennes valeurs
+    context.user_data.clear()
+    # le menu passe après les résultats de cotation des autres chats (cf. outbound)
+    with outbound.lane(outbound.LOW):
+        await reply_text(update, menu_text(update.effective_user), reply_markup=MENU_KEYBOARD)
     return PRODUIT
 
 # Entry-point et helpers de démarrage pour chaque parcours (pour pouvoir lancer un parcours n'importe quand)
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # message d'accueil principal
     user = update.effective_user
-    await update.message.reply_text(
+    await reply_text(
+        update,
         f"Bonjour {user.first_name or ''} !\n\n"
         "Vous souhaitez faire une cotation de :\n"
         "1- Assur'Education\n"
@@ -267,356 +246,124 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     return PRODUIT
 
-async def start_assur(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
-        "Parcours Assur'Education :\n\n"
-        "1- Prestation définie ?\n"
-        "2- Cotisation définie ?\n\n"
-        "Répondez 1 ou 2.",
-        reply_markup=ReplyKeyboardRemove(),
-    )
-    return TYPCOT
-
-async def start_ibekelia(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("Parcours IBEKELIA :\nEntrez votre année de naissance (AAAA) :", reply_markup=ReplyKeyboardRemove())
-    return DNAISS_I
-
-async def start_fer(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
-        "Parcours FER+ :\n\n"
-        "Choisissez votre capacité d'épargne (répondez A..H) :\n\n"
-        "Epargne - Décès - Capacité d'épargne total - Capital Déces\n\n"
-        "A - 10 000  - 2 000  - 12 000  - 2 000 000\n"
-        "B - 20 000  - 4 000  - 24 000  - 4 000 000\n"
-        "C - 30 000  - 6 000  - 36 000  - 6 000 000\n"
-        "D - 40 000  - 8 000  - 48 000  - 8 000 000\n"
-        "E - 60 000  - 12 000 - 72 000  - 12 000 000\n"
-        "F - 80 000  - 16 000 - 96 000  - 16 000 000\n"
-        "G - 100 000 - 20 000 - 120 000 - 20 000 000\n"
-        "H - Je peux cotiser plus de 120 000 par mois (saisie libre)",
-        reply_markup=ReplyKeyboardRemove(),
-    )
-    return FER_CHOIX
-
-async def start_emprunteur(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("Parcours EMPRUNTEUR :\nEntrez votre année de naissance (AAAA) :", reply_markup=ReplyKeyboardRemove())
-    return DNAISS_E
-
 async def start_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("Parcours SÉLECTION MÉDICAL :\nModule en cours de construction…", reply_markup=MENU_KEYBOARD)
+    await reply_text(update, "Parcours SÉLECTION MÉDICAL :\nModule en cours de construction…", reply_markup=MENU_KEYBOARD)
     return PRODUIT
 
 # -------------------------
 # Handlers
 # -------------------------
 async def choix_produit(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    choix = update.message.text.strip()
-    norm = choix.strip().lower()
-
-    # commandes directes (/assur, /fer, etc.)
-    if choix.startswith("/"):
-        cmd = choix.lstrip("/").lower()
-        if cmd in ("assur", "assureducation"):
-            return await start_assur(update, context)
-        if cmd == "ibekelia":
-            return await start_ibekelia(update, context)
-        if cmd == "fer":
-            return await start_fer(update, context)
-        if cmd == "emprunteur":
-            return await start_emprunteur(update, context)
-        if cmd == "selection":
-            return await start_selection(update, context)
-        if cmd in ("menu", "start"):
-            return await back_to_menu(update, context)
-        if cmd in ("cancel", "annuler"):
-            return await cancel(update, context)
-
-    # boutons et saisies textuelles (noms complets, numéros, alias)
-    if norm in ("1", "assur'education", "assur", "assureducation"):
-        return await start_assur(update, context)
-    elif norm in ("2", "ibekelia"):
-        return await start_ibekelia(update, context)
-    elif norm in ("3", "fer+", "fer"):
-        return await start_fer(update, context)
-    elif norm in ("4", "emprunteur"):
-        return await start_emprunteur(update, context)
-    elif norm in ("5", "sélection médicale", "selection médicale", "selection", "sélection", "selection medicale"):
-        await update.message.reply_text(
-            "Parcours SÉLECTION MÉDICALE :\nModule en cours de construction…",
-            reply_markup=MENU_KEYBOARD
-        )
-        return PRODUIT
-    elif norm in ("6", "autres produits", "autres"):
-        await update.message.reply_text("Parcours en construction…", reply_markup=MENU_KEYBOARD)
-        return PRODUIT
-    elif norm in ("menu", "start"):
-        return await back_to_menu(update, context)
-    elif norm in ("annuler", "cancel"):
-        return await cancel(update, context)
-    else:
-        await update.message.reply_text(
+    # commandes directes (/assur, /fer, etc.), boutons et saisies textuelles (noms, numéros, alias)
+    target = MENU_INTENTS.route(update.message.text)
+    if target is None:
+        await reply_text(
+            update,
             "Choix non reconnu. Utilisez les boutons du menu ou tapez /menu pour revenir au menu principal.",
             reply_markup=MENU_KEYBOARD,
         )
         return PRODUIT
+    return await target(update, context)
+
+
+async def info_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await reply_text(
+        update,
+        "Parcours SÉLECTION MÉDICALE :\nModule en cours de construction…",
+        reply_markup=MENU_KEYBOARD
+    )
+    return PRODUIT
+
+
+async def info_autres(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await reply_text(update, "Parcours en construction…", reply_markup=MENU_KEYBOARD)
+    return PRODUIT
 
 # -------------------------
-# Assur'Education handlers (identiques)
+# PARCOURS PRODUITS (description déclarative, cf. flows.py)
 # -------------------------
-async def choix_typcot(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    txt = update.message.text.strip()
-    # permettre de revenir au menu à tout moment via la commande /menu
-    if txt == "/menu":
-        return await back_to_menu(update, context)
-
-    if txt not in ("1", "2"):
-        await update.message.reply_text("Choix invalide. Répondez 1 (Prestation) ou 2 (Cotisation).")
-        return TYPCOT
-    context.user_data["typCot"] = int(txt)
-    await update.message.reply_text("Entrez votre année de naissance (AAAA) :")
-    return DNAISS
-
-async def saisie_ddnaiss(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = update.message.text.strip()
-    if text == "/menu":
-        return await back_to_menu(update, context)
-    try:
-        ddNaiss = int(text)
-        if ddNaiss < 1900 or ddNaiss > datetime.datetime.now().year:
-            raise ValueError
-    except Exception:
-        await update.message.reply_text("Année invalide. Entrez l'année de naissance au format AAAA (ex: 1985).")
-        return DNAISS
-
-    # Calcul âge et validation par rapport au tableau
-    age = datetime.datetime.now().year - ddNaiss
-    min_age, max_age = available_ages_taux()
-    if age < min_age or age > max_age:
-        await update.message.reply_text(
-            f"Âge hors grille (âge calculé = {age}). Les âges disponibles pour les taux vont de {min_age} à {max_age}.\n"
-            "Entrez une autre année de naissance ou /cancel."
-        )
-        return DNAISS
-
-    context.user_data["ddNaiss"] = ddNaiss
-    context.user_data["age"] = age
-    await update.message.reply_text("Entrez la durée de cotisation (5 à 20) :")
-    return DUREE
+def _taux_duree_existe(duree, data, tables):
+    if duree not in tables.taux_durees:
+        return f"Aucune colonne de durée {duree} trouvée dans le fichier. Choisissez une autre durée."
+    return None
 
-async def saisie_duree(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = update.message.text.strip()
-    if text == "/menu":
-        return await back_to_menu(update, context)
-    try:
-        duree = int(text)
-    except Exception:
-        await update.message.reply_text("Durée invalide. Entrez un nombre entier entre 5 et 20.")
-        return DUREE
-    if not (5 <= duree <= 20):
-        await update.message.reply_text("Durée hors intervalle. Entrez une durée entre 5 et 20.")
-        return DUREE
-    # vérifier que la colonne existe
-    if str(duree) not in df_taux.columns:
-        await update.message.reply_text(f"Aucune colonne de durée {duree} trouvée dans le fichier. Choisissez une autre durée.")
-        return DUREE
-
-    context.user_data["dureeCot"] = duree
-    await update.message.reply_text("Entrez le nombre de rentes (1 à 7) :")
-    return NBRENTE
-
-async def saisie_nb_rente(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = update.message.text.strip()
-    if text == "/menu":
-        return await back_to_menu(update, context)
-    try:
-        nb_rente = int(text)
-    except Exception:
-        await update.message.reply_text("nombre de rentes invalide. Entrez un entier (1 à 7).")
-        return NBRENTE
-    if not (1 <= nb_rente <= 7):
-        await update.message.reply_text("Nombre de rentes hors intervalle. Entrez entre 1 et 7.")
-        return NBRENTE
-
-    age = context.user_data.get("age")
-    # vérifier que la clé age-nb_rente existe
-    key = f"{age}-{nb_rente}"
-    if key not in df_taux.index:
-        # proposer les nb_rente disponibles pour cet âge
-        possibles = [int(idx.split("-")[1]) for idx in df_taux.index if idx.split("-")[0] == str(age)]
-        if possibles:
-            await update.message.reply_text(
-                f"Aucun tarif exact pour {age}-{nb_rente}. Les nombres de rentes disponibles pour l'âge {age} sont : {sorted(set(possibles))}.\n"
-                "Entrez un autre nombre de rentes (ou /cancel)."
-            )
-        else:
-            await update.message.reply_text(
-                f"Aucun tarif trouvé pour l'âge {age}. Revenez au début avec /start ou /cancel."
-            )
-        return NBRENTE
 
-    context.user_data["nbRente"] = nb_rente
+def _nb_rente_existe(nb_rente, data, tables):
+    age = data.get("age")
+    possibles = tables.taux_rentes_by_age.get(age, ())
+    if nb_rente in possibles:
+        return None
+    # proposer les nb_rente disponibles pour cet âge
+    if possibles:
+        return (
+            f"Aucun tarif exact pour {age}-{nb_rente}. Les nombres de rentes disponibles pour l'âge {age} sont : {list(possibles)}.\n"
+            "Entrez un autre nombre de rentes (ou /cancel)."
+        )
+    return f"Aucun tarif trouvé pour l'âge {age}. Revenez au début avec /start ou /cancel."
 
-    # 🔹 Texte personnalisé en fonction du type de prestation choisi
-    typCot = context.user_data.get("typCot")
-    if typCot == 1:
-        message = "Entrez le montant de la rente annuelle :"
-    else:
-        message = "Entrez la cotisation mensuelle :"
 
-    await update.message.reply_text(message)
-    return MONTANT
+def _prompt_montant(data):
+    # texte personnalisé en fonction du type de prestation choisi
+    if data.get("typCot") == 1:
+        return "Entrez le montant de la rente annuelle :"
+    return "Entrez la cotisation mensuelle :"
 
-async def saisie_montant(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = update.message.text.strip()
-    if text == "/menu":
-        return await back_to_menu(update, context)
-    try:
-        montant = float(text.replace(",", "."))
-    except Exception:
-        await update.message.reply_text("Montant invalide. Entrez un nombre (ex : 12000).")
-        return MONTANT
 
-    data = context.user_data
+def devis_assur(data, tables):
     typCot = data.get("typCot")
     age = data.get("age")
     duree = data.get("dureeCot")
     nb_rente = data.get("nbRente")
+    montant = data.get("montant")
 
-    taux = get_taux(age, nb_rente, duree)
-    if taux is None or taux == 0:
-        await update.message.reply_text("Désolé, aucun taux trouvé pour vos paramètres (ou taux nul). Recommencez avec /start.")
-        return await back_to_menu(update, context)
+    devis = quotation.quote_assur(tables, typCot, age, duree, nb_rente, montant)
+    if devis is None:
+        return None
+    taux = devis["taux"]
+    inputs = {
+        "Type de cotisation": "Prestation" if typCot == 1 else "Cotisation",
+        "Année de naissance": data.get("ddNaiss"),
+        "Âge": age,
+        "Durée cotisation (ans)": duree,
+        "Nombre de rentes": nb_rente,
+    }
 
     if typCot == 1:
-        mtRente = montant
-        cotisation_mensuelle = taux * mtRente
-        await update.message.reply_text(
-            f"✅ Votre bénéficiaire pourra jouir d'une rente annuelle de : {mtRente:,.2f}\n"
+        cotisation_mensuelle = devis["cotisation"]
+        text = (
+            f"✅ Votre bénéficiaire pourra jouir d'une rente annuelle de : {montant:,.2f}\n"
             f"pendant {nb_rente} années contre une cotisation mensuelle de {cotisation_mensuelle:,.2f}."
         )
-
-        # Préparer le récapitulatif pour le PDF
-        context.user_data["last_recap"] = {
-            "product": "Assur'Education",
-            "title": "Assur'Education - Récapitulatif",
-            "inputs": {
-                "Type de cotisation": "Prestation",
-                "Année de naissance": data.get("ddNaiss"),
-                "Âge": age,
-                "Durée cotisation (ans)": duree,
-                "Nombre de rentes": nb_rente,
-                "Montant rente annuelle": mtRente,
-            },
-            "results": {
-                "Taux": taux,
-                "Cotisation mensuelle": f"{cotisation_mensuelle:,.2f}",
-            },
-        }
-
+        inputs["Montant rente annuelle"] = montant
+        results = {"Taux": taux, "Cotisation mensuelle": f"{cotisation_mensuelle:,.2f}"}
     else:
-        mtCot = montant
-        rente_annuelle = mtCot / taux
-        await update.message.reply_text(
-            f"✅ Avec une cotisation mensuelle de {mtCot:,.2f},\n"
+        rente_annuelle = devis["rente"]
+        text = (
+            f"✅ Avec une cotisation mensuelle de {montant:,.2f},\n"
             f"votre bénéficiaire pourra bénéficier d'une rente annuelle de : {rente_annuelle:,.2f}\n"
             f"pendant {nb_rente} années."
         )
+        inputs["Cotisation mensuelle saisie"] = montant
+        results = {"Taux": taux, "Rente annuelle": f"{rente_annuelle:,.2f}"}
 
-        context.user_data["last_recap"] = {
-            "product": "Assur'Education",
-            "title": "Assur'Education - Récapitulatif",
-            "inputs": {
-                "Type de cotisation": "Cotisation",
-                "Année de naissance": data.get("ddNaiss"),
-                "Âge": age,
-                "Durée cotisation (ans)": duree,
-                "Nombre de rentes": nb_rente,
-                "Cotisation mensuelle saisie": mtCot,
-            },
-            "results": {
-                "Taux": taux,
-                "Rente annuelle": f"{rente_annuelle:,.2f}",
-            },
-        }
+    recap = {"product": "Assur'Education", "title": "Assur'Education - Récapitulatif", "inputs": inputs, "results": results}
+    return Quote(text, recap)
 
-    # Demander à l'utilisateur s'il souhaite le PDF
-    return await ask_pdf_and_store(update, context)
 
-# ----- IBEKELIA (identique) -----
-async def saisie_ddnaiss_i(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = update.message.text.strip()
-    if text == "/menu":
-        return await back_to_menu(update, context)
-    try:
-        ddNaiss = int(text)
-        if ddNaiss < 1900 or ddNaiss > datetime.datetime.now().year:
-            raise ValueError
-    except Exception:
-        await update.message.reply_text("Année invalide. Entrez l'année de naissance au format AAAA (ex: 1985).")
-        return DNAISS_I
-
-    age = datetime.datetime.now().year - ddNaiss
-    min_age, max_age = available_ages_prime()
-    if age < min_age or age > max_age:
-        await update.message.reply_text(
-            f"Âge hors grille (âge_calculé = {age}). Les âges disponibles pour IBEKELIA vont de {min_age} à {max_age}.\n"
-            "Entrez une autre année de naissance ou /cancel."
-        )
-        return DNAISS_I
-
-    context.user_data["ddNaiss"] = ddNaiss
-    context.user_data["age"] = age
-    await update.message.reply_text(
-        "Entrez la périodicité de cotisation !\n"
-        "M - pour mensuelle\n"
-        "A - pour annuelle\n"
-        "U - pour unique",
-    )
-    return PERIODE_I
-
-async def saisie_periode(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    per = update.message.text.strip().upper()
-    if per == "/menu":
-        return await back_to_menu(update, context)
-    if per not in ("M", "A", "U"):
-        await update.message.reply_text("Périodicité invalide. Répondez M, A ou U.")
-        return PERIODE_I
-    context.user_data["perCot"] = per
-    await update.message.reply_text(
-        "Entrez le capital d'assistance obsèques souhaité !\n"
-        "1- 1 000 000\n"
-        "2- 2 000 000\n"
-        "3- 3 000 000\n"
-        "4- 4 000 000\n"
-        "5- 5 000 000"
-    )
-    return CAPOBSQ_I
-
-async def saisie_capobsq(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    choix = update.message.text.strip()
-    if choix == "/menu":
-        return await back_to_menu(update, context)
-    if choix not in CAP_OBSEQUES:
-        await update.message.reply_text("Choix invalide. Répondez 1,2,3,4 ou 5.")
-        return CAPOBSQ_I
-    cap_obsq = CAP_OBSEQUES[choix]
-    data = context.user_data
+def devis_ibekelia(data, tables):
     age = data.get("age")
     per_cot = data.get("perCot")
+    cap_obsq = data.get("capObsq")
 
-    prime = get_prime(age, per_cot, cap_obsq)
+    prime = quotation.quote_ibekelia(tables, age, per_cot, cap_obsq)
     if prime is None:
-        await update.message.reply_text("Désolé, aucun tarif trouvé pour vos paramètres. Vérifiez la périodicité et l'âge.")
-        return await back_to_menu(update, context)
-
-    await update.message.reply_text(
+        return None
+    text = (
         f"✅ Pour une cotisation {per_cot} de {prime:,.2f},\n"
         f"vous garantissez à vos proches un capital de {cap_obsq:,.0f}.\n"
         "Vous les libérez ainsi des soucis financiers et organisationnels liés à vos obsèques, en toute sérénité."
     )
-
-    # Préparer le récapitulatif
-    context.user_data["last_recap"] = {
+    recap = {
         "product": "IBEKELIA",
         "title": "IBEKELIA - Récapitulatif",
         "inputs": {
@@ -629,213 +376,93 @@ async def saisie_capobsq(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "Prime": f"{prime:,.2f}",
         },
     }
+    return Quote(text, recap)
 
-    return await ask_pdf_and_store(update, context)
-
-# ----- FER+ handlers (nouveau parcours 3) -----
-async def fer_choix(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    choix = update.message.text.strip().upper()
-    if choix == "/menu":
-        return await back_to_menu(update, context)
-    # Accept A..G from grille plus H (saisie libre)
-    valid_choices = list(df_fer_grille.index) + ["H"]
-    if choix not in valid_choices:
-        await update.message.reply_text("Choix invalide. Répondez par A, B, C, D, E, F, G ou H.")
-        return FER_CHOIX
-
-    context.user_data["fer_choix"] = choix
-    await update.message.reply_text("Entrez la durée de cotisation (en années, 1 à 47) :")
-    return FER_DUREE
-
-async def fer_duree(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = update.message.text.strip()
-    if text == "/menu":
-        return await back_to_menu(update, context)
-    try:
-        duree = int(text)
-    except Exception:
-        await update.message.reply_text("Durée invalide. Entrez un entier entre 1 et 47.")
-        return FER_DUREE
-    if not (1 <= duree <= 47):
-        await update.message.reply_text("Durée hors intervalle. Entrez entre 1 et 47.")
-        return FER_DUREE
-
-    tauxP = get_fer_taux(duree)
-    if tauxP is None:
-        await update.message.reply_text(f"Aucun taux trouvé pour la durée {duree}. Vérifiez la durée.")
-        return FER_DUREE
-
-    context.user_data["fer_duree"] = duree
-    context.user_data["fer_tauxP"] = tauxP
-
-    choix = context.user_data["fer_choix"]
-    if choix == "H":
-        await update.message.reply_text("Vous avez choisi H (cotisation libre > 120000). Entrez votre cotisation mensuelle (doit être supérieure à 120000) :")
-        return FER_MONTANT
-    else:
-        # lecture des valeurs de la grille
-        grille = get_fer_grille(choix)
-        if grille is None:
-            await update.message.reply_text("Erreur interne : grille introuvable pour ce choix.")
-            return await back_to_menu(update, context)
 
-        cotMensEp = float(grille["cotMensEp"]) if pd.notna(grille["cotMensEp"]) else 0
-        cotMensPrev = float(grille["cotMensPrev"]) if pd.notna(grille["cotMensPrev"]) else 0
-        cotMensTot = float(grille["cotMensTot"]) if pd.notna(grille["cotMensTot"]) else 0
-        capDec = float(grille["capDec"]) if pd.notna(grille["capDec"]) else 0
-        tauxP = context.user_data["fer_tauxP"]
-        # calcul
-        capAcquis = tauxP * cotMensEp
-
-        await update.message.reply_text(
-            f"✅ Pour une cotisation mensuelle de {cotMensTot:,.0f} dont {cotMensEp:,.0f} de prime épargne "
-            f"et {cotMensPrev:,.0f} de prime décès pendant {duree} ans, il est garanti :\n\n"
+def devis_fer(data, tables):
+    choix = data.get("fer_choix")
+    duree = data.get("fer_duree")
+    tauxP = data.get("fer_tauxP")
+
+    if choix == "H":
+        mtCot = data.get("fer_montant")
+        devis = quotation.quote_fer(tables, "H", duree, mtCot)
+        if devis is None:
+            return None
+        capAcquis = devis["capAcquis"]
+        prime_deces = f"{quotation.FER_H_PRIME_DECES:,}".replace(",", " ")
+        cap_deces = f"{quotation.FER_H_CAP_DECES:,}".replace(",", " ")
+        text = (
+            f"✅ Pour une cotisation mensuelle de {mtCot:,.0f} dont {devis['cotMensEp']:,.0f} de prime épargne "
+            f"et {prime_deces} de prime décès pendant {duree} ans, il est garanti :\n\n"
             f"- un capital acquis de {capAcquis:,.2f} en cas de vie au terme du contrat ;\n"
-            f"- un capital décès de {capDec:,.0f} + la valeur de l'épargne constituée en cas de décès avant terme."
+            f"- un capital décès de {cap_deces} + la valeur de l'épargne constituée en cas de décès avant terme."
         )
-
-        # Préparer récapitulatif
-        context.user_data["last_recap"] = {
+        recap = {
             "product": "FER+",
             "title": "FER+ - Récapitulatif",
             "inputs": {
-                "Choix grille": choix,
+                "Choix grille": "H (saisie libre)",
                 "Durée (ans)": duree,
-                "Cot mens ep (épargne)": cotMensEp,
-                "Cot mens prev (décès)": cotMensPrev,
-                "Cot mens tot": cotMensTot,
+                "Cotisation mensuelle saisie": mtCot,
             },
             "results": {
-                "TauxP": tauxP,
+                "TauxP": devis["tauxP"],
                 "Capital acquis": f"{capAcquis:,.2f}",
-                "Capital décès garanti": f"{capDec:,.0f}",
+                "Capital décès garanti": f"{cap_deces} + épargne",
             },
         }
+        return Quote(text, recap)
 
-        return await ask_pdf_and_store(update, context)
-
-async def fer_montant(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = update.message.text.strip().replace(",", ".")
-    if text == "/menu":
-        return await back_to_menu(update, context)
-    try:
-        mtCot = float(text)
-    except Exception:
-        await update.message.reply_text("Montant invalide. Entrez un nombre (ex : 125000).")
-        return FER_MONTANT
-    if mtCot <= 120000:
-        await update.message.reply_text("Pour H, la cotisation doit être strictement supérieure à 120000. Réessayez.")
-        return FER_MONTANT
-
-    duree = context.user_data.get("fer_duree")
-    tauxP = context.user_data.get("fer_tauxP")
-    # formule demandée : capAcquis = tauxPrime * (mtCot - 20000)
-    capAcquis = tauxP * (mtCot - 20000)
-
-    await update.message.reply_text(
-        f"✅ Pour une cotisation mensuelle de {mtCot:,.0f} dont {mtCot - 20000:,.0f} de prime épargne "
-        f"et 20 000 de prime décès pendant {duree} ans, il est garanti :\n\n"
+    # lecture des valeurs de la grille + calcul
+    devis = quotation.quote_fer(tables, choix, duree)
+    if devis is None:
+        return None
+    cotMensEp = devis["cotMensEp"]
+    cotMensPrev = devis["cotMensPrev"]
+    cotMensTot = devis["cotMensTot"]
+    capDec = devis["capDec"]
+    capAcquis = devis["capAcquis"]
+    text = (
+        f"✅ Pour une cotisation mensuelle de {cotMensTot:,.0f} dont {cotMensEp:,.0f} de prime épargne "
+        f"et {cotMensPrev:,.0f} de prime décès pendant {duree} ans, il est garanti :\n\n"
         f"- un capital acquis de {capAcquis:,.2f} en cas de vie au terme du contrat ;\n"
-        f"- un capital décès de 20 000 000 + la valeur de l'épargne constituée en cas de décès avant terme."
+        f"- un capital décès de {capDec:,.0f} + la valeur de l'épargne constituée en cas de décès avant terme."
     )
-
-    # Préparer récapitulatif
-    context.user_data["last_recap"] = {
+    recap = {
         "product": "FER+",
         "title": "FER+ - Récapitulatif",
         "inputs": {
-            "Choix grille": "H (saisie libre)",
+            "Choix grille": choix,
             "Durée (ans)": duree,
-            "Cotisation mensuelle saisie": mtCot,
+            "Cot mens ep (épargne)": cotMensEp,
+            "Cot mens prev (décès)": cotMensPrev,
+            "Cot mens tot": cotMensTot,
         },
         "results": {
             "TauxP": tauxP,
             "Capital acquis": f"{capAcquis:,.2f}",
-            "Capital décès garanti": "20 000 000 + épargne",
+            "Capital décès garanti": f"{capDec:,.0f}",
         },
     }
+    return Quote(text, recap)
 
-    return await ask_pdf_and_store(update, context)
-
-# ----- EMPRUNTEUR handlers (nouveau) -----
-async def saisie_ddnaiss_e(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = update.message.text.strip()
-    if text == "/menu":
-        return await back_to_menu(update, context)
-    try:
-        ddNaiss = int(text)
-        if ddNaiss < 1900 or ddNaiss > datetime.datetime.now().year:
-            raise ValueError
-    except Exception:
-        await update.message.reply_text("Année invalide. Entrez l'année de naissance au format AAAA (ex: 1985).")
-        return DNAISS_E
-
-    age = datetime.datetime.now().year - ddNaiss
-    # vérifier que l'âge existe dans la grille emprunteur
-    if age not in df_emp.index:
-        await update.message.reply_text(
-            f"Âge hors grille pour Emprunteur (âge calculé = {age}).\n"
-            "Veuillez contacter un conseiller ou recommencer avec /start."
-        )
-        return await back_to_menu(update, context)
-
-    context.user_data["ddNaiss"] = ddNaiss
-    context.user_data["age"] = age
-    await update.message.reply_text("Entrez la durée mensuelle du prêt (en mois, ex: 12, 24, 360) :")
-    return DUREE_PRET
-
-async def saisie_duree_pret(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = update.message.text.strip()
-    if text == "/menu":
-        return await back_to_menu(update, context)
-    try:
-        duree = int(text)
-    except Exception:
-        await update.message.reply_text("Durée invalide. Entrez un entier (durée en mois, ex: 12, 24, 360).")
-        return DUREE_PRET
-
-    age = context.user_data.get("age")
-    # vérifier que la colonne existe
-    if duree not in df_emp.columns:
-        await update.message.reply_text(
-            f"Aucun taux trouvé pour une durée de {duree} mois. Vérifiez la durée ou contactez un conseiller."
-        )
-        return await back_to_menu(update, context)
-
-    context.user_data["dureePret"] = duree
-    await update.message.reply_text("Entrez le capital emprunté (ex: 5000000) :")
-    return CAP_PRET
-
-async def saisie_cap_pret(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = update.message.text.strip().replace(",", "")
-    if text == "/menu":
-        return await back_to_menu(update, context)
-    try:
-        capPret = float(text)
-    except Exception:
-        await update.message.reply_text("Capital invalide. Entrez un nombre (ex : 5000000).")
-        return CAP_PRET
-
-    age = context.user_data.get("age")
-    duree = context.user_data.get("dureePret")
-
-    tauxPrime = get_emp_taux(age, duree)
-    if tauxPrime is None:
-        await update.message.reply_text("Désolé, aucun taux trouvé pour vos paramètres. Rendez-vous chez SUNU pour la prise en charge de votre requête.")
-        return await back_to_menu(update, context)
 
-    prime = tauxPrime * capPret
-    if prime == 0:
-        await update.message.reply_text("Rendez-vous chez SUNU pour la prise en charge de votre requête.", reply_markup=MENU_KEYBOARD)
-    else:
-        await update.message.reply_text(f"✅ La prime unique est de : {prime:,.2f} Fcfa.")
+def devis_emprunteur(data, tables):
+    age = data.get("age")
+    duree = data.get("dureePret")
+    capPret = data.get("capPret")
 
-    # Préparer récapitulatif
-    context.user_data["last_recap"] = {
+    devis = quotation.quote_emprunteur(tables, age, duree, capPret)
+    if devis is None:
+        return None
+    tauxPrime = devis["taux"]
+    prime = devis["prime"]
+    recap = {
         "product": "Emprunteur",
         "title": "Emprunteur - Récapitulatif",
         "inputs": {
-            "Année de naissance": context.user_data.get("ddNaiss"),
+            "Année de naissance": data.get("ddNaiss"),
             "Âge": age,
             "Durée (mois)": duree,
             "Capital emprunté": capPret,
@@ -845,101 +472,308 @@ async def saisie_cap_pret(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "Prime unique": f"{prime:,.2f}",
         },
     }
+    if prime == 0:
+        return Quote("Rendez-vous chez SUNU pour la prise en charge de votre requête.", recap, MENU_KEYBOARD)
+    return Quote(f"✅ La prime unique est de : {prime:,.2f} Fcfa.", recap)
+
 
-    return await ask_pdf_and_store(update, context)
+PRODUCTS = [
+    Product(
+        "assur",
+        "Parcours Assur'Education :\n\n"
+        "1- Prestation définie ?\n"
+        "2- Cotisation définie ?\n\n"
+        "Répondez 1 ou 2.",
+        [
+            # P / C : forme courte de la commande en une ligne (/assur P 1985 10 3 50000)
+            Step(TYPCOT, "typCot", None, parse_choice({"1": 1, "2": 2, "P": 1, "C": 2}),
+                 "Choix invalide. Répondez 1 (Prestation) ou 2 (Cotisation).", upper=True,
+                 buttons=[[("1- Prestation", "1"), ("2- Cotisation", "2")]]),
+            year_step(
+                DNAISS, "Entrez votre année de naissance (AAAA) :", lambda t: t.taux_ages,
+                "Âge hors grille (âge calculé = {age}). Les âges disponibles pour les taux vont de {min} à {max}.\n"
+                "Entrez une autre année de naissance ou /cancel.",
+            ),
+            Step(DUREE, "dureeCot", "Entrez la durée de cotisation (5 à 20) :", int,
+                 "Durée invalide. Entrez un nombre entier entre 5 et 20.",
+                 checks=[
+                     (in_range(5, 20, "Durée hors intervalle. Entrez une durée entre 5 et 20."), STAY),
+                     (_taux_duree_existe, STAY),
+                 ]),
+            Step(NBRENTE, "nbRente", "Entrez le nombre de rentes (1 à 7) :", int,
+                 "nombre de rentes invalide. Entrez un entier (1 à 7).",
+                 checks=[
+                     (in_range(1, 7, "Nombre de rentes hors intervalle. Entrez entre 1 et 7."), STAY),
+                     (_nb_rente_existe, STAY),
+                 ]),
+            Step(MONTANT, "montant", _prompt_montant, parse_amount,
+                 "Montant invalide. Entrez un nombre (ex : 12000)."),
+        ],
+        devis_assur,
+        "Désolé, aucun taux trouvé pour vos paramètres (ou taux nul). Recommencez avec /start.",
+        usage="/assur P|C année_naissance durée nb_rentes montant (ex. /assur P 1985 10 3 50000)",
+    ),
+    Product(
+        "ibekelia",
+        "Parcours IBEKELIA :\nEntrez votre année de naissance (AAAA) :",
+        [
+            year_step(
+                DNAISS_I, None, lambda t: t.prime_ages,
+                "Âge hors grille (âge_calculé = {age}). Les âges disponibles pour IBEKELIA vont de {min} à {max}.\n"
+                "Entrez une autre année de naissance ou /cancel.",
+            ),
+            Step(PERIODE_I, "perCot",
+                 "Entrez la périodicité de cotisation !\n"
+                 "M - pour mensuelle\n"
+                 "A - pour annuelle\n"
+                 "U - pour unique",
+                 parse_choice(("M", "A", "U")), "Périodicité invalide. Répondez M, A ou U.", upper=True,
+                 buttons=[[("Mensuelle", "M"), ("Annuelle", "A"), ("Unique", "U")]]),
+            Step(CAPOBSQ_I, "capObsq",
+                 "Entrez le capital d'assistance obsèques souhaité !\n"
+                 "1- 1 000 000\n"
+                 "2- 2 000 000\n"
+                 "3- 3 000 000\n"
+                 "4- 4 000 000\n"
+                 "5- 5 000 000",
+                 parse_choice(CAP_OBSEQUES), "Choix invalide. Répondez 1,2,3,4 ou 5.",
+                 buttons=[[(CAP_LABELS[key], key) for key in row] for row in (("1", "2"), ("3", "4"), ("5",))]),
+        ],
+        devis_ibekelia,
+        "Désolé, aucun tarif trouvé pour vos paramètres. Vérifiez la périodicité et l'âge.",
+        usage="/ibekelia année_naissance M|A|U capital_1..5 (ex. /ibekelia 1985 M 2)",
+    ),
+    Product(
+        "fer",
+        "Parcours FER+ :\n\n"
+        "Choisissez votre capacité d'épargne (répondez A..H) :\n\n"
+        "Epargne - Décès - Capacité d'épargne total - Capital Déces\n\n"
+        "A - 10 000  - 2 000  - 12 000  - 2 000 000\n"
+        "B - 20 000  - 4 000  - 24 000  - 4 000 000\n"
+        "C - 30 000  - 6 000  - 36 000  - 6 000 000\n"
+        "D - 40 000  - 8 000  - 48 000  - 8 000 000\n"
+        "E - 60 000  - 12 000 - 72 000  - 12 000 000\n"
+        "F - 80 000  - 16 000 - 96 000  - 16 000 000\n"
+        "G - 100 000 - 20 000 - 120 000 - 20 000 000\n"
+        "H - Je peux cotiser plus de 120 000 par mois (saisie libre)",
+        [
+            # A..G de la grille plus H (saisie libre) ; la liste suit les tables rechargées
+            Step(FER_CHOIX, "fer_choix", None, str,
+                 "Choix invalide. Répondez par A, B, C, D, E, F, G ou H.", upper=True,
+                 buttons=[[(c, c) for c in "ABCD"], [(c, c) for c in "EFGH"]],
+                 checks=[(lambda v, d, t: None if v in t.fer_choix_valides
+                          else "Choix invalide. Répondez par A, B, C, D, E, F, G ou H.", STAY)]),
+            Step(FER_DUREE, "fer_duree", "Entrez la durée de cotisation (en années, 1 à 47) :", int,
+                 "Durée invalide. Entrez un entier entre 1 et 47.",
+                 derive=lambda v, d, t: {"fer_tauxP": t.fer(v)},
+                 checks=[
+                     (in_range(1, 47, "Durée hors intervalle. Entrez entre 1 et 47."), STAY),
+                     (lambda v, d, t: None if d["fer_tauxP"] is not None
+                      else f"Aucun taux trouvé pour la durée {v}. Vérifiez la durée.", STAY),
+                 ]),
+            Step(FER_MONTANT, "fer_montant",
+                 "Vous avez choisi H (cotisation libre > 120000). Entrez votre cotisation mensuelle (doit être supérieure à 120000) :",
+                 parse_amount, "Montant invalide. Entrez un nombre (ex : 125000).",
+                 checks=[(lambda v, d, t: None if v > quotation.FER_H_MIN_COT
+                          else "Pour H, la cotisation doit être strictement supérieure à 120000. Réessayez.", STAY)],
+                 when=lambda d: d.get("fer_choix") == "H"),
+        ],
+        devis_fer,
+        "Erreur interne : grille introuvable pour ce choix.",
+        usage="/fer A..G durée, ou /fer H durée cotisation (ex. /fer C 12)",
+    ),
+    Product(
+        "emprunteur",
+        "Parcours EMPRUNTEUR :\nEntrez votre année de naissance (AAAA) :",
+        [
+            year_step(
+                DNAISS_E, None, lambda t: t.emp_ages,
+                "Âge hors grille pour Emprunteur (âge calculé = {age}).\n"
+                "Veuillez contacter un conseiller ou recommencer avec /start.",
+                action=MENU,
+            ),
+            Step(DUREE_PRET, "dureePret", "Entrez la durée mensuelle du prêt (en mois, ex: 12, 24, 360) :", int,
+                 "Durée invalide. Entrez un entier (durée en mois, ex: 12, 24, 360).",
+                 checks=[(lambda v, d, t: None if v in t.emp_durees
+                          else f"Aucun taux trouvé pour une durée de {v} mois. Vérifiez la durée ou contactez un conseiller.", MENU)]),
+            Step(CAP_PRET, "capPret", "Entrez le capital emprunté (ex: 5000000) :", parse_amount_grouped,
+                 "Capital invalide. Entrez un nombre (ex : 5000000)."),
+        ],
+        devis_emprunteur,
+        "Désolé, aucun taux trouvé pour vos paramètres. Rendez-vous chez SUNU pour la prise en charge de votre requête.",
+        usage="/emp année_naissance durée_mois capital (ex. /emp 1980 240 5000000)",
+    ),
+]
+
+FLOWS = FlowEngine(
+    PRODUCTS,
+    tables=current_tables,
+    back_to_menu=back_to_menu,
+    # résolu à l'appel : ask_pdf_and_store est défini plus bas
+    on_quote=lambda update, context: ask_pdf_and_store(update, context),
+)
+
+start_assur = FLOWS.entry("assur")
+start_ibekelia = FLOWS.entry("ibekelia")
+start_fer = FLOWS.entry("fer")
+start_emprunteur = FLOWS.entry("emprunteur")
 
 # ----- Cancel -----
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("Opération annulée.", reply_markup=MENU_KEYBOARD)
+    await reply_text(update, "Opération annulée.", reply_markup=MENU_KEYBOARD)
     return PRODUIT
 
+# -------------------------
+# Routage du menu (table construite une fois, cf. intents.py)
+# -------------------------
+MENU_INTENTS = IntentRouter(
+    aliases={
+        start_assur: ("1", "assur'education", "assur", "assureducation", "assur education"),
+        start_ibekelia: ("2", "ibekelia"),
+        start_fer: ("3", "fer+", "fer"),
+        start_emprunteur: ("4", "emprunteur"),
+        info_selection: ("5", "sélection médicale", "selection", "sélection"),
+        info_autres: ("6", "autres produits", "autres"),
+        back_to_menu: ("menu", "start"),
+        cancel: ("annuler", "cancel"),
+    },
+    commands={
+        start_assur: ("assur", "assureducation"),
+        start_ibekelia: ("ibekelia",),
+        start_fer: ("fer",),
+        start_emprunteur: ("emprunteur", "emp"),
+        start_selection: ("selection",),
+        back_to_menu: ("menu", "start"),
+        cancel: ("cancel", "annuler"),
+    },
+)
+
 # -------------------------
 # PDF utilities
 # -------------------------
 
-def generate_pdf_bytes(recap: dict) -> bytes:
-    """Génère un PDF en mémoire (bytes) à partir du récapitulatif fourni.
-    recap doit contenir : product (str), title (str), inputs (dict), results (dict)
-    """
-    pdf = FPDF()
-    pdf.set_auto_page_break(auto=True, margin=15)
-    pdf.add_page()
+# generate_pdf_bytes est conservé ici pour compatibilité ; le rendu passe par le pool
+# PDF_POOL_KIND : "thread" (défaut) ou "process"
+PDF_POOL = PdfRenderPool(
+    workers=int(os.getenv("PDF_POOL_WORKERS", "2")),
+    max_queue=int(os.getenv("PDF_POOL_MAX_QUEUE", "20")),
+    timeout=float(os.getenv("PDF_POOL_TIMEOUT", "30")),
+    kind=os.getenv("PDF_POOL_KIND", "thread"),
+    # cache par contenu : PDF_CACHE_DIR="" désactive le niveau disque
+    cache=PdfCache(
+        max_bytes=int(float(os.getenv("PDF_CACHE_MAX_MB", "32")) * 1024 * 1024),
+        directory=os.getenv("PDF_CACHE_DIR", os.path.join(tarifs.BASE_DIR, ".cache_pdf")),
+        max_disk_bytes=int(float(os.getenv("PDF_CACHE_DISK_MAX_MB", "256")) * 1024 * 1024),
+    ),
+)
 
-    # Logo (en haut à gauche) si présent
-    if os.path.exists("Logo_sunu.jpg"):
-        try:
-            pdf.image("Logo_sunu.jpg", x=10, y=8, w=30)
-        except Exception:
-            logger.warning("Impossible d'insérer Logo_sunu.jpg dans le PDF (format/police).")
-
-    # Titre
-    pdf.set_font("Arial", "B", 14)
-    pdf.cell(0, 10, f"Simulation - {recap.get('product', '')}", ln=1, align="C")
-    pdf.ln(6)
-
-    # Informations saisies
-    pdf.set_font("Arial", "B", 12)
-    pdf.cell(0, 8, "Informations saisies :", ln=1)
-    pdf.set_font("Arial", size=11)
-    inputs = recap.get("inputs", {})
-    for k, v in inputs.items():
-        pdf.multi_cell(0, 7, f"- {k}: {v}")
-
-    pdf.ln(3)
-
-    # Résultats (personnalisation légère selon produit)
-    pdf.set_font("Arial", "B", 12)
-    pdf.cell(0, 8, "Résultats :", ln=1)
-    pdf.set_font("Arial", size=11)
-    results = recap.get("results", {})
-    for k, v in results.items():
-        pdf.multi_cell(0, 7, f"- {k}: {v}")
-
-    pdf.ln(6)
-    pdf.set_font("Arial", "I", 9)
-    pdf.cell(0, 5, "Généré le: " + datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), ln=1, align="R")
-
-    out = pdf.output(dest='S')
-    if isinstance(out, str):
-        return out.encode('latin-1')
-    return out
+
+def _file_ids_io(fn, *args):
+    """Appel SQLite de FILE_IDS dans le pool de threads par défaut, hors de la boucle asyncio."""
+    return asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+def _file_ids_background(fn, *args):
+    """Écriture FILE_IDS sans attendre : l'envoi à l'utilisateur n'en dépend pas."""
+    _file_ids_io(fn, *args).add_done_callback(_log_file_ids_error)
+
+
+def _log_file_ids_error(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning("Écriture des file_id PDF impossible : %s", future.exception())
+
+
+# boutons Oui/Non ; la saisie texte reste acceptée (cf. handle_pdf_choice)
+PDF_KEYBOARD = choice_keyboard(ASK_PDF, [[("Oui", "oui"), ("Non", "non")]])
 
 
 async def ask_pdf_and_store(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Pose la question Oui/Non pour envoyer le PDF."""
-    keyboard = ReplyKeyboardMarkup([["Oui", "Non"]], one_time_keyboard=True, resize_keyboard=True)
-    await update.message.reply_text(
+    recap = context.user_data.get("last_recap")
+    if recap is not None:
+        # version des tables ayant servi au calcul (cf. TarifRegistry)
+        tables = current_tables()
+        recap["tarif_version"] = tables.version
+        logger.info("Simulation %s calculée avec les tables tarifaires v%d.", recap.get("product"), tables.version)
+    await reply_text(
+        update,
         "Souhaitez-vous recevoir un PDF récapitulatif de cette simulation ? (Oui / Non)",
-        reply_markup=keyboard,
+        reply_markup=PDF_KEYBOARD,
     )
     return ASK_PDF
 
 
 async def handle_pdf_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    txt = update.message.text.strip().lower()
+    return await pdf_choice(update, context, update.message.text.strip().lower())
 
+
+async def handle_pdf_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    return await pdf_choice(update, context, await answer_choice(update))
+
+
+async def pdf_choice(update: Update, context: ContextTypes.DEFAULT_TYPE, txt: str):
     if txt in ("oui", "o", "yes", "y"):
         recap = context.user_data.get("last_recap")
         if not recap:
-            await update.message.reply_text("Aucune donnée disponible pour générer un PDF.", reply_markup=MENU_KEYBOARD)
+            await reply_text(update, "Aucune donnée disponible pour générer un PDF.", reply_markup=MENU_KEYBOARD)
             return await back_to_menu(update, context)
 
-        pdf_bytes = generate_pdf_bytes(recap)
+        # même récapitulatif déjà envoyé avec ces tables : renvoi par file_id, sans rendu ni upload
+        recap_key = recap_digest(recap)
+        tarif = current_tables().digest
+        try:
+            file_id = await _file_ids_io(FILE_IDS.get, recap_key, tarif)
+        except Exception as e:
+            logger.warning("Lecture des file_id PDF impossible (%s), envoi du fichier.", e)
+            file_id = None
+        if file_id is not None:
+            try:
+                with outbound.lane(outbound.HIGH):
+                    await reply_document(update, file_id, caption=menu_text(update.effective_user), reply_markup=MENU_KEYBOARD)
+                FILE_IDS.record_sent(via_file_id=True)
+                # le menu est la légende du document : pas de message supplémentaire
+                context.user_data.clear()
+                return PRODUIT
+            except BadRequest:
+                logger.warning("file_id PDF refusé par Telegram, nouvel envoi du fichier.")
+                _file_ids_background(FILE_IDS.discard, recap_key)
+            except Exception as e:
+                # réseau, délai... : le fichier est renvoyé, l'utilisateur ne reste pas bloqué ici
+                logger.warning("Renvoi du PDF par file_id impossible (%s), nouvel envoi du fichier.", e)
+
+        try:
+            pdf_bytes = await PDF_POOL.render(recap)
+        except PdfQueueFull:
+            logger.warning("File PDF saturée, demande refusée.")
+            await reply_text(update, "Service PDF momentanément saturé. Réessayez dans un instant.")
+            return await back_to_menu(update, context)
+        except asyncio.TimeoutError:
+            logger.error("Génération du PDF trop longue (> %ss).", PDF_POOL.timeout)
+            await reply_text(update, "Erreur lors de la génération du PDF.")
+            return await back_to_menu(update, context)
         bio = io.BytesIO(pdf_bytes)
         bio.name = f"simulation_{recap.get('product','simulation')}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
         bio.seek(0)
 
         try:
-            # Envoi du document (Telegram gère le téléchargement)
-            await update.message.reply_document(document=InputFile(bio, filename=bio.name))
+            # Envoi du document (Telegram gère le téléchargement), menu en légende
+            with outbound.lane(outbound.HIGH):
+                sent = await reply_document(
+                    update,
+                    InputFile(bio, filename=bio.name),
+                    caption=menu_text(update.effective_user),
+                    reply_markup=MENU_KEYBOARD,
+                )
+            FILE_IDS.record_sent(via_file_id=False)
+            if sent is not None and sent.document is not None:
+                _file_ids_background(FILE_IDS.put, recap_key, tarif, sent.document.file_id)
         except Exception as e:
             logger.exception("Erreur en envoyant le PDF : %s", e)
-            await update.message.reply_text("Erreur lors de l'envoi du PDF.")
-
-        # Cleanup : on supprime le récapitulatif si vous souhaitez ne pas le garder
-        context.user_data.pop("last_recap", None)
+            await reply_text(update, "Erreur lors de l'envoi du PDF.")
+            return await back_to_menu(update, context)
 
-        return await back_to_menu(update, context)
+        context.user_data.clear()
+        return PRODUIT
 
     # si non -> retour au menu sans envoi
     return await back_to_menu(update, context)
@@ -947,12 +781,156 @@ async def handle_pdf_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # -------------------------
 # Lancer le bot
 # -------------------------
-def main():
-    token = os.getenv("TELEGRAM_TOKEN", "8484290771:AAGiLz1F20DegARHyx2-xVV5OlyOLVUfipA")
-    if token == "8484290771:AAGiLz1F20DegARHyx2-xVV5OlyOLVUfipA":
-        logger.warning("Vous utilisez la valeur par défaut pour le token. Remplacez-la par votre token ou définissez TELEGRAM_TOKEN.")
+# Mode de déploiement : "polling" (défaut) ou "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+# nombre d'updates traitées en parallèle, tous chats confondus (1 = séquentiel) ;
+# les updates d'un même chat restent toujours traitées dans l'ordre
+CONCURRENT_UPDATES = int(os.getenv("BOT_CONCURRENT_UPDATES", "8"))
+
+
+# Persistance des conversations : "sqlite" (défaut), "memory" ou "none"
+PERSISTENCE_BACKEND = os.getenv("PERSISTENCE_BACKEND", "sqlite").strip().lower()
+PERSISTENCE_DB = os.getenv("PERSISTENCE_DB", os.path.join(tarifs.BASE_DIR, ".state", "conversations.sqlite3"))
+# conversations inactives oubliées après ce délai
+PERSISTENCE_TTL = float(os.getenv("PERSISTENCE_TTL_HOURS", "168")) * 3600
+# PTB remonte les changements à cet intervalle ; on les écrit en un lot après `debounce`
+PERSISTENCE_INTERVAL = float(os.getenv("PERSISTENCE_INTERVAL", "5"))
+PERSISTENCE_DEBOUNCE = float(os.getenv("PERSISTENCE_DEBOUNCE", "1"))
+
+
+def make_persistence():
+    if PERSISTENCE_BACKEND == "none":
+        return None
+    store = SqliteStateStore(PERSISTENCE_DB) if PERSISTENCE_BACKEND == "sqlite" else MemoryStateStore()
+    return CompactPersistence(store, ttl=PERSISTENCE_TTL, debounce=PERSISTENCE_DEBOUNCE, update_interval=PERSISTENCE_INTERVAL)
+
+
+# Envois vers Telegram (cf. outbound.OutboundScheduler) ; un débit à 0 désactive la limite
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+OUTBOUND_GLOBAL_BURST = float(os.getenv("OUTBOUND_GLOBAL_BURST", "30"))
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+OUTBOUND_CHAT_BURST = float(os.getenv("OUTBOUND_CHAT_BURST", "3"))
+OUTBOUND_GROUP_PER_MINUTE = float(os.getenv("OUTBOUND_GROUP_PER_MINUTE", "20"))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+
+
+def make_outbound():
+    return OutboundScheduler(
+        global_rate=OUTBOUND_GLOBAL_RATE,
+        global_burst=OUTBOUND_GLOBAL_BURST,
+        chat_rate=OUTBOUND_CHAT_RATE,
+        chat_burst=OUTBOUND_CHAT_BURST,
+        group_per_minute=OUTBOUND_GROUP_PER_MINUTE,
+        max_retries=OUTBOUND_MAX_RETRIES,
+    )
+
+
+# Expiration des parcours abandonnés (0 = désactivé)
+IDLE_TIMEOUT = float(os.getenv("IDLE_TIMEOUT_MINUTES", "30")) * 60
+IDLE_NOTICE = os.getenv("IDLE_NOTICE", "1") == "1"
+
+# nom lisible de chaque état (jauge conversations_live{state=...})
+STATE_NAMES = {
+    globals()[name]: name
+    for name in (
+        "PRODUIT", "TYPCOT", "DNAISS", "DUREE", "NBRENTE", "MONTANT", "DNAISS_I", "PERIODE_I", "CAPOBSQ_I",
+        "FER_CHOIX", "FER_DUREE", "FER_MONTANT", "DNAISS_E", "DUREE_PRET", "CAP_PRET", "SEL_MED", "ASK_PDF",
+    )
+}
+# produit de chaque état (label product des latences de handlers)
+STATE_PRODUCTS = {PRODUIT: "menu", **FLOWS.products_by_state(), ASK_PDF: "pdf"}
+
+# Cotations inline (@bot fer C 10) : mode inline à activer auprès de @BotFather (/setinline)
+INLINE_QUOTES = InlineQuoter(
+    FLOWS,
+    aliases={"assur": "assur", "ibekelia": "ibekelia", "fer": "fer", "emp": "emprunteur", "emprunteur": "emprunteur"},
+    memo_size=int(os.getenv("INLINE_MEMO_SIZE", "1024")),
+    debounce=float(os.getenv("INLINE_DEBOUNCE_MS", "300")) / 1000,
+    cache_time=int(os.getenv("INLINE_CACHE_TIME", "60")),
+    # latence de la réponse elle-même (calcul + answerInlineQuery), pas du lancement de la tâche
+    timer=functools.partial(timed_callback, handler="inline_query", state="inline", product="-"),
+)
+
+# Endpoint Prometheus local (GET /metrics) ; 0 = désactivé
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+
+def _warmup():
+    with startup.phase("tables tarifaires (pandas, cache ou Excel)"):
+        load_tables()
+    if TARIF_WATCH_INTERVAL > 0:
+        REGISTRY.start()
+    # gabarits PDF (fpdf, logo décodé, en-têtes) prêts avant la première demande
+    with startup.phase("gabarits PDF (fpdf, logo)"):
+        warm_templates()
+
+
+def start_warmup():
+    """Précharge tables et gabarits PDF dans un thread pendant que le bot se connecte à Telegram.
+    Renvoie un concurrent.futures.Future (attendu par _post_init avant de traiter des updates)."""
+    executor = ThreadPoolExecutor(1, thread_name_prefix="warmup")
+    future = executor.submit(_warmup)
+    executor.shutdown(wait=False)
+    return future
+
+
+async def _wait_warmup(warmup):
+    startup.mark("connexion à Telegram (initialize, getMe)")
+    with startup.phase("attente du préchargement"):
+        try:
+            await asyncio.wrap_future(warmup)
+        except tarifs.TarifError as e:
+            logger.exception("Erreur en lisant les fichiers Excel. Vérifie qu'ils sont présents et nommés correctement.")
+            raise SystemExit(e)
+    logger.info("Tables tarifaires v%d prêtes.", TABLES.version)
+
+
+async def _post_init(application, idle=None, warmup=None, conv_handler=None):
+    if warmup is not None:
+        # aucune update traitée avant que les tables soient installées
+        await _wait_warmup(warmup)
+    if METRICS_PORT:
+        application.create_task(serve_metrics(METRICS_HOST, METRICS_PORT), name="metrics")
+    if idle is not None:
+        application.create_task(idle.run(application), name="idle-sweeper")
+    if isinstance(application.persistence, CompactPersistence) and PERSISTENCE_TTL > 0:
+        application.create_task(
+            evict_idle_loop(application, application.persistence, min(3600.0, PERSISTENCE_TTL / 4),
+                            conv_handlers=(conv_handler,) if conv_handler is not None else ()),
+            name="persistence-evict",
+        )
+
+
+async def _post_shutdown(application):
+    # threads (ou processus) de rendu PDF : sans cela un rendu en cours retarde la sortie
+    PDF_POOL.shutdown()
 
-    application = Application.builder().token(token).build()
+
+def build_application(token: str, builder=None, persistence=None, update_processor=None, warmup=None):
+    """Construit l'Application et enregistre les handlers (utilisé par main() et les outils hors ligne).
+    `builder` permet de passer un ApplicationBuilder préconfiguré (request, updater...),
+    `update_processor` de remplacer le ChatOrderedUpdateProcessor par défaut,
+    `warmup` (cf. start_warmup) d'attendre le préchargement avant la première update.
+    """
+    builder = builder or Application.builder()
+    builder = builder.token(token)
+    if update_processor is not None:
+        builder = builder.concurrent_updates(update_processor)
+    elif CONCURRENT_UPDATES > 1:
+        builder = builder.concurrent_updates(ChatOrderedUpdateProcessor(CONCURRENT_UPDATES))
+    if persistence is not None:
+        builder = builder.persistence(persistence)
+    # limites anti-flood, priorités et nouvel essai sur RetryAfter ; durée des appels
+    # sortants à l'API Bot (telegram_api_seconds{method=...})
+    builder = builder.rate_limiter(make_outbound())
+    application = builder.build()
+    open_file_ids()
 
     # ConversationHandler with multiple entry points (commands) so we can start any parcours at any time
     conv_handler = ConversationHandler(
@@ -964,39 +942,103 @@ def main():
             CommandHandler("ibekelia", start_ibekelia),
             CommandHandler("fer", start_fer),
             CommandHandler("emprunteur", start_emprunteur),
+            CommandHandler("emp", start_emprunteur),
             CommandHandler("selection", start_selection),
         ],
         states={
             PRODUIT: [MessageHandler(filters.TEXT & ~filters.COMMAND, choix_produit)],
-            # Assur'Education states (inchangés)
-            TYPCOT: [MessageHandler(filters.TEXT & ~filters.COMMAND, choix_typcot)],
-            DNAISS: [MessageHandler(filters.TEXT & ~filters.COMMAND, saisie_ddnaiss)],
-            DUREE: [MessageHandler(filters.TEXT & ~filters.COMMAND, saisie_duree)],
-            NBRENTE: [MessageHandler(filters.TEXT & ~filters.COMMAND, saisie_nb_rente)],
-            MONTANT: [MessageHandler(filters.TEXT & ~filters.COMMAND, saisie_montant)],
-            # IBEKELIA states (inchangés)
-            DNAISS_I: [MessageHandler(filters.TEXT & ~filters.COMMAND, saisie_ddnaiss_i)],
-            PERIODE_I: [MessageHandler(filters.TEXT & ~filters.COMMAND, saisie_periode)],
-            CAPOBSQ_I: [MessageHandler(filters.TEXT & ~filters.COMMAND, saisie_capobsq)],
-            # FER+ states (nouveau)
-            FER_CHOIX: [MessageHandler(filters.TEXT & ~filters.COMMAND, fer_choix)],
-            FER_DUREE: [MessageHandler(filters.TEXT & ~filters.COMMAND, fer_duree)],
-            FER_MONTANT: [MessageHandler(filters.TEXT & ~filters.COMMAND, fer_montant)],
-            # EMPRUNTEUR states (nouveau)
-            DNAISS_E: [MessageHandler(filters.TEXT & ~filters.COMMAND, saisie_ddnaiss_e)],
-            DUREE_PRET: [MessageHandler(filters.TEXT & ~filters.COMMAND, saisie_duree_pret)],
-            CAP_PRET: [MessageHandler(filters.TEXT & ~filters.COMMAND, saisie_cap_pret)],
+            # parcours produits (Assur'Education, IBEKELIA, FER+, Emprunteur)
+            **FLOWS.states(),
             # ASK PDF
-            ASK_PDF: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_pdf_choice)],
+            ASK_PDF: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_pdf_choice),
+                CallbackQueryHandler(handle_pdf_button, pattern=choice_pattern(ASK_PDF)),
+            ],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
         allow_reentry=True,
+        name="cotation",
+        persistent=persistence is not None,
     )
+    # textes d'un même tour regroupés en un seul message (cf. compose)
+    compose_conversation(conv_handler)
+    # latence et erreurs par handler, état et produit (handler_seconds, handler_errors_total) ;
+    # appliqué après compose pour que l'envoi groupé de fin de tour soit compté
+    instrument_conversation(conv_handler, STATE_NAMES, STATE_PRODUCTS)
 
     application.add_handler(conv_handler)
+    # boutons d'un message dépassé (autre état, conversation terminée) : acquittés quand même
+    application.add_handler(CallbackQueryHandler(expired_choice))
+    application.add_handler(InlineQueryHandler(INLINE_QUOTES.handle))
+
+    idle = None
+    if IDLE_TIMEOUT > 0:
+        idle = IdleSweeper(conv_handler, IDLE_TIMEOUT, STATE_NAMES, notice=IDLE_NOTICE, quiet_states=(PRODUIT,))
+        idle.install(application)
+    application.post_init = functools.partial(_post_init, idle=idle, warmup=warmup, conv_handler=conv_handler)
+    application.post_shutdown = _post_shutdown
+    return application
+
+
+async def profile_startup(application, warmup):
+    """--profile-startup : connexion et préchargement comme au démarrage, sans traiter d'update,
+    puis durée de chaque phase."""
+    initialized = False
+    try:
+        await application.initialize()
+        initialized = True
+    except Exception as e:
+        logger.warning("Connexion à Telegram impossible (%s) : phase mesurée jusqu'à l'échec.", e)
+    await _wait_warmup(warmup)
+    if initialized:
+        await application.shutdown()
+    REGISTRY.stop()
+    print(startup.report())
+
+
+def main():
+    # JSON (LOG_FORMAT=text pour l'ancien format), écriture par un thread de fond, messages
+    # répétitifs limités puis échantillonnés (cf. logs.py)
+    logs.setup_logging()
+    if BOT_MODE == "webhook":
+        # refus avant tout démarrage : webhook exposé sans jeton secret
+        error = check_exposure(WEBHOOK_HOST, WEBHOOK_SECRET)
+        if error:
+            logger.error("%s Définissez WEBHOOK_SECRET ou WEBHOOK_HOST=127.0.0.1.", error)
+            sys.exit(1)
+    startup.mark("configuration (registre, stores, parcours)")
+    # tables et gabarits PDF se chargent pendant la construction de l'Application et la connexion
+    warmup = start_warmup()
+
+    token = os.getenv("TELEGRAM_TOKEN", "8484290771:AAGiLz1F20DegARHyx2-xVV5OlyOLVUfipA")
+    if token == "8484290771:AAGiLz1F20DegARHyx2-xVV5OlyOLVUfipA":
+        logger.warning("Vous utilisez la valeur par défaut pour le token. Remplacez-la par votre token ou définissez TELEGRAM_TOKEN.")
 
-    logger.info("Bot démarré. En attente de messages...")
-    application.run_polling()
+    if BOT_MODE == "webhook":
+        # pas d'Updater : les updates arrivent par le serveur HTTP local
+        application = build_application(token, Application.builder().updater(None), make_persistence(), warmup=warmup)
+    else:
+        application = build_application(token, persistence=make_persistence(), warmup=warmup)
+    startup.mark("construction de l'Application")
+
+    if "--profile-startup" in sys.argv[1:]:
+        asyncio.run(profile_startup(application, warmup))
+        return
+
+    logger.info("Bot démarré en mode %s. En attente de messages...", BOT_MODE)
+    if BOT_MODE == "webhook":
+        asyncio.run(
+            run_webhook(
+                application,
+                url=WEBHOOK_URL,
+                secret_token=WEBHOOK_SECRET,
+                path=WEBHOOK_PATH,
+                host=WEBHOOK_HOST,
+                port=WEBHOOK_PORT,
+            )
+        )
+    else:
+        application.run_polling()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,160 @@
+# metrics.py
+# Compteurs, jauges et histogrammes en mémoire (sans dépendance externe).
+import threading
+
+# bornes (secondes) par défaut des histogrammes de latence
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class Gauge:
+    """Valeur instantanée ; `fn` permet une jauge calculée à la lecture."""
+
+    def __init__(self, fn=None):
+        self.fn = fn
+        self._value = 0
+
+    def set(self, value: float):
+        self._value = value
+
+    def inc(self, amount: float = 1):
+        self._value += amount
+
+    def dec(self, amount: float = 1):
+        self._value -= amount
+
+    @property
+    def value(self):
+        return self.fn() if self.fn is not None else self._value
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = 0
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q: float):
+        """Estimation (borne supérieure du seau) du quantile q, ou None sans observation."""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+# -------------------------
+# Registre global : (nom, labels) -> métrique
+# -------------------------
+_REGISTRY = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _get(kind, name: str, labels: dict, factory):
+    key = (name, tuple(sorted(labels.items())))
+    metric = _REGISTRY.get(key)
+    if metric is None:
+        with _REGISTRY_LOCK:
+            metric = _REGISTRY.get(key)
+            if metric is None:
+                metric = _REGISTRY[key] = factory()
+    if not isinstance(metric, kind):
+        raise TypeError(f"La métrique {name} existe déjà avec un autre type.")
+    return metric
+
+
+def counter(name: str, **labels) -> Counter:
+    return _get(Counter, name, labels, Counter)
+
+
+def gauge(name: str, fn=None, **labels) -> Gauge:
+    g = _get(Gauge, name, labels, lambda: Gauge(fn))
+    if fn is not None:
+        g.fn = fn
+    return g
+
+
+def histogram(name: str, buckets=DEFAULT_BUCKETS, **labels) -> Histogram:
+    return _get(Histogram, name, labels, lambda: Histogram(buckets))
+
+
+def snapshot() -> dict:
+    """Copie lisible de toutes les métriques : {(nom, labels): valeur ou résumé}."""
+    out = {}
+    for (name, labels), m in list(_REGISTRY.items()):
+        if isinstance(m, Histogram):
+            out[(name, labels)] = {"count": m.count, "sum": m.sum, "p50": m.quantile(0.5), "p95": m.quantile(0.95)}
+        else:
+            out[(name, labels)] = m.value
+    return out
+
+
+# -------------------------
+# Exposition au format texte Prometheus (calculée à la lecture uniquement)
+# -------------------------
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels, extra=()) -> str:
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus() -> str:
+    """Toutes les métriques au format d'exposition texte Prometheus 0.0.4."""
+    by_name = {}
+    for (name, labels), m in list(_REGISTRY.items()):
+        by_name.setdefault(name, []).append((labels, m))
+    lines = []
+    for name in sorted(by_name):
+        series = sorted(by_name[name], key=lambda item: item[0])
+        first = series[0][1]
+        kind = "histogram" if isinstance(first, Histogram) else "counter" if isinstance(first, Counter) else "gauge"
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, m in series:
+            if isinstance(m, Histogram):
+                with m._lock:
+                    counts, count, total = list(m.counts), m.count, m.sum
+                seen = 0
+                for bound, n in zip(m.buckets + (float("inf"),), counts):
+                    seen += n
+                    lines.append(f"{name}_bucket{_labels(labels, (('le', _number(bound)),))} {seen}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+                lines.append(f"{name}_count{_labels(labels)} {count}")
+            else:
+                lines.append(f"{name}{_labels(labels)} {_number(m.value)}")
+    return "\n".join(lines) + "\n"
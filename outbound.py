@@ -0,0 +1,219 @@
+# outbound.py
+# Ordonnanceur des envois vers l'API Bot : seaux à jetons par chat et global (limites
+# anti-flood de Telegram), files de priorité pour le jeton global, nouvel essai
+# automatique sur RetryAfter. Branché comme rate limiter PTB (ApplicationBuilder.rate_limiter).
+#
+# Priorité : contexte `lane(HIGH|NORMAL|LOW)` autour des envois d'un handler, ex.
+#     with outbound.lane(outbound.LOW):
+#         await update.message.reply_text(menu)
+import time
+import heapq
+import asyncio
+import logging
+import datetime
+import itertools
+import contextlib
+import contextvars
+
+from telegram.error import RetryAfter
+
+import metrics
+from instrument import ApiTimer
+
+logger = logging.getLogger(__name__)
+
+# files de priorité (la plus petite valeur passe en premier)
+HIGH, NORMAL, LOW = 0, 1, 2
+LANE_NAMES = ("high", "normal", "low")
+
+# au-delà, les seaux de chats inactifs (pleins) sont purgés
+MAX_CHAT_BUCKETS = 10000
+
+_lane = contextvars.ContextVar("outbound_lane", default=NORMAL)
+
+
+@contextlib.contextmanager
+def lane(priority: int):
+    """Priorité des envois faits dans ce bloc (tâche asyncio courante)."""
+    token = _lane.set(priority)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def current_lane() -> int:
+    return _lane.get()
+
+
+def _seconds(retry_after) -> float:
+    # PTB >= 22 : timedelta (int auparavant)
+    if isinstance(retry_after, datetime.timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class _Bucket:
+    """Seau à jetons : `rate` jetons par seconde, au plus `burst` en réserve."""
+
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def delay(self, now: float) -> float:
+        """Attente avant qu'un jeton soit disponible (0 : tout de suite)."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def reserve(self, now: float) -> float:
+        """Prend un jeton, éventuellement à crédit ; renvoie l'attente correspondante.
+        Les envois successifs d'un même chat sont ainsi espacés dans l'ordre d'arrivée."""
+        self._refill(now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class _PriorityGate:
+    """Jeton global distribué par priorité (puis dans l'ordre d'arrivée) ; `rate` 0 = illimité.
+    pause() suspend toute distribution (RetryAfter)."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._bucket = None
+        self._heap = []
+        self._seq = itertools.count()
+        self._task = None
+        self.paused_until = 0.0
+        self.waiting = [0] * len(LANE_NAMES)
+
+    def _delay(self, now: float) -> float:
+        if self._bucket is None:
+            if not self.rate:
+                return max(0.0, self.paused_until - now)
+            self._bucket = _Bucket(self.rate, self.burst, now)
+        return max(self.paused_until - now, self._bucket.delay(now))
+
+    def _take(self, now: float):
+        if self._bucket is not None:
+            self._bucket.take(now)
+
+    async def acquire(self, priority: int):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if not self._heap and self._delay(now) <= 0:
+            self._take(now)
+            return
+        fut = loop.create_future()
+        heapq.heappush(self._heap, (priority, next(self._seq), fut))
+        self.waiting[priority] += 1
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._dispatch())
+        await fut
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while self._heap:
+            delay = self._delay(loop.time())
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            priority, _, fut = heapq.heappop(self._heap)
+            self.waiting[priority] -= 1
+            if fut.done():
+                # demandeur annulé entre-temps
+                continue
+            self._take(loop.time())
+            fut.set_result(None)
+
+    def pause(self, seconds: float):
+        until = asyncio.get_running_loop().time() + seconds
+        self.paused_until = max(self.paused_until, until)
+
+
+class OutboundScheduler(ApiTimer):
+    """Rate limiter PTB : espace les envois par chat (`chat_rate`/s, rafale `chat_burst` ;
+    `group_per_minute` pour les groupes), limite le débit global (`global_rate`/s, rafale
+    `global_burst`, servi par priorité) et renvoie jusqu'à `max_retries` fois sur RetryAfter
+    après une pause globale. Les requêtes sans chat_id (getMe, answerCallbackQuery...) ne
+    consomment aucun jeton. Un débit à 0 désactive la limite correspondante.
+    """
+
+    __slots__ = ("chat_rate", "chat_burst", "group_rate", "max_retries", "_gate", "_chats", "_delayed",
+                 "_wait_hist", "_send_hist", "_retries")
+
+    def __init__(self, global_rate: float = 30.0, global_burst: float = 30.0, chat_rate: float = 1.0,
+                 chat_burst: float = 3.0, group_per_minute: float = 20.0, max_retries: int = 3):
+        super().__init__()
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_per_minute / 60.0
+        self.max_retries = max_retries
+        self._gate = _PriorityGate(global_rate, global_burst)
+        self._chats = {}
+        self._delayed = 0
+        for i, name in enumerate(LANE_NAMES):
+            metrics.gauge("outbound_queue_depth", fn=lambda i=i: self._gate.waiting[i], lane=name)
+        metrics.gauge("outbound_chat_delayed", fn=lambda: self._delayed)
+        self._wait_hist = [metrics.histogram("outbound_wait_seconds", lane=name) for name in LANE_NAMES]
+        self._send_hist = [metrics.histogram("outbound_send_seconds", lane=name) for name in LANE_NAMES]
+        self._retries = metrics.counter("outbound_retry_after_total")
+
+    def _chat_delay(self, chat_id, now: float) -> float:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            group = isinstance(chat_id, int) and chat_id < 0
+            rate = self.group_rate if group else self.chat_rate
+            if not rate:
+                return 0.0
+            if len(self._chats) >= MAX_CHAT_BUCKETS:
+                self._chats = {k: b for k, b in self._chats.items() if not b.idle(now)}
+            bucket = self._chats[chat_id] = _Bucket(rate, 1.0 if group else self.chat_burst, now)
+        return bucket.reserve(now)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id")
+        priority = _lane.get()
+        t0 = time.perf_counter()
+        if chat_id is not None:
+            delay = self._chat_delay(chat_id, asyncio.get_running_loop().time())
+            if delay > 0:
+                self._delayed += 1
+                try:
+                    await asyncio.sleep(delay)
+                finally:
+                    self._delayed -= 1
+        for attempt in range(self.max_retries + 1):
+            if chat_id is not None or self._gate.paused_until > asyncio.get_running_loop().time():
+                await self._gate.acquire(priority)
+            if attempt == 0 and chat_id is not None:
+                self._wait_hist[priority].observe(time.perf_counter() - t0)
+            try:
+                result = await super().process_request(callback, args, kwargs, endpoint, data, rate_limit_args)
+            except RetryAfter as e:
+                self._retries.inc()
+                if attempt >= self.max_retries:
+                    raise
+                seconds = _seconds(e.retry_after)
+                logger.warning("Limite de débit Telegram (%s) : pause de %.1fs avant nouvel essai.", endpoint, seconds)
+                self._gate.pause(seconds)
+                continue
+            if chat_id is not None:
+                self._send_hist[priority].observe(time.perf_counter() - t0)
+            return result
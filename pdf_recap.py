@@ -0,0 +1,614 @@
+# pdf_recap.py
+# Génération des PDF récapitulatifs, hors de la boucle asyncio du bot.
+import os
+import copy
+import json
+import sqlite3
+import hashlib
+import time
+import asyncio
+import logging
+import datetime
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+LOGO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Logo_sunu.jpg")
+
+
+def _fpdf():
+    """Classe FPDF, importée au premier rendu ou à warm_templates() (démarrage du bot plus court)."""
+    from fpdf import FPDF
+    return FPDF
+
+
+def generate_pdf_bytes_fpdf(recap: dict) -> bytes:
+    """Rendu de référence : construit tout le document avec FPDF (relit et décode le logo).
+    Sert de repli au rendu par gabarit et de point de comparaison pour les benchmarks.
+    """
+    pdf = _fpdf()()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.add_page()
+
+    # Logo (en haut à gauche) si présent
+    if os.path.exists(LOGO_PATH):
+        try:
+            pdf.image(LOGO_PATH, x=10, y=8, w=30)
+        except Exception:
+            logger.warning("Impossible d'insérer Logo_sunu.jpg dans le PDF (format/police).")
+
+    # Titre
+    pdf.set_font("Arial", "B", 14)
+    pdf.cell(0, 10, f"Simulation - {recap.get('product', '')}", ln=1, align="C")
+    pdf.ln(6)
+
+    # Informations saisies
+    pdf.set_font("Arial", "B", 12)
+    pdf.cell(0, 8, "Informations saisies :", ln=1)
+    pdf.set_font("Arial", size=11)
+    inputs = recap.get("inputs", {})
+    for k, v in inputs.items():
+        pdf.multi_cell(0, 7, f"- {k}: {v}")
+
+    _fill_results(pdf, recap)
+    return _output_bytes(pdf.output(dest='S'))
+
+
+def _fill_results(pdf, recap: dict, line=None):
+    """Partie variable commune aux deux rendus, après la liste des informations saisies."""
+    line = line or (lambda text: pdf.multi_cell(0, 7, text))
+    pdf.ln(3)
+
+    # Résultats (personnalisation légère selon produit)
+    pdf.set_font("Arial", "B", 12)
+    pdf.cell(0, 8, "Résultats :", ln=1)
+    pdf.set_font("Arial", size=11)
+    results = recap.get("results", {})
+    for k, v in results.items():
+        line(f"- {k}: {v}")
+
+    pdf.ln(6)
+    pdf.set_font("Arial", "I", 9)
+    pdf.cell(0, 5, "Généré le: " + datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), ln=1, align="R")
+
+
+def _output_bytes(out) -> bytes:
+    if isinstance(out, str):
+        return out.encode('latin-1')
+    return out
+
+
+# -------------------------
+# Rendu par gabarit : une page prototype par produit (logo déjà décodé, en-tête posé)
+# -------------------------
+# le gabarit s'appuie sur les internes de PyFPDF 1.7 ; sinon rendu de référence
+# (None : pas encore vérifié, fpdf n'est pas importé)
+_TEMPLATES_SUPPORTED = None
+_templates = {}
+_templates_lock = threading.Lock()
+_logo_info = None
+
+
+def _templates_supported() -> bool:
+    global _TEMPLATES_SUPPORTED
+    if _TEMPLATES_SUPPORTED is None:
+        FPDF = _fpdf()
+        _TEMPLATES_SUPPORTED = all(hasattr(FPDF, m) for m in ("_putpages", "_putresources", "_putinfo", "_putcatalog", "_parsejpg"))
+    return _TEMPLATES_SUPPORTED
+
+
+def _load_logo():
+    """Lit et analyse Logo_sunu.jpg une seule fois ; données gardées en latin-1 (format attendu par FPDF._out)."""
+    global _logo_info
+    if _logo_info is None:
+        info = {}
+        if os.path.exists(LOGO_PATH):
+            try:
+                info = _fpdf()()._parsejpg(LOGO_PATH)
+                info["data"] = info["data"].decode("latin1")
+            except Exception:
+                logger.warning("Impossible d'insérer Logo_sunu.jpg dans le PDF (format/police).")
+                info = {}
+        _logo_info = info
+    return _logo_info
+
+
+_max_widths = {}
+
+
+def _max_width(cw: dict) -> int:
+    m = _max_widths.get(id(cw))
+    if m is None:
+        m = _max_widths[id(cw)] = max(cw.values())
+    return m
+
+
+class _RecapTemplate:
+    """Page prototype d'un produit : logo, titre et en-tête « Informations saisies » déjà tracés.
+
+    Chaque rendu clone le prototype, ajoute les lignes inputs/results puis assemble le
+    document en réutilisant le bloc de ressources (polices + logo) sérialisé une fois.
+    """
+
+    def __init__(self, product: str):
+        pdf = _fpdf()()
+        pdf.set_auto_page_break(auto=True, margin=15)
+        pdf.add_page()
+        logo = _load_logo()
+        if logo:
+            pdf.images[LOGO_PATH] = dict(logo, i=1)
+            pdf.image(LOGO_PATH, x=10, y=8, w=30)
+        pdf.set_font("Arial", "B", 14)
+        pdf.cell(0, 10, f"Simulation - {product}", ln=1, align="C")
+        pdf.ln(6)
+        pdf.set_font("Arial", "B", 12)
+        pdf.cell(0, 8, "Informations saisies :", ln=1)
+        pdf.set_font("Arial", size=11)
+        self.proto = pdf
+        self._resources = {}
+
+    def _clone(self):
+        proto = self.proto
+        pdf = copy.copy(proto)
+        pdf.pages = dict(proto.pages)
+        pdf.fonts = {k: dict(v) for k, v in proto.fonts.items()}
+        pdf.current_font = pdf.fonts[proto.font_family + proto.font_style]
+        pdf.images = {k: dict(v) for k, v in proto.images.items()}
+        pdf.offsets = {}
+        pdf.page_links = {}
+        pdf.links = {}
+        pdf.orientation_changes = dict(proto.orientation_changes)
+        return pdf
+
+    @staticmethod
+    def _line(pdf, text: str):
+        """multi_cell(0, 7, text) pour une ligne qui tient sur la largeur ; sinon FPDF."""
+        cw = pdf.current_font["cw"]
+        w = pdf.w - pdf.r_margin - pdf.x
+        wmax = (w - 2 * pdf.c_margin) * 1000.0 / pdf.font_size
+        # majorant (largeur du glyphe le plus large) avant le calcul exact caractère par caractère
+        fits = len(text) * _max_width(cw) <= wmax or sum(cw.get(c, 0) for c in text) <= wmax
+        if (
+            not fits or pdf.ws > 0 or pdf.unifontsubset or pdf.color_flag or pdf.underline
+            or "\n" in text or "\r" in text or pdf.y + 7 > pdf.page_break_trigger
+        ):
+            pdf.multi_cell(0, 7, text)
+            return
+        if text:
+            k = pdf.k
+            escaped = text.replace("\\", "\\\\").replace(")", "\\)").replace("(", "\\(")
+            pdf.pages[pdf.page] += "BT %.2f %.2f Td (%s) Tj ET\n" % (
+                (pdf.x + pdf.c_margin) * k, (pdf.h - (pdf.y + 3.5 + .3 * pdf.font_size)) * k, escaped)
+        pdf.lasth = 7
+        pdf.y += 7
+        pdf.x = pdf.l_margin
+
+    def _resources_block(self, pdf):
+        """Objets polices + images + dictionnaire de ressources, sérialisés une fois par configuration."""
+        key = (pdf.n, tuple(pdf.fonts), tuple(pdf.images))
+        block = self._resources.get(key)
+        if block is None:
+            scratch = copy.copy(pdf)
+            scratch.fonts = {k: dict(v) for k, v in pdf.fonts.items()}
+            scratch.images = {k: dict(v) for k, v in pdf.images.items()}
+            scratch.offsets = {}
+            scratch.buffer = ""
+            scratch._putresources()
+            block = self._resources[key] = (scratch.buffer.encode("latin-1"), dict(scratch.offsets), scratch.n)
+        return block
+
+    def render(self, recap: dict) -> bytes:
+        pdf = self._clone()
+        line = lambda text: self._line(pdf, text)
+        for k, v in recap.get("inputs", {}).items():
+            line(f"- {k}: {v}")
+        _fill_results(pdf, recap, line)
+        if pdf.page != 1:
+            # débordement sur une 2e page : assemblage standard
+            return _output_bytes(pdf.output(dest='S'))
+
+        # équivalent de FPDF._enddoc, sans recopier le logo dans le tampon à chaque ligne
+        pdf.state = 1
+        pdf.buffer = ""
+        pdf._putheader()
+        pdf._putpages()
+        head = pdf.buffer
+        block, rel_offsets, pdf.n = self._resources_block(pdf)
+        base = len(head)
+        for obj, off in rel_offsets.items():
+            pdf.offsets[obj] = base + off
+
+        parts = [head.encode("latin-1"), block]
+        pos = base + len(block)
+        for put in (pdf._putinfo, pdf._putcatalog):
+            pdf.n += 1
+            pdf.offsets[pdf.n] = pos
+            pdf.buffer = ""
+            put()
+            chunk = ("%d 0 obj\n<<\n%s>>\nendobj\n" % (pdf.n, pdf.buffer)).encode("latin-1")
+            parts.append(chunk)
+            pos += len(chunk)
+        xref = ["xref", "0 %d" % (pdf.n + 1), "0000000000 65535 f "]
+        xref += ["%010d 00000 n " % pdf.offsets[i] for i in range(1, pdf.n + 1)]
+        xref += ["trailer", "<<", "/Size %d" % (pdf.n + 1), "/Root %d 0 R" % pdf.n, "/Info %d 0 R" % (pdf.n - 1),
+                 ">>", "startxref", str(pos), "%%EOF", ""]
+        parts.append("\n".join(xref).encode("latin-1"))
+        pdf.state = 3
+        return b"".join(parts)
+
+
+def _template(product: str) -> _RecapTemplate:
+    tpl = _templates.get(product)
+    if tpl is None:
+        with _templates_lock:
+            tpl = _templates.get(product)
+            if tpl is None:
+                tpl = _templates[product] = _RecapTemplate(product)
+    return tpl
+
+
+def warm_templates(products=("Assur'Education", "IBEKELIA", "FER+", "Emprunteur")):
+    """Prépare les gabarits (et le logo) avant les premières demandes."""
+    if _templates_supported():
+        for product in products:
+            _template(product)
+
+
+def generate_pdf_bytes(recap: dict) -> bytes:
+    """Génère un PDF en mémoire (bytes) à partir du récapitulatif fourni.
+    recap doit contenir : product (str), title (str), inputs (dict), results (dict)
+    """
+    if _templates_supported():
+        try:
+            return _template(str(recap.get("product", ""))).render(recap)
+        except Exception:
+            logger.exception("Rendu PDF par gabarit impossible, rendu complet.")
+    return generate_pdf_bytes_fpdf(recap)
+
+
+def _render_timed(recap: dict):
+    """Exécuté dans le pool : retourne (bytes, durée de rendu en secondes)."""
+    t0 = time.perf_counter()
+    data = generate_pdf_bytes(recap)
+    return data, time.perf_counter() - t0
+
+
+# -------------------------
+# Cache des PDF par contenu (LRU mémoire + répertoire disque)
+# -------------------------
+def recap_digest(recap: dict) -> str:
+    """Empreinte canonique d'un récapitulatif : produit, titre, inputs et results (dans leur ordre).
+    L'horodatage « Généré le » et les métadonnées (tarif_version...) n'entrent pas dans l'empreinte.
+    """
+    canonical = [
+        recap.get("product", ""),
+        recap.get("title", ""),
+        list(recap.get("inputs", {}).items()),
+        list(recap.get("results", {}).items()),
+    ]
+    payload = json.dumps(canonical, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PdfCache:
+    """Cache de PDF indexé par recap_digest, borné en octets à chaque niveau.
+
+    - mémoire : LRU (OrderedDict) d'au plus `max_bytes` octets ;
+    - disque  : fichiers <empreinte>.pdf dans `directory`, au plus `max_disk_bytes`
+      octets, les moins récemment utilisés supprimés en premier (désactivé si directory est vide).
+
+    Depuis la boucle asyncio, seul le niveau mémoire (get_memory / put_memory) est appelé ;
+    get_disk / put_disk font des entrées-sorties et passent par un thread (cf. PdfRenderPool).
+
+    Métriques : pdf_cache_hits_total{level=memory|disk}, pdf_cache_misses_total,
+    pdf_cache_evictions_total{level=...}, pdf_cache_bytes{level=...}.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, directory: str = "", max_disk_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self._mem = OrderedDict()
+        self._mem_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._hits_mem = metrics.counter("pdf_cache_hits_total", level="memory")
+        self._hits_disk = metrics.counter("pdf_cache_hits_total", level="disk")
+        self._misses = metrics.counter("pdf_cache_misses_total")
+        self._evict_mem = metrics.counter("pdf_cache_evictions_total", level="memory")
+        self._evict_disk = metrics.counter("pdf_cache_evictions_total", level="disk")
+        metrics.gauge("pdf_cache_bytes", fn=lambda: self._mem_bytes, level="memory")
+        metrics.gauge("pdf_cache_bytes", fn=lambda: self._disk_bytes, level="disk")
+        # répertoire créé à la première écriture, pas à la construction
+        if directory and os.path.isdir(directory):
+            self._disk_bytes = sum(e.stat().st_size for e in os.scandir(directory) if e.name.endswith(".pdf"))
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pdf")
+
+    def get(self, key: str):
+        """Recherche mémoire puis disque (bloquant)."""
+        data = self.get_memory(key)
+        return data if data is not None else self.get_disk(key)
+
+    def put(self, key: str, data: bytes):
+        """Stockage mémoire et disque (bloquant)."""
+        self.put_memory(key, data)
+        self.put_disk(key, data)
+
+    def get_memory(self, key: str):
+        with self._lock:
+            data = self._mem.get(key)
+            if data is not None:
+                self._mem.move_to_end(key)
+                self._hits_mem.inc()
+        return data
+
+    def get_disk(self, key: str):
+        """Niveau disque (entrées-sorties : hors de la boucle asyncio) ; un succès remonte en mémoire."""
+        if self.directory:
+            try:
+                with open(self._path(key), "rb") as f:
+                    data = f.read()
+                os.utime(self._path(key))
+            except OSError:
+                data = None
+            if data is not None:
+                self._hits_disk.inc()
+                self.put_memory(key, data)
+                return data
+        self._misses.inc()
+        return None
+
+    def put_memory(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._mem.pop(key, None)
+            if old is not None:
+                self._mem_bytes -= len(old)
+            self._mem[key] = data
+            self._mem_bytes += len(data)
+            while self._mem_bytes > self.max_bytes:
+                _, evicted = self._mem.popitem(last=False)
+                self._mem_bytes -= len(evicted)
+                self._evict_mem.inc()
+
+    def put_disk(self, key: str, data: bytes):
+        """Écriture et éviction disque (entrées-sorties : hors de la boucle asyncio)."""
+        if not self.directory:
+            return
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            logger.warning("Écriture impossible dans le cache PDF %s.", self.directory)
+            return
+        with self._lock:
+            self._disk_bytes += len(data)
+            if self._disk_bytes <= self.max_disk_bytes:
+                return
+            # éviction : fichiers les moins récemment utilisés (mtime) d'abord
+            entries = sorted(
+                (e for e in os.scandir(self.directory) if e.name.endswith(".pdf")),
+                key=lambda e: e.stat().st_mtime,
+            )
+            for entry in entries:
+                if self._disk_bytes <= self.max_disk_bytes:
+                    break
+                try:
+                    size = entry.stat().st_size
+                    os.remove(entry.path)
+                except OSError:
+                    continue
+                self._disk_bytes -= size
+                self._evict_disk.inc()
+
+    def stats(self) -> dict:
+        return {
+            "hits_memory": self._hits_mem.value,
+            "hits_disk": self._hits_disk.value,
+            "misses": self._misses.value,
+            "evictions_memory": self._evict_mem.value,
+            "evictions_disk": self._evict_disk.value,
+            "entries_memory": len(self._mem),
+            "bytes_memory": self._mem_bytes,
+            "bytes_disk": self._disk_bytes,
+        }
+
+
+# -------------------------
+# file_id Telegram des PDF déjà envoyés (renvoi sans ré-upload)
+# -------------------------
+class FileIdStore:
+    """Table SQLite empreinte du récapitulatif -> file_id Telegram.
+
+    Chaque entrée est liée à l'empreinte des tables tarifaires (`tarif`) en vigueur lors
+    de l'envoi : un file_id n'est réutilisé que pour les mêmes tables, et set_tarif()
+    purge les entrées des versions précédentes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS file_ids ("
+            "recap_key TEXT PRIMARY KEY, tarif TEXT NOT NULL, file_id TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._db.commit()
+        self._sent_file_id = metrics.counter("pdf_sent_total", via="file_id")
+        self._sent_upload = metrics.counter("pdf_sent_total", via="upload")
+
+    def get(self, recap_key: str, tarif: str):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT file_id FROM file_ids WHERE recap_key = ? AND tarif = ?", (recap_key, tarif)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, recap_key: str, tarif: str, file_id: str):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO file_ids (recap_key, tarif, file_id, created) VALUES (?, ?, ?, ?)",
+                (recap_key, tarif, file_id, time.time()),
+            )
+            self._db.commit()
+
+    def discard(self, recap_key: str):
+        with self._lock:
+            self._db.execute("DELETE FROM file_ids WHERE recap_key = ?", (recap_key,))
+            self._db.commit()
+
+    def set_tarif(self, tarif: str):
+        """Nouvelles tables tarifaires : les file_id des versions précédentes sont supprimés."""
+        with self._lock:
+            n = self._db.execute("DELETE FROM file_ids WHERE tarif != ?", (tarif,)).rowcount
+            self._db.commit()
+        if n:
+            logger.info("%d file_id PDF invalidés (changement de tables tarifaires).", n)
+
+    def record_sent(self, via_file_id: bool):
+        (self._sent_file_id if via_file_id else self._sent_upload).inc()
+
+
+# -------------------------
+# Pool de rendu borné (file d'attente, contre-pression, délai maximal)
+# -------------------------
+def _log_cache_error(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning("Écriture du cache PDF impossible : %s", future.exception())
+
+
+def _call_soon(loop, fn):
+    # appelé depuis un thread du pool ; la boucle peut déjà être fermée à l'arrêt
+    try:
+        loop.call_soon_threadsafe(fn)
+    except RuntimeError:
+        pass
+
+
+class PdfQueueFull(Exception):
+    """Trop de PDF en attente : la demande est refusée plutôt que mise en file."""
+
+
+class PdfRenderPool:
+    """Rend les PDF dans un pool de threads (ou de processus) sans bloquer la boucle asyncio.
+
+    - au plus `workers` rendus simultanés ;
+    - au plus `max_queue` demandes en attente, au-delà PdfQueueFull est levée ;
+    - `timeout` secondes maximum entre la demande et le PDF (asyncio.TimeoutError) ;
+    - avec un `cache` (PdfCache), un récapitulatif déjà rendu est servi sans passer par la file.
+
+    Métriques : pdf_queue_depth, pdf_in_flight, pdf_render_seconds, pdf_wait_seconds,
+    pdf_rejected_total, pdf_timeout_total.
+    """
+
+    def __init__(self, workers: int = 2, max_queue: int = 20, timeout: float = 30.0, kind: str = "thread", cache=None):
+        self.workers = max(1, workers)
+        self.cache = cache
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.kind = kind
+        self._executor = None
+        self._slots = None
+        self._waiting = 0
+        self._in_flight = 0
+        metrics.gauge("pdf_queue_depth", fn=lambda: self._waiting)
+        metrics.gauge("pdf_in_flight", fn=lambda: self._in_flight)
+        self._render_hist = metrics.histogram("pdf_render_seconds")
+        self._wait_hist = metrics.histogram("pdf_wait_seconds")
+        self._rejected = metrics.counter("pdf_rejected_total")
+        self._timeouts = metrics.counter("pdf_timeout_total")
+
+    def _ensure_started(self):
+        if self._executor is None:
+            if self.kind == "process":
+                # spawn : pas de fork d'un processus qui contient déjà des threads
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="pdf")
+            self._slots = asyncio.Semaphore(self.workers)
+
+    async def render(self, recap: dict) -> bytes:
+        key = None
+        cache = self.cache
+        if cache is not None:
+            key = recap_digest(recap)
+            data = cache.get_memory(key)
+            if data is None:
+                # niveau disque lu dans un thread : la boucle continue de servir les autres chats
+                data = await self._cache_io(cache.get_disk, key) if cache.directory else cache.get_disk(key)
+            if data is not None:
+                return data
+        data = await self._render_queued(recap)
+        if key is not None:
+            cache.put_memory(key, data)
+            if cache.directory:
+                # écriture (et éviction) disque en arrière-plan, sans retarder l'envoi
+                self._cache_io(cache.put_disk, key, data).add_done_callback(_log_cache_error)
+        return data
+
+    def _cache_io(self, fn, *args):
+        """Entrées-sorties du cache disque dans le pool de threads par défaut de la boucle
+        (pas dans le pool de rendu : un accès disque n'occupe pas de slot de rendu)."""
+        return asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    async def _render_queued(self, recap: dict) -> bytes:
+        self._ensure_started()
+        if self._waiting >= self.max_queue:
+            self._rejected.inc()
+            raise PdfQueueFull(f"{self._waiting} PDF déjà en attente")
+        # compté en attente dès l'appel, jusqu'à l'obtention d'un slot de rendu
+        self._waiting += 1
+        ticket = {"queued": True}
+        try:
+            return await asyncio.wait_for(self._render(recap, ticket), self.timeout)
+        except asyncio.TimeoutError:
+            self._timeouts.inc()
+            raise
+        finally:
+            if ticket["queued"]:
+                self._waiting -= 1
+
+    async def _render(self, recap: dict, ticket: dict) -> bytes:
+        t0 = time.perf_counter()
+        await self._slots.acquire()
+        ticket["queued"] = False
+        self._waiting -= 1
+        self._wait_hist.observe(time.perf_counter() - t0)
+        self._in_flight += 1
+        loop = asyncio.get_running_loop()
+        try:
+            future = self._executor.submit(_render_timed, recap)
+        except BaseException:
+            self._release_slot()
+            raise
+        # le slot est rendu quand le rendu se termine réellement dans le pool, pas quand
+        # l'attente est abandonnée (délai dépassé) : un thread occupé garde son slot
+        future.add_done_callback(lambda _: _call_soon(loop, self._release_slot))
+        data, render_seconds = await asyncio.wrap_future(future)
+        self._render_hist.observe(render_seconds)
+        return data
+
+    def _release_slot(self):
+        self._in_flight -= 1
+        self._slots.release()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,394 @@
+# persistence.py
+# Persistance de l'état des conversations (ConversationHandler + context.user_data)
+# pour reprendre les cotations en cours après un redémarrage.
+#
+# Un enregistrement compact par utilisateur : {"u": user_data, "c": {conversation: [[clé, état], ...]}}
+# sérialisé en JSON minimal (compressé zlib au-delà de COMPRESS_MIN octets).
+# Les écritures sont regroupées : PTB signale les changements toutes les `update_interval`
+# secondes, on les cumule `debounce` secondes puis on écrit tout en une transaction.
+# Les utilisateurs inactifs depuis plus de `ttl` secondes sont évincés (stockage et mémoire).
+import os
+import json
+import time
+import zlib
+import sqlite3
+import asyncio
+import logging
+import threading
+
+from telegram.ext import BasePersistence, ConversationHandler, PersistenceInput
+
+import logs
+import metrics
+
+logger = logging.getLogger(__name__)
+
+COMPRESS_MIN = 256
+_RAW, _ZLIB = b"j", b"z"
+
+
+def _json_default(obj):
+    # valeurs numpy (tables tarifaires) -> types Python
+    if hasattr(obj, "item"):
+        return obj.item()
+    raise TypeError(f"Valeur non sérialisable : {type(obj).__name__}")
+
+
+def encode_record(record: dict) -> bytes:
+    raw = json.dumps(record, separators=(",", ":"), ensure_ascii=False, default=_json_default).encode("utf-8")
+    if len(raw) >= COMPRESS_MIN:
+        return _ZLIB + zlib.compress(raw, 6)
+    return _RAW + raw
+
+
+def decode_record(blob: bytes) -> dict:
+    blob = bytes(blob)
+    tag, body = blob[:1], blob[1:]
+    if tag == _ZLIB:
+        body = zlib.decompress(body)
+    return json.loads(body)
+
+
+# -------------------------
+# Stockages : SQLite (défaut) et mémoire (tests)
+# -------------------------
+class MemoryStateStore:
+    """Stockage en mémoire, même interface que SqliteStateStore."""
+
+    def __init__(self):
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def load(self, min_touched: float):
+        with self._lock:
+            return [(uid, touched, blob) for uid, (touched, blob) in self._rows.items() if touched >= min_touched]
+
+    def write(self, rows):
+        with self._lock:
+            for uid, touched, blob in rows:
+                self._rows[uid] = (touched, blob)
+
+    def delete(self, uids):
+        with self._lock:
+            for uid in uids:
+                self._rows.pop(uid, None)
+
+    def evict(self, min_touched: float) -> int:
+        with self._lock:
+            old = [uid for uid, (touched, _) in self._rows.items() if touched < min_touched]
+            for uid in old:
+                del self._rows[uid]
+            return len(old)
+
+    def close(self):
+        pass
+
+
+class SqliteStateStore:
+    """Stockage SQLite : table states(user_id, touched, data)."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS states ("
+            " user_id INTEGER PRIMARY KEY, touched REAL NOT NULL, data BLOB NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS states_touched ON states(touched)")
+
+    def load(self, min_touched: float):
+        with self._lock:
+            return self._db.execute(
+                "SELECT user_id, touched, data FROM states WHERE touched >= ?", (min_touched,)
+            ).fetchall()
+
+    def write(self, rows):
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO states (user_id, touched, data) VALUES (?, ?, ?)", rows
+                )
+
+    def delete(self, uids):
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.executemany("DELETE FROM states WHERE user_id = ?", [(uid,) for uid in uids])
+
+    def evict(self, min_touched: float) -> int:
+        with self._lock:
+            cur = self._db.execute("DELETE FROM states WHERE touched < ?", (min_touched,))
+            return cur.rowcount
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# -------------------------
+# Persistance PTB
+# -------------------------
+class CompactPersistence(BasePersistence):
+    """Persistance de user_data et des états de conversation, un enregistrement par utilisateur.
+
+    Les clés de conversation (chat_id, user_id) sont rangées sous le user_id (dernier élément).
+    """
+
+    def __init__(self, store=None, ttl: float = 7 * 24 * 3600, debounce: float = 1.0, update_interval: float = 5):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.store = store if store is not None else MemoryStateStore()
+        self.ttl = ttl
+        self.debounce = debounce
+        # état courant par utilisateur : {"u": {...}, "c": {name: {clé: état}}}
+        self._records = None
+        self._touched = {}
+        self._dirty = set()
+        self._dropped = set()
+        self._flush_task = None
+        self._writing = False
+        metrics.gauge("persistence_users", fn=lambda: len(self._records or ()))
+        metrics.gauge("persistence_dirty", fn=lambda: len(self._dirty))
+
+    # --- chargement ---
+    def _load(self):
+        if self._records is not None:
+            return
+        now = time.time()
+        self._records = {}
+        evicted = self.store.evict(now - self.ttl) if self.ttl else 0
+        for uid, touched, blob in self.store.load(now - self.ttl if self.ttl else 0):
+            try:
+                rec = decode_record(blob)
+            except (ValueError, zlib.error):
+                logger.warning("Enregistrement de persistance illisible pour l'utilisateur %s, ignoré.", uid)
+                continue
+            self._records[uid] = {
+                "u": rec.get("u", {}),
+                "c": {name: {tuple(k): s for k, s in items} for name, items in rec.get("c", {}).items()},
+            }
+            self._touched[uid] = touched
+        logger.info("Persistance : %d conversation(s) restaurée(s), %d expirée(s).", len(self._records), evicted)
+
+    def _record(self, uid):
+        rec = self._records.get(uid)
+        if rec is None:
+            rec = self._records[uid] = {"u": {}, "c": {}}
+        return rec
+
+    def _touch(self, uid):
+        self._touched[uid] = time.time()
+        self._dropped.discard(uid)
+        self._dirty.add(uid)
+        self._schedule_flush()
+
+    # --- écritures regroupées ---
+    def _schedule_flush(self):
+        if self._flush_task is None or self._flush_task.done():
+            try:
+                self._flush_task = asyncio.get_running_loop().create_task(self._delayed_flush())
+            except RuntimeError:
+                # hors boucle (outils hors ligne) : écriture immédiate
+                self._flush_now()
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.debounce)
+        # sérialisation dans la boucle (les dicts ne bougent pas pendant ce temps), écriture dans un thread
+        rows, dropped = self._collect()
+        self._writing = True
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, rows, dropped)
+        except Exception:
+            logger.exception("Écriture de la persistance impossible, nouvel essai à la prochaine écriture.")
+            self._requeue(rows, dropped)
+        finally:
+            self._writing = False
+
+    def _flush_now(self):
+        rows, dropped = self._collect()
+        try:
+            self._write(rows, dropped)
+        except Exception:
+            logger.exception("Écriture de la persistance impossible.")
+            self._requeue(rows, dropped)
+
+    def _requeue(self, rows, dropped):
+        """Écriture échouée : ces utilisateurs restent à écrire (ou à supprimer) au prochain passage."""
+        for uid, _, _ in rows:
+            if uid in self._records:
+                self._dirty.add(uid)
+        for uid in dropped:
+            if uid not in self._records:
+                self._dropped.add(uid)
+
+    def _collect(self):
+        dirty, self._dirty = self._dirty, set()
+        dropped, self._dropped = self._dropped, set()
+        rows = []
+        for uid in dirty:
+            rec = self._records.get(uid)
+            if rec is None:
+                continue
+            compact = {}
+            if rec["u"]:
+                compact["u"] = rec["u"]
+            conv = {name: [[list(k), s] for k, s in states.items()] for name, states in rec["c"].items() if states}
+            if conv:
+                compact["c"] = conv
+            try:
+                blob = encode_record(compact)
+            except (TypeError, ValueError) as e:
+                # valeur non sérialisable : seul cet utilisateur est écarté, il reste à écrire
+                logger.warning("Persistance : état de l'utilisateur %s non sérialisable (%s), ignoré.",
+                               logs.user_hash(uid), e)
+                metrics.counter("persistence_encode_errors_total").inc()
+                self._dirty.add(uid)
+                continue
+            rows.append((uid, self._touched.get(uid, time.time()), blob))
+        return rows, dropped
+
+    def _write(self, rows, dropped):
+        if not rows and not dropped:
+            return
+        t0 = time.perf_counter()
+        if rows:
+            self.store.write(rows)
+        if dropped:
+            self.store.delete(dropped)
+        metrics.histogram("persistence_write_seconds").observe(time.perf_counter() - t0)
+        metrics.counter("persistence_rows_written_total").inc(len(rows))
+
+    # --- éviction des conversations inactives ---
+    def idle_users(self, now: float = None):
+        """Utilisateurs sans activité depuis plus de `ttl` secondes."""
+        if not self.ttl or self._records is None:
+            return []
+        limit = (now or time.time()) - self.ttl
+        return [uid for uid, touched in self._touched.items() if touched < limit]
+
+    def evict(self, uids):
+        """Oublie ces utilisateurs (mémoire et stockage, à la prochaine écriture)."""
+        for uid in uids:
+            self._records.pop(uid, None)
+            self._touched.pop(uid, None)
+            self._dirty.discard(uid)
+            self._dropped.add(uid)
+        if uids:
+            metrics.counter("persistence_evicted_total").inc(len(uids))
+            self._schedule_flush()
+
+    # --- interface BasePersistence ---
+    async def get_user_data(self):
+        self._load()
+        return {uid: dict(rec["u"]) for uid, rec in self._records.items() if rec["u"]}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        self._load()
+        out = {}
+        for rec in self._records.values():
+            out.update(rec["c"].get(name, {}))
+        return out
+
+    async def update_conversation(self, name, key, new_state):
+        self._load()
+        uid = key[-1]
+        if new_state is None:
+            rec = self._records.get(uid)
+            if rec is None:
+                # utilisateur évincé (evict_idle) : plus rien à effacer
+                return
+            rec["c"].setdefault(name, {}).pop(tuple(key), None)
+        else:
+            self._record(uid)["c"].setdefault(name, {})[tuple(key)] = new_state
+        self._touch(uid)
+
+    async def update_user_data(self, user_id, data):
+        self._load()
+        self._record(user_id)["u"] = data
+        self._touch(user_id)
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def drop_user_data(self, user_id):
+        self._load()
+        rec = self._records.get(user_id)
+        if rec is not None:
+            rec["u"] = {}
+            if not any(rec["c"].values()):
+                self.evict([user_id])
+                return
+            self._touch(user_id)
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        task = self._flush_task
+        if task is not None and not task.done():
+            if self._writing:
+                # écriture déjà partie dans son thread : attendue (protégée d'une annulation)
+                # avant l'écriture finale et la fermeture du stockage
+                await asyncio.shield(task)
+            else:
+                # encore dans le délai de regroupement : _flush_now() écrit tout
+                task.cancel()
+        if self._records is not None:
+            self._flush_now()
+        self.store.close()
+
+
+def evict_idle(application, persistence: CompactPersistence, conv_handlers=(), now: float = None):
+    """Évince les utilisateurs inactifs : leurs conversations en cours (clés terminées dans
+    chaque ConversationHandler, comme idle.IdleSweeper), leur user_data et leur enregistrement."""
+    uids = persistence.idle_users(now)
+    idle = set(uids)
+    for conv_handler in conv_handlers:
+        for key in [k for k in conv_handler._conversations if k[-1] in idle]:
+            # API interne de PTB (cf. idle.py) ; la mise à jour de persistance qui suit est
+            # ignorée puisque l'utilisateur n'a plus d'enregistrement
+            conv_handler._update_state(ConversationHandler.END, key)
+    for uid in uids:
+        application.drop_user_data(uid)
+    persistence.evict(uids)
+    return uids
+
+
+async def evict_idle_loop(application, persistence: CompactPersistence, interval: float, conv_handlers=()):
+    """Évince périodiquement les utilisateurs inactifs (cf. evict_idle)."""
+    while True:
+        await asyncio.sleep(interval)
+        uids = evict_idle(application, persistence, conv_handlers)
+        if uids:
+            logger.info("Persistance : %d utilisateur(s) inactif(s) évincé(s).", len(uids))
@@ -0,0 +1,307 @@
+# quotation.py
+# Calculs de cotation (sans Telegram) : un devis unitaire par produit et une
+# version vectorisée (numpy) pour générer des grilles entières de simulations.
+#
+# Utilisation en ligne de commande :
+#   python quotation.py demandes.csv > resultats.csv
+#
+# Colonnes reconnues dans le CSV d'entrée (les colonnes inutiles au produit
+# peuvent rester vides) :
+#   product   : assur | ibekelia | fer | emprunteur
+#   age       : âge de l'assuré (assur, ibekelia, emprunteur)
+#   typ_cot   : 1 = prestation définie, 2 = cotisation définie (assur)
+#   duree     : durée de cotisation en années (assur, fer) ou en mois (emprunteur)
+#   nb_rente  : nombre de rentes (assur)
+#   montant   : rente / cotisation (assur), cotisation libre H (fer), capital emprunté (emprunteur)
+#   per_cot   : M, A ou U (ibekelia)
+#   cap_obsq  : capital obsèques (ibekelia)
+#   choix     : A..H (fer)
+import sys
+import csv
+import math
+import argparse
+import numpy as np
+
+# FER+ choix H : la prime décès est fixe, le reste de la cotisation est épargné
+FER_H_MIN_COT = 120000
+FER_H_PRIME_DECES = 20000
+FER_H_CAP_DECES = 20000000
+
+
+# -------------------------
+# Devis unitaires (utilisés par les handlers de main.py)
+# -------------------------
+def quote_assur(tables, typ_cot: int, age: int, duree: int, nb_rente: int, montant: float):
+    """Assur'Education : cotisation mensuelle (typ_cot=1) ou rente annuelle (typ_cot=2).
+    Retourne None si aucun taux (ou taux nul) pour ces paramètres.
+    """
+    taux = tables.taux(age, nb_rente, duree)
+    if taux is None or taux == 0:
+        return None
+    if typ_cot == 1:
+        return {"taux": taux, "cotisation": taux * montant, "rente": montant}
+    return {"taux": taux, "cotisation": montant, "rente": montant / taux}
+
+
+def quote_ibekelia(tables, age: int, per_cot: str, cap_obsq: int):
+    """IBEKELIA : prime pour la périodicité et le capital obsèques, ou None."""
+    return tables.prime(age, per_cot, cap_obsq)
+
+
+def quote_fer(tables, choix: str, duree: int, montant: float = None):
+    """FER+ : capital acquis pour un choix de grille A..G, ou pour H avec la cotisation libre `montant`.
+    Retourne None si la durée ou le choix n'existe pas.
+    """
+    tauxP = tables.fer(duree)
+    if tauxP is None:
+        return None
+    if choix == "H":
+        if montant is None:
+            return None
+        cot_ep = montant - FER_H_PRIME_DECES
+        return {
+            "tauxP": tauxP,
+            "cotMensEp": cot_ep,
+            "cotMensPrev": FER_H_PRIME_DECES,
+            "cotMensTot": montant,
+            "capDec": FER_H_CAP_DECES,
+            "capAcquis": tauxP * cot_ep,
+        }
+    pos = tables.fer_choix_pos.get(choix)
+    if pos is None:
+        return None
+    cot_ep, cot_prev, cot_tot, cap_dec = (float(v) for v in tables.fer_grille_values[pos])
+    return {
+        "tauxP": tauxP,
+        "cotMensEp": cot_ep,
+        "cotMensPrev": cot_prev,
+        "cotMensTot": cot_tot,
+        "capDec": cap_dec,
+        "capAcquis": tauxP * cot_ep,
+    }
+
+
+def quote_emprunteur(tables, age: int, duree_mois: int, cap_pret: float):
+    """Emprunteur : prime unique = taux x capital emprunté, ou None si pas de taux."""
+    taux = tables.emp(age, duree_mois)
+    if taux is None:
+        return None
+    return {"taux": taux, "prime": taux * cap_pret}
+
+
+# -------------------------
+# Devis par lots (tableaux numpy)
+# -------------------------
+def _gather(grid, present, idx):
+    """Lecture vectorisée d'une grille dense : NaN pour les cases absentes ou hors bornes."""
+    idx = [np.asarray(i, dtype=np.int64) for i in idx]
+    ok = np.ones(np.broadcast(*idx).shape, dtype=bool)
+    for i, n in zip(idx, grid.shape):
+        ok &= (i >= 0) & (i < n)
+    safe = tuple(np.where(ok, i, 0) for i in idx)
+    ok &= present[safe]
+    return np.where(ok, grid[safe], np.nan)
+
+
+def batch_assur(tables, typ_cot, age, duree, nb_rente, montant):
+    """Version vectorisée de quote_assur. Les résultats invalides valent NaN."""
+    typ_cot = np.asarray(typ_cot)
+    montant = np.asarray(montant, dtype=float)
+    taux = _gather(
+        tables.taux_grid,
+        tables.taux_present,
+        (
+            np.asarray(age) - tables.taux_age0,
+            np.asarray(nb_rente) - tables.taux_nb0,
+            np.asarray(duree) - tables.taux_duree0,
+        ),
+    )
+    # typ_cot hors {1, 2} : aucun calcul
+    taux = np.where((taux == 0) | ~np.isin(typ_cot, (1, 2)), np.nan, taux)
+    prestation = typ_cot == 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cotisation = np.where(prestation, taux * montant, np.where(np.isnan(taux), np.nan, montant))
+        rente = np.where(prestation, np.where(np.isnan(taux), np.nan, montant), montant / taux)
+    return {"taux": taux, "cotisation": cotisation, "rente": rente}
+
+
+def batch_ibekelia(tables, age, per_cot, cap_obsq):
+    """Version vectorisée de quote_ibekelia."""
+    per = np.array([tables.prime_per_pos.get(p, -1) for p in np.asarray(per_cot).tolist()], dtype=np.int64)
+    cap = np.array([tables.prime_cap_pos.get(int(c), -1) for c in np.asarray(cap_obsq).tolist()], dtype=np.int64)
+    prime = _gather(tables.prime_grid, tables.prime_present, (np.asarray(age) - tables.prime_age0, per, cap))
+    return {"prime": prime}
+
+
+def batch_fer(tables, choix, duree, montant=None):
+    """Version vectorisée de quote_fer (montant n'est utilisé que pour le choix H)."""
+    choix = np.asarray(choix).astype(str)
+    n = choix.shape[0]
+    montant = np.full(n, np.nan) if montant is None else np.asarray(montant, dtype=float)
+    tauxP = _gather(tables.fer_grid, tables.fer_present, (np.asarray(duree) - tables.fer_duree0,))
+
+    pos = np.array([tables.fer_choix_pos.get(c, -1) for c in choix.tolist()], dtype=np.int64)
+    grille = np.where((pos >= 0)[:, None], tables.fer_grille_values[np.maximum(pos, 0)], np.nan)
+    libre = choix == "H"
+    cot_ep = np.where(libre, montant - FER_H_PRIME_DECES, grille[:, 0])
+    cot_prev = np.where(libre, FER_H_PRIME_DECES, grille[:, 1])
+    cot_tot = np.where(libre, montant, grille[:, 2])
+    cap_dec = np.where(libre, FER_H_CAP_DECES, grille[:, 3])
+    return {
+        "tauxP": tauxP,
+        "cotMensEp": cot_ep,
+        "cotMensPrev": cot_prev,
+        "cotMensTot": cot_tot,
+        "capDec": cap_dec,
+        "capAcquis": tauxP * cot_ep,
+    }
+
+
+def batch_emprunteur(tables, age, duree_mois, cap_pret):
+    """Version vectorisée de quote_emprunteur."""
+    taux = _gather(
+        tables.emp_grid,
+        tables.emp_present,
+        (np.asarray(age) - tables.emp_age0, np.asarray(duree_mois) - tables.emp_mois0),
+    )
+    return {"taux": taux, "prime": taux * np.asarray(cap_pret, dtype=float)}
+
+
+# -------------------------
+# CLI : CSV de demandes -> CSV de résultats
+# -------------------------
+INPUT_COLUMNS = ("product", "age", "typ_cot", "duree", "nb_rente", "montant", "per_cot", "cap_obsq", "choix")
+RESULT_COLUMNS = ("taux", "cotisation", "rente", "prime", "capital_acquis", "capital_deces", "statut")
+
+
+# au-delà, une saisie entière est rejetée (les décalages de grille restent loin de la limite int64)
+INT_LIMIT = 10 ** 9
+
+
+def _num(rows, col, dtype=float):
+    """Colonne numérique ; valeur vide, illisible, infinie ou hors bornes -> NaN (float) ou -1 (int)."""
+    out = np.full(len(rows), np.nan if dtype is float else -1, dtype=dtype)
+    for i, r in enumerate(rows):
+        v = (r.get(col) or "").strip().replace(",", ".")
+        try:
+            x = float(v)
+            if not math.isfinite(x) or (dtype is int and abs(x) > INT_LIMIT):
+                continue
+            out[i] = dtype(x)
+        except (ValueError, OverflowError):
+            pass
+    return out
+
+
+def _txt(rows, col):
+    return np.array([(r.get(col) or "").strip().upper() for r in rows], dtype=str)
+
+
+def quote_rows(tables, rows: list) -> list:
+    """Calcule un lot de lignes CSV (dicts) ; retourne les dicts de résultats dans le même ordre."""
+    with np.errstate(over="ignore", invalid="ignore"):
+        # montants démesurés : résultats infinis, signalés en saisie_invalide
+        return _quote_rows(tables, rows)
+
+
+def _quote_rows(tables, rows: list) -> list:
+    results = [dict.fromkeys(RESULT_COLUMNS, "") for _ in rows]
+    groups = {}
+    for i, r in enumerate(rows):
+        groups.setdefault((r.get("product") or "").strip().lower(), []).append(i)
+
+    for product, positions in groups.items():
+        sub = [rows[i] for i in positions]
+        # saisie incohérente (valeur hors des choix admis, montant obligatoire absent)
+        invalid = np.zeros(len(sub), dtype=bool)
+        if product in ("assur", "assureducation", "assur'education"):
+            typ_cot = _num(sub, "typ_cot", int)
+            res = batch_assur(tables, typ_cot, _num(sub, "age", int), _num(sub, "duree", int),
+                              _num(sub, "nb_rente", int), _num(sub, "montant"))
+            cols = {"taux": res["taux"], "cotisation": res["cotisation"], "rente": res["rente"]}
+            valid = ~np.isnan(res["taux"])
+            invalid = ~np.isin(typ_cot, (1, 2))
+        elif product == "ibekelia":
+            res = batch_ibekelia(tables, _num(sub, "age", int), _txt(sub, "per_cot"), _num(sub, "cap_obsq", int))
+            cols = {"prime": res["prime"]}
+            valid = ~np.isnan(res["prime"])
+        elif product in ("fer", "fer+"):
+            montant = _num(sub, "montant")
+            res = batch_fer(tables, _txt(sub, "choix"), _num(sub, "duree", int), montant)
+            cols = {"taux": res["tauxP"], "cotisation": res["cotMensTot"], "capital_acquis": res["capAcquis"],
+                    "capital_deces": res["capDec"]}
+            valid = ~np.isnan(res["capAcquis"])
+            # H : cotisation libre strictement supérieure à 120 000
+            valid &= ~((_txt(sub, "choix") == "H") & ~(res["cotMensTot"] > FER_H_MIN_COT))
+            invalid = (_txt(sub, "choix") == "H") & np.isnan(montant)
+        elif product == "emprunteur":
+            res = batch_emprunteur(tables, _num(sub, "age", int), _num(sub, "duree", int), _num(sub, "montant"))
+            cols = {"taux": res["taux"], "prime": res["prime"]}
+            valid = ~np.isnan(res["prime"])
+        else:
+            for i in positions:
+                results[i]["statut"] = "produit_inconnu"
+            continue
+
+        # taux trouvé mais montant manquant ou démesuré (résultat NaN ou infini)
+        finite = np.logical_and.reduce([np.isfinite(np.asarray(v, dtype=float)) for v in cols.values()])
+        for j, i in enumerate(positions):
+            if invalid[j]:
+                results[i]["statut"] = "saisie_invalide"
+                continue
+            if not valid[j]:
+                results[i]["statut"] = "hors_grille"
+                continue
+            if not finite[j]:
+                results[i]["statut"] = "saisie_invalide"
+                continue
+            for name, values in cols.items():
+                results[i][name] = repr(float(values[j]))
+            results[i]["statut"] = "ok"
+    return results
+
+
+def run_csv(tables, infile, outfile, chunk_size: int = 10000):
+    """Lit les demandes par paquets de `chunk_size` lignes et écrit les résultats au fil de l'eau."""
+    reader = csv.DictReader(infile)
+    in_cols = list(reader.fieldnames or INPUT_COLUMNS)
+    writer = csv.DictWriter(outfile, fieldnames=in_cols + [c for c in RESULT_COLUMNS if c not in in_cols])
+    writer.writeheader()
+    chunk = []
+    for row in reader:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            _write_chunk(tables, writer, chunk)
+            chunk = []
+    if chunk:
+        _write_chunk(tables, writer, chunk)
+
+
+def _write_chunk(tables, writer, rows):
+    for row, res in zip(rows, quote_rows(tables, rows)):
+        writer.writerow({**row, **res})
+
+
+def main(argv=None):
+    import tarifs
+
+    parser = argparse.ArgumentParser(description="Cotations SUNU par lots (CSV -> CSV).")
+    parser.add_argument("input", help="CSV des demandes ('-' pour l'entrée standard)")
+    parser.add_argument("-o", "--output", default="-", help="CSV des résultats ('-' pour la sortie standard)")
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    tables = tarifs.TarifTables(tarifs.load_tables())
+    infile = sys.stdin if args.input == "-" else open(args.input, newline="", encoding="utf-8")
+    outfile = sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8")
+    try:
+        run_csv(tables, infile, outfile, args.chunk_size)
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+
+
+if __name__ == "__main__":
+    main()
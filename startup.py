@@ -0,0 +1,49 @@
+# startup.py
+# Profil de démarrage : durée de chaque phase (imports, configuration, tables, gabarits PDF,
+# connexion à Telegram...), affiché par `python main.py --profile-startup`.
+# Importé en premier par main.py : l'origine des temps est l'import de ce module.
+import time
+import threading
+import contextlib
+
+T0 = time.perf_counter()
+
+_phases = []
+_last = T0
+_lock = threading.Lock()
+
+
+def _record(name: str, start: float, end: float):
+    _phases.append((name, start - T0, end - start, threading.current_thread().name))
+
+
+def mark(name: str):
+    """Clôt la phase séquentielle `name`, commencée à la marque précédente."""
+    global _last
+    now = time.perf_counter()
+    with _lock:
+        _record(name, _last, now)
+        _last = now
+
+
+@contextlib.contextmanager
+def phase(name: str):
+    """Phase chronométrée indépendamment des marques (thread de préchargement, attente)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            _record(name, start, time.perf_counter())
+
+
+def report() -> str:
+    """Tableau des phases par ordre de début (ms depuis l'import de main)."""
+    with _lock:
+        rows = sorted(_phases, key=lambda p: p[1])
+    total = max((start + duration for _, start, duration, _ in rows), default=0.0)
+    lines = [f"{'phase':<44}{'début':>10}{'durée':>10}  thread"]
+    for name, start, duration, thread in rows:
+        lines.append(f"{name:<44}{start * 1e3:>8.1f}ms{duration * 1e3:>8.1f}ms  {thread}")
+    lines.append(f"{'total':<44}{'':>10}{total * 1e3:>8.1f}ms")
+    return "\n".join(lines)
@@ -0,0 +1,533 @@
+# tarifs.py
+# Chargement des grilles tarifaires (Excel) avec cache binaire compilé.
+import os
+import hashlib
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _pandas():
+    """pandas n'est importé qu'à la lecture des tables (import de tarifs et du bot plus rapide)."""
+    import pandas
+    return pandas
+
+# -------------------------
+# Sources Excel : fichier -> feuilles utilisées
+# -------------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SOURCES = {
+    "T_taux_Etudes.xlsx": ("T_taux_Etudes",),
+    "T_Prime_IBEKELIA.xlsx": ("T_Prime_IBEKELIA",),
+    "table_taux_FER+.xlsx": ("grille_FER+", "table_taux_FER+"),
+    "tauxEmp.xlsx": ("tauxEmp",),
+}
+
+# noms des tables normalisées (mêmes noms que les variables de main.py)
+TABLE_NAMES = ("df_taux", "df_prime", "df_fer_grille", "df_fer_table", "df_emp")
+# colonnes de la grille FER+ (ordre des colonnes de TarifTables.fer_grille_values)
+FER_GRILLE_COLS = ("cotMensEp", "cotMensPrev", "cotMensTot", "capDec")
+
+# Répertoire du cache compilé (un fichier .npz par empreinte des classeurs)
+CACHE_DIR = os.getenv("TARIF_CACHE_DIR", os.path.join(BASE_DIR, ".cache_tarifs"))
+# à incrémenter si le format du cache ou la normalisation change
+CACHE_FORMAT = 1
+
+
+class TarifError(Exception):
+    """Classeur absent ou mal structuré."""
+
+
+# -------------------------
+# Lecture + normalisation des classeurs
+# -------------------------
+def parse_workbooks(base_dir: str = BASE_DIR) -> dict:
+    """Lit les quatre classeurs avec pandas et retourne les tables normalisées."""
+    def path(name):
+        return os.path.join(base_dir, name)
+
+    pd = _pandas()
+    try:
+        df_taux = pd.read_excel(path("T_taux_Etudes.xlsx"), sheet_name="T_taux_Etudes")
+        df_prime = pd.read_excel(path("T_Prime_IBEKELIA.xlsx"), sheet_name="T_Prime_IBEKELIA")
+        # FER+ sheets (doit exister)
+        df_fer_grille = pd.read_excel(path("table_taux_FER+.xlsx"), sheet_name="grille_FER+")
+        df_fer_table = pd.read_excel(path("table_taux_FER+.xlsx"), sheet_name="table_taux_FER+")
+        # EMPRUNTEUR rates
+        df_emp = pd.read_excel(path("tauxEmp.xlsx"), sheet_name="tauxEmp")
+    except Exception as e:
+        raise TarifError(f"Erreur en lisant les fichiers Excel : {e}") from e
+
+    # Taux (Assur'Education)
+    if "DureeCot-Nbrente" not in df_taux.columns:
+        raise TarifError("La colonne 'DureeCot-Nbrente' n'existe pas dans T_taux_Etudes.xlsx.")
+    df_taux["DureeCot-Nbrente"] = df_taux["DureeCot-Nbrente"].astype(str).str.strip()
+    df_taux.set_index("DureeCot-Nbrente", inplace=True)
+    df_taux.columns = df_taux.columns.astype(str)
+
+    # Prime IBEKELIA
+    if "T_Prime_IBEKELIA" not in df_prime.columns:
+        raise TarifError("La colonne 'T_Prime_IBEKELIA' n'existe pas dans T_Prime_IBEKELIA.xlsx.")
+    df_prime["T_Prime_IBEKELIA"] = df_prime["T_Prime_IBEKELIA"].astype(str).str.strip()
+    df_prime.set_index("T_Prime_IBEKELIA", inplace=True)
+    df_prime.columns = df_prime.columns.astype(str)
+
+    # FER+ grille (A..G rows)
+    required_fer_cols = {"choixCot", "cotMensEp", "cotMensPrev", "cotMensTot", "capDec"}
+    if not required_fer_cols.issubset(set(df_fer_grille.columns)):
+        raise TarifError(f"La feuille 'grille_FER+' doit contenir les colonnes : {required_fer_cols}")
+    df_fer_grille["choixCot"] = df_fer_grille["choixCot"].astype(str).str.strip().str.upper()
+    df_fer_grille.set_index("choixCot", inplace=True)
+    for c in ("cotMensEp", "cotMensPrev", "cotMensTot", "capDec"):
+        df_fer_grille[c] = pd.to_numeric(df_fer_grille[c], errors="coerce")
+
+    # FER+ table taux : dureeCot -> tauxP
+    if "dureeCot" not in df_fer_table.columns or "tauxP" not in df_fer_table.columns:
+        raise TarifError("La feuille 'table_taux_FER+' doit contenir 'dureeCot' et 'tauxP'")
+    df_fer_table["dureeCot"] = pd.to_numeric(df_fer_table["dureeCot"], errors="coerce").astype(int)
+    df_fer_table["tauxP"] = pd.to_numeric(df_fer_table["tauxP"], errors="coerce")
+    df_fer_table.set_index("dureeCot", inplace=True)
+
+    # EMPRUNTEUR : age en index, durées (mois) en colonnes entières
+    if "age" not in df_emp.columns:
+        raise TarifError("Le fichier tauxEmp.xlsx doit contenir une colonne 'age'.")
+    df_emp = df_emp.copy()
+    df_emp["age"] = df_emp["age"].astype(int)
+    new_cols = {}
+    for c in df_emp.columns:
+        if c == "age":
+            continue
+        try:
+            new_cols[c] = int(c)
+        except Exception:
+            try:
+                new_cols[c] = int(float(c))
+            except Exception:
+                logger.warning("Colonne non reconnue dans tauxEmp: %s", c)
+                new_cols[c] = c
+    df_emp.rename(columns=new_cols, inplace=True)
+    df_emp.set_index("age", inplace=True)
+
+    return {
+        "df_taux": df_taux,
+        "df_prime": df_prime,
+        "df_fer_grille": df_fer_grille,
+        "df_fer_table": df_fer_table,
+        "df_emp": df_emp,
+    }
+
+
+# -------------------------
+# Cache binaire (.npz) indexé par l'empreinte des classeurs
+# -------------------------
+def sources_digest(base_dir: str = BASE_DIR) -> str:
+    """Empreinte SHA-256 du contenu des quatre classeurs (et du format de cache)."""
+    h = hashlib.sha256(f"format={CACHE_FORMAT}".encode())
+    for name in sorted(SOURCES):
+        h.update(name.encode())
+        with open(os.path.join(base_dir, name), "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+
+def _cache_path(digest: str, cache_dir: str) -> str:
+    return os.path.join(cache_dir, f"tarifs-{digest[:16]}.npz")
+
+
+def _labels_to_array(labels) -> np.ndarray:
+    # les libellés sont soit tous entiers, soit traités comme chaînes
+    values = list(labels)
+    if all(isinstance(v, (int, np.integer)) for v in values):
+        return np.asarray(values, dtype=np.int64)
+    return np.asarray([str(v) for v in values], dtype=np.str_)
+
+
+def _array_to_labels(arr: np.ndarray):
+    pd = _pandas()
+    if arr.dtype.kind in "iu":
+        return pd.Index(arr.astype(np.int64).tolist())
+    return pd.Index([str(v) for v in arr.tolist()])
+
+
+def _frames_to_arrays(frames: dict) -> dict:
+    arrays = {}
+    for name in TABLE_NAMES:
+        df = frames[name]
+        arrays[f"{name}__index"] = _labels_to_array(df.index)
+        arrays[f"{name}__columns"] = _labels_to_array(df.columns)
+        arrays[f"{name}__index_name"] = np.asarray([df.index.name or ""], dtype=np.str_)
+        if df.dtypes.nunique() == 1:
+            # bloc 2D homogène (cas des grilles de taux)
+            arrays[f"{name}__values"] = df.to_numpy()
+        else:
+            # une colonne par tableau pour conserver les dtypes (int64 / float64)
+            for i, c in enumerate(df.columns):
+                arrays[f"{name}__c{i}"] = df[c].to_numpy()
+    return arrays
+
+
+def _arrays_to_frames(arrays) -> dict:
+    pd = _pandas()
+    frames = {}
+    for name in TABLE_NAMES:
+        index = _array_to_labels(arrays[f"{name}__index"])
+        index.name = str(arrays[f"{name}__index_name"][0]) or None
+        columns = _array_to_labels(arrays[f"{name}__columns"])
+        if f"{name}__values" in arrays:
+            frames[name] = pd.DataFrame(arrays[f"{name}__values"], index=index, columns=columns)
+        else:
+            data = {c: arrays[f"{name}__c{i}"] for i, c in enumerate(columns)}
+            frames[name] = pd.DataFrame(data, index=index, columns=columns)
+    return frames
+
+
+def write_cache(frames: dict, digest: str, cache_dir: str = CACHE_DIR) -> str:
+    """Écrit le cache de façon atomique et supprime les caches périmés."""
+    os.makedirs(cache_dir, exist_ok=True)
+    target = _cache_path(digest, cache_dir)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, **_frames_to_arrays(frames))
+    os.replace(tmp, target)
+    for fname in os.listdir(cache_dir):
+        if fname.startswith("tarifs-") and fname.endswith(".npz") and os.path.join(cache_dir, fname) != target:
+            try:
+                os.remove(os.path.join(cache_dir, fname))
+            except OSError:
+                pass
+    return target
+
+
+def read_cache(digest: str, cache_dir: str = CACHE_DIR):
+    """Retourne les tables depuis le cache, ou None si absent / illisible."""
+    target = _cache_path(digest, cache_dir)
+    if not os.path.exists(target):
+        return None
+    try:
+        with np.load(target, allow_pickle=False) as arrays:
+            return _arrays_to_frames(arrays)
+    except Exception:
+        logger.warning("Cache tarifaire illisible (%s), relecture des classeurs.", target)
+        return None
+
+
+def load_tables(base_dir: str = BASE_DIR, cache_dir: str = CACHE_DIR, use_cache: bool = True) -> dict:
+    """Charge les tables normalisées : cache binaire si à jour, sinon classeurs Excel."""
+    if not use_cache:
+        return parse_workbooks(base_dir)
+    return _load_with_digest(base_dir, cache_dir)[0]
+
+
+def _load_with_digest(base_dir: str, cache_dir: str):
+    try:
+        digest = sources_digest(base_dir)
+    except OSError as e:
+        raise TarifError(f"Classeur tarifaire introuvable : {e}") from e
+
+    frames = read_cache(digest, cache_dir)
+    if frames is not None:
+        logger.info("Tables tarifaires chargées depuis le cache (%s).", digest[:16])
+        return frames, digest
+
+    frames = parse_workbooks(base_dir)
+    try:
+        write_cache(frames, digest, cache_dir)
+        logger.info("Cache tarifaire compilé (%s).", digest[:16])
+    except OSError:
+        logger.warning("Impossible d'écrire le cache tarifaire dans %s.", cache_dir)
+    return frames, digest
+
+
+# -------------------------
+# Grilles denses : recherche O(1) par décalages entiers
+# -------------------------
+def _split_key(label: str):
+    """'40-3' -> ('40', '3') ; None si le libellé n'a pas la forme age-xxx."""
+    head, sep, tail = str(label).partition("-")
+    if not sep:
+        return None
+    return head.strip(), tail.strip()
+
+
+class TarifTables:
+    """Tables normalisées + grilles numpy denses (NaN = case absente).
+
+    - taux  : age x nb_rente x durée        (Assur'Education)
+    - prime : age x périodicité x capital   (IBEKELIA)
+    - emp   : age x mois                    (Emprunteur)
+    - fer   : durée                         (FER+)
+
+    `version` et `digest` sont renseignés par TarifRegistry à l'installation.
+    """
+
+    version = 0
+    digest = ""
+
+    def __init__(self, frames: dict):
+        self.frames = frames
+        self._build_taux(frames["df_taux"])
+        self._build_prime(frames["df_prime"])
+        self._build_emp(frames["df_emp"])
+        self._build_fer(frames["df_fer_table"])
+        self._build_fer_grille(frames["df_fer_grille"])
+        self._build_indexes(frames)
+        self._validate()
+
+    # ----- construction -----
+    def _build_taux(self, df):
+        rows = []
+        for pos, label in enumerate(df.index):
+            parts = _split_key(label)
+            if parts and parts[0].isdigit() and parts[1].isdigit():
+                rows.append((pos, int(parts[0]), int(parts[1])))
+        cols = [(pos, int(c)) for pos, c in enumerate(df.columns) if str(c).strip().isdigit()]
+        ages = [r[1] for r in rows] or [0]
+        nbs = [r[2] for r in rows] or [0]
+        durees = [c[1] for c in cols] or [0]
+        self.taux_age0, self.taux_nb0, self.taux_duree0 = min(ages), min(nbs), min(durees)
+        grid = np.full((max(ages) - min(ages) + 1, max(nbs) - min(nbs) + 1, max(durees) - min(durees) + 1), np.nan)
+        present = np.zeros(grid.shape, dtype=bool)
+        values = df.to_numpy(dtype=float)
+        for pos, age, nb in rows:
+            for cpos, duree in cols:
+                idx = (age - self.taux_age0, nb - self.taux_nb0, duree - self.taux_duree0)
+                grid[idx] = values[pos, cpos]
+                present[idx] = True
+        self.taux_grid, self.taux_present = grid, present
+
+    def _build_prime(self, df):
+        rows = []
+        for pos, label in enumerate(df.index):
+            parts = _split_key(label)
+            if parts and parts[0].isdigit():
+                rows.append((pos, int(parts[0]), parts[1]))
+        cols = []
+        for cpos, c in enumerate(df.columns):
+            try:
+                cols.append((cpos, int(float(c))))
+            except ValueError:
+                continue
+        # périodicités (M, A, U) et capitaux : dictionnaire valeur -> position
+        self.prime_per_pos = {per: i for i, per in enumerate(dict.fromkeys(r[2] for r in rows))}
+        self.prime_cap_pos = {cap: i for i, (_, cap) in enumerate(cols)}
+        ages = [r[1] for r in rows] or [0]
+        self.prime_age0 = min(ages)
+        grid = np.full((max(ages) - min(ages) + 1, max(len(self.prime_per_pos), 1), max(len(cols), 1)), np.nan)
+        present = np.zeros(grid.shape, dtype=bool)
+        values = df.to_numpy(dtype=float)
+        for pos, age, per in rows:
+            for j, (cpos, _) in enumerate(cols):
+                idx = (age - self.prime_age0, self.prime_per_pos[per], j)
+                grid[idx] = values[pos, cpos]
+                present[idx] = True
+        self.prime_grid, self.prime_present = grid, present
+
+    def _build_emp(self, df):
+        cols = [(cpos, c) for cpos, c in enumerate(df.columns) if isinstance(c, (int, np.integer))]
+        ages = [int(a) for a in df.index] or [0]
+        mois = [int(c) for _, c in cols] or [0]
+        self.emp_age0, self.emp_mois0 = min(ages), min(mois)
+        grid = np.full((max(ages) - min(ages) + 1, max(mois) - min(mois) + 1), np.nan)
+        present = np.zeros(grid.shape, dtype=bool)
+        values = df.to_numpy(dtype=float)
+        rows = np.asarray(ages) - self.emp_age0
+        for cpos, c in cols:
+            grid[rows, int(c) - self.emp_mois0] = values[:, cpos]
+            present[rows, int(c) - self.emp_mois0] = True
+        self.emp_grid, self.emp_present = grid, present
+
+    def _build_fer(self, df):
+        durees = [int(d) for d in df.index] or [0]
+        self.fer_duree0 = min(durees)
+        grid = np.full(max(durees) - min(durees) + 1, np.nan)
+        present = np.zeros(grid.shape, dtype=bool)
+        grid[np.asarray(durees) - self.fer_duree0] = df["tauxP"].to_numpy(dtype=float)
+        present[np.asarray(durees) - self.fer_duree0] = True
+        self.fer_grid, self.fer_present = grid, present
+
+    def _build_fer_grille(self, df):
+        # choix (A..H) -> ligne ; valeurs manquantes à 0 comme dans fer_duree
+        self.fer_choix_pos = {str(c): i for i, c in enumerate(df.index)}
+        self.fer_grille_values = np.nan_to_num(df.loc[:, list(FER_GRILLE_COLS)].to_numpy(dtype=float))
+
+    def _build_indexes(self, frames):
+        """Faits dérivés consultés par les handlers à chaque message (calculés une fois par chargement)."""
+        rentes = {}
+        for label in frames["df_taux"].index:
+            parts = _split_key(label)
+            if parts and parts[0].isdigit() and parts[1].isdigit():
+                rentes.setdefault(int(parts[0]), set()).add(int(parts[1]))
+        # Assur'Education : âge -> nb_rente disponibles, durées (colonnes) valides
+        self.taux_rentes_by_age = {age: tuple(sorted(nbs)) for age, nbs in rentes.items()}
+        self.taux_durees = frozenset(int(c) for c in frames["df_taux"].columns if str(c).strip().isdigit())
+        self.taux_ages = (min(rentes), max(rentes)) if rentes else (0, -1)
+
+        prime_ages = {int(p[0]) for p in map(_split_key, frames["df_prime"].index) if p and p[0].isdigit()}
+        self.prime_ages = (min(prime_ages), max(prime_ages)) if prime_ages else (0, -1)
+
+        # Emprunteur : âges et durées (mois) présents dans la grille
+        self.emp_ages = frozenset(int(a) for a in frames["df_emp"].index)
+        self.emp_durees = frozenset(c for c in frames["df_emp"].columns if isinstance(c, (int, np.integer)))
+
+        # FER+ : choix de grille acceptés (A..G + H saisie libre)
+        self.fer_choix_valides = frozenset(self.fer_choix_pos) | {"H"}
+
+    def _validate(self):
+        """Refuse des tables vides (classeur tronqué pendant une copie, mauvaise feuille...)."""
+        for name, present in (
+            ("T_taux_Etudes", self.taux_present),
+            ("T_Prime_IBEKELIA", self.prime_present),
+            ("tauxEmp", self.emp_present),
+            ("table_taux_FER+", self.fer_present),
+        ):
+            if not present.any():
+                raise TarifError(f"Aucun taux exploitable dans {name}.")
+        if not self.fer_choix_pos:
+            raise TarifError("Aucun choix dans grille_FER+.")
+
+    # ----- lecture -----
+    @staticmethod
+    def _read(grid, present, idx):
+        # indices négatifs ou hors bornes : case absente
+        for i, n in zip(idx, grid.shape):
+            if not 0 <= i < n:
+                return None
+        if not present[idx]:
+            return None
+        return float(grid[idx])
+
+    def taux(self, age: int, nb_rente: int, duree: int):
+        try:
+            idx = (age - self.taux_age0, nb_rente - self.taux_nb0, duree - self.taux_duree0)
+        except TypeError:
+            return None
+        return self._read(self.taux_grid, self.taux_present, idx)
+
+    def prime(self, age: int, per_cot: str, cap_obsq: int):
+        per = self.prime_per_pos.get(per_cot)
+        cap = self.prime_cap_pos.get(cap_obsq)
+        if per is None or cap is None:
+            return None
+        try:
+            idx = (age - self.prime_age0, per, cap)
+        except TypeError:
+            return None
+        return self._read(self.prime_grid, self.prime_present, idx)
+
+    def emp(self, age: int, duree_mois: int):
+        try:
+            idx = (age - self.emp_age0, duree_mois - self.emp_mois0)
+        except TypeError:
+            return None
+        val = self._read(self.emp_grid, self.emp_present, idx)
+        # une case vide du classeur vaut "pas de taux"
+        return None if val is None or val != val else val
+
+    def fer(self, duree: int):
+        try:
+            idx = (duree - self.fer_duree0,)
+        except TypeError:
+            return None
+        return self._read(self.fer_grid, self.fer_present, idx)
+
+
+# -------------------------
+# Registre : rechargement à chaud des classeurs
+# -------------------------
+class TarifRegistry:
+    """Surveille les quatre classeurs et installe de nouvelles tables sans redémarrer le bot.
+
+    Un thread de fond compare périodiquement (mtime, taille) des fichiers ; après un
+    changement stable, les classeurs sont relus et validés hors de la boucle asyncio,
+    puis `on_swap(tables)` est appelé avec le nouvel objet TarifTables. Les anciennes
+    tables restent en place si la relecture échoue.
+    """
+
+    def __init__(self, base_dir: str = BASE_DIR, cache_dir: str = CACHE_DIR, interval: float = 5.0, on_swap=None):
+        self.base_dir = base_dir
+        self.cache_dir = cache_dir
+        self.interval = interval
+        self.on_swap = on_swap
+        self.tables = None
+        self.version = 0
+        self._signature = None
+        self._pending = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _stat_signature(self):
+        sig = []
+        for name in sorted(SOURCES):
+            try:
+                st = os.stat(os.path.join(self.base_dir, name))
+                sig.append((name, st.st_mtime_ns, st.st_size))
+            except OSError:
+                sig.append((name, None, None))
+        return tuple(sig)
+
+    def load(self) -> TarifTables:
+        """Chargement synchrone (démarrage ou rechargement forcé). Lève TarifError."""
+        with self._lock:
+            signature = self._stat_signature()
+            frames, digest = _load_with_digest(self.base_dir, self.cache_dir)
+            if self.tables is not None and digest == self.tables.digest:
+                self._signature = signature
+                return self.tables
+            tables = TarifTables(frames)
+            tables.version = self.version + 1
+            tables.digest = digest
+            self.version = tables.version
+            self.tables = tables
+            self._signature = signature
+        logger.info("Tables tarifaires v%d installées (%s).", tables.version, digest[:16])
+        if self.on_swap is not None:
+            self.on_swap(tables)
+        return tables
+
+    def check_now(self) -> bool:
+        """Recharge si un classeur a changé et s'est stabilisé depuis le dernier passage."""
+        signature = self._stat_signature()
+        if signature == self._signature:
+            self._pending = None
+            return False
+        if signature != self._pending:
+            # fichier peut-être en cours d'écriture : attendre un passage de plus
+            self._pending = signature
+            return False
+        self._pending = None
+        previous = self.version
+        try:
+            self.load()
+        except Exception:
+            logger.exception("Rechargement des tables tarifaires refusé ; la version v%d reste active.", previous)
+            # ne pas retenter tant que les fichiers ne changent pas à nouveau
+            self._signature = signature
+            return False
+        return self.version != previous
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check_now()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="tarif-watch", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+
+if __name__ == "__main__":
+    # python tarifs.py : compile (ou recompile) le cache à partir des classeurs
+    logging.basicConfig(level=logging.INFO)
+    digest = sources_digest()
+    print(write_cache(parse_workbooks(), digest))
@@ -0,0 +1,23 @@
+# tests/conftest.py
+# Les modules du bot sont à la racine du dépôt (pas de paquet installé).
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import tarifs  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def frames():
+    """Tables normalisées lues directement dans les classeurs (sans le cache compilé)."""
+    return tarifs.load_tables(use_cache=False)
+
+
+@pytest.fixture(scope="session")
+def tables(frames):
+    return tarifs.TarifTables(frames)
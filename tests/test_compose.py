@@ -0,0 +1,111 @@
+# tests/test_compose.py
+# Outbox : textes d'un même tour regroupés en un message, claviers inline gardés sur leur
+# propre message, message du bouton appuyé remplacé par le premier texte quand c'est possible.
+import asyncio
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup
+from telegram.error import BadRequest
+
+import outbound
+from compose import composed, reply_text, reply_document, MAX_TEXT, SEPARATOR
+
+INLINE = InlineKeyboardMarkup([[InlineKeyboardButton("Oui", callback_data="1|oui")]])
+MENU = ReplyKeyboardMarkup([["1", "2"]])
+
+
+class FakeMessage:
+    is_accessible = True
+
+    def __init__(self, edit_fails=False):
+        self.calls = []
+        self.edit_fails = edit_fails
+
+    async def reply_text(self, text, reply_markup=None):
+        self.calls.append(("send", text, reply_markup, outbound.current_lane()))
+
+    async def edit_text(self, text, reply_markup=None):
+        if self.edit_fails:
+            raise BadRequest("Message to edit not found")
+        self.calls.append(("edit", text, reply_markup, outbound.current_lane()))
+
+    async def reply_document(self, document, **kwargs):
+        self.calls.append(("document", document, None, outbound.current_lane()))
+
+
+class FakeQuery:
+    def __init__(self, message):
+        self.message = message
+
+
+class FakeUpdate:
+    def __init__(self, message, tapped=False):
+        self.effective_message = message
+        self.callback_query = FakeQuery(message) if tapped else None
+
+
+def run_turn(texts, tapped=False, edit_fails=False):
+    """Tour de handler composé : `texts` est une liste de (texte, clavier) ou de documents (bytes)."""
+    message = FakeMessage(edit_fails)
+    update = FakeUpdate(message, tapped)
+
+    async def handler(update, context):
+        for item in texts:
+            if isinstance(item, bytes):
+                await reply_document(update, item)
+            else:
+                await reply_text(update, *item)
+
+    asyncio.run(composed(handler)(update, None))
+    return [call[:3] for call in message.calls]
+
+
+def test_texts_of_a_turn_are_merged():
+    calls = run_turn([("Résultat", None), ("Voulez-vous le PDF ?", MENU)])
+    assert calls == [("send", "Résultat" + SEPARATOR + "Voulez-vous le PDF ?", MENU)]
+
+
+def test_inline_keyboard_stays_on_its_own_message():
+    calls = run_turn([("Résultat", None), ("PDF ?", INLINE), ("Menu", MENU)])
+    # le texte suivant un clavier inline part à part : le clavier reste sous sa question
+    assert calls == [("send", "Résultat" + SEPARATOR + "PDF ?", INLINE), ("send", "Menu", MENU)]
+
+
+def test_too_long_texts_are_not_merged():
+    long_text = "x" * (MAX_TEXT - len(SEPARATOR) - 4)
+    calls = run_turn([(long_text, None), ("suite", None)])
+    assert [text for _, text, _ in calls] == [long_text, "suite"]
+
+
+def test_merged_message_takes_the_most_urgent_lane():
+    message = FakeMessage()
+    update = FakeUpdate(message)
+
+    async def handler(update, context):
+        with outbound.lane(outbound.LOW):
+            await reply_text(update, "avis")
+        with outbound.lane(outbound.HIGH):
+            await reply_text(update, "réponse")
+
+    asyncio.run(composed(handler)(update, None))
+    assert message.calls == [("send", "avis" + SEPARATOR + "réponse", None, outbound.HIGH)]
+
+
+def test_tapped_message_is_edited_by_first_part_only():
+    calls = run_turn([("Choix enregistré", None), ("PDF ?", INLINE), ("Menu", MENU)], tapped=True)
+    assert calls == [("edit", "Choix enregistré" + SEPARATOR + "PDF ?", INLINE), ("send", "Menu", MENU)]
+
+
+def test_reply_keyboard_cannot_replace_tapped_message():
+    # editMessageText refuse un clavier de réponse : nouveau message
+    calls = run_turn([("Menu", MENU)], tapped=True)
+    assert calls == [("send", "Menu", MENU)]
+
+
+def test_failed_edit_falls_back_to_new_message():
+    calls = run_turn([("Résultat", None)], tapped=True, edit_fails=True)
+    assert calls == [("send", "Résultat", None)]
+
+
+def test_document_keeps_order_and_ends_tapped_edit():
+    calls = run_turn([("Votre PDF :", None), b"%PDF", ("Merci", None)], tapped=True)
+    assert calls == [("edit", "Votre PDF :", None), ("document", b"%PDF", None), ("send", "Merci", None)]
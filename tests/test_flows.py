@@ -0,0 +1,171 @@
+# tests/test_flows.py
+# Moteur de parcours (FlowEngine.accept) et commandes en une ligne (Product.read_command,
+# FlowEngine.one_shot) sur les produits réels de main.py, avec les tables du dépôt.
+import asyncio
+import re
+
+import pytest
+
+import main
+from flows import FlowEngine, choice_pattern, CALLBACK_SEP
+
+
+class FakeMessage:
+    def __init__(self, sent):
+        self.sent = sent
+
+    async def reply_text(self, text, reply_markup=None):
+        self.sent.append((text, reply_markup))
+
+
+class FakeUser:
+    id = 42
+    first_name = "Test"
+
+
+class FakeUpdate:
+    def __init__(self, sent, text=""):
+        self.effective_message = self.message = FakeMessage(sent)
+        self.message.text = text
+        self.effective_user = FakeUser()
+        self.callback_query = None
+
+
+class FakeContext:
+    def __init__(self, args=None):
+        self.user_data = {}
+        self.args = args
+
+
+MENU, PDF = "menu", "pdf"
+
+
+@pytest.fixture()
+def engine(tables):
+    async def back_to_menu(update, context):
+        context.user_data.clear()
+        return MENU
+
+    async def on_quote(update, context):
+        return PDF
+
+    return FlowEngine(main.PRODUCTS, tables=lambda: tables, back_to_menu=back_to_menu, on_quote=on_quote)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+# -------------------------
+# Grammaire des commandes en une ligne
+# -------------------------
+def read(engine, tables, name, text):
+    return engine.products[name].read_command(text, tables)
+
+
+def test_command_assur(engine, tables):
+    data, error = read(engine, tables, "assur", "P 1985 10 3 50000")
+    assert error is None
+    assert data["typCot"] == 1 and data["ddNaiss"] == 1985 and data["dureeCot"] == 10
+    assert data["nbRente"] == 3 and data["montant"] == 50000.0
+    assert read(engine, tables, "assur", "c 1985 10 3 50000")[0]["typCot"] == 2
+
+
+def test_command_wrong_arity(engine, tables):
+    # jeton manquant ou en trop : format seul, sans message d'étape
+    assert read(engine, tables, "assur", "P 1985 10 3") == (None, None)
+    assert read(engine, tables, "assur", "P 1985 10 3 50000 9") == (None, None)
+    assert read(engine, tables, "emprunteur", "") == (None, None)
+
+
+def test_command_step_error(engine, tables):
+    data, error = read(engine, tables, "assur", "P 1985 99 3 50000")
+    assert data is None
+    assert error == "Durée hors intervalle. Entrez une durée entre 5 et 20."
+    data, error = read(engine, tables, "assur", "X 1985 10 3 50000")
+    assert data is None and error.startswith("Choix invalide")
+
+
+def test_command_conditional_step(engine, tables):
+    # FER+ : cotisation libre uniquement pour H
+    data, error = read(engine, tables, "fer", "c 12")
+    assert error is None and data["fer_choix"] == "C" and "fer_montant" not in data
+    assert read(engine, tables, "fer", "C 12 150000") == (None, None)
+    assert read(engine, tables, "fer", "H 12") == (None, None)
+    data, error = read(engine, tables, "fer", "H 12 150000")
+    assert error is None and data["fer_montant"] == 150000.0
+    data, error = read(engine, tables, "fer", "H 12 100000")
+    assert data is None and "strictement supérieure" in error
+
+
+def test_command_choices_and_amounts(engine, tables):
+    data, error = read(engine, tables, "ibekelia", "1985 m 2")
+    assert error is None and data["perCot"] == "M" and data["capObsq"] == 2000000
+    data, error = read(engine, tables, "emprunteur", "1980 240 5,000,000")
+    assert error is None and data["capPret"] == 5000000.0
+
+
+# -------------------------
+# Parcours pas à pas
+# -------------------------
+def test_flow_fer_step_by_step(engine):
+    sent, ctx = [], FakeContext()
+    update = FakeUpdate(sent)
+    state = run(engine.entry("fer")(update, ctx))
+    assert state == main.FER_CHOIX
+    # étape à choix fixe : clavier inline joint à l'accueil
+    assert sent[-1][1] is engine.products["fer"].steps[0].keyboard
+
+    assert run(engine.accept(update, ctx, main.FER_CHOIX, "c")) == main.FER_DUREE
+    assert ctx.user_data["fer_choix"] == "C"
+
+    # saisie invalide : même état, message d'erreur, rien de stocké
+    n = len(sent)
+    assert run(engine.accept(update, ctx, main.FER_DUREE, "abc")) == main.FER_DUREE
+    assert sent[n][0] == "Durée invalide. Entrez un entier entre 1 et 47."
+    assert "fer_duree" not in ctx.user_data
+
+    assert run(engine.accept(update, ctx, main.FER_DUREE, "12")) == PDF
+    assert sent[-1][0].startswith("✅")
+    assert ctx.user_data["last_recap"]["product"] == "FER+"
+
+
+def test_flow_menu_action(engine):
+    # Emprunteur : durée sans taux -> message puis retour au menu
+    sent, ctx = [], FakeContext()
+    update = FakeUpdate(sent)
+    run(engine.entry("emprunteur")(update, ctx))
+    assert run(engine.accept(update, ctx, main.DNAISS_E, "1980")) == main.DUREE_PRET
+    assert run(engine.accept(update, ctx, main.DUREE_PRET, "400")) == MENU
+    assert sent[-1][0].startswith("Aucun taux trouvé pour une durée de 400 mois")
+    assert ctx.user_data == {}
+
+
+def test_one_shot_through_entry(engine):
+    sent = []
+    ctx = FakeContext(args=["C", "12"])
+    assert run(engine.entry("fer")(FakeUpdate(sent), ctx)) == PDF
+    assert sent[-1][0].startswith("✅")
+
+    # erreur : état inchangé (None) et rappel du format
+    sent = []
+    assert run(engine.entry("fer")(FakeUpdate(sent), FakeContext(args=["Z", "12"]))) is None
+    assert sent[-1][0].endswith("Format : " + engine.products["fer"].usage)
+
+
+def test_fer_h_quote_matches_batch(engine, tables):
+    # cotisation libre : même calcul que quotation.quote_fer (CLI par lots)
+    sent, ctx = [], FakeContext(args=["H", "12", "150000"])
+    assert run(engine.entry("fer")(FakeUpdate(sent), ctx)) == PDF
+    expected = main.quotation.quote_fer(tables, "H", 12, 150000.0)
+    text = sent[-1][0]
+    assert f"dont {expected['cotMensEp']:,.0f} de prime épargne et 20 000 de prime décès" in text
+    assert f"capital acquis de {expected['capAcquis']:,.2f}" in text
+    assert "capital décès de 20 000 000 +" in text
+    assert ctx.user_data["last_recap"]["results"]["Capital décès garanti"] == "20 000 000 + épargne"
+
+
+def test_choice_pattern_is_state_exact():
+    # l'état 1 ne capte pas les boutons de l'état 16
+    assert re.match(choice_pattern(1), f"1{CALLBACK_SEP}oui")
+    assert not re.match(choice_pattern(1), f"16{CALLBACK_SEP}oui")
@@ -0,0 +1,76 @@
+# tests/test_http_local.py
+# Serveur HTTP local : lecture des requêtes (keep-alive, corps) et réponses d'erreur
+# sur les requêtes malformées ou trop grandes, sans faire tomber la connexion.
+import asyncio
+
+import pytest
+
+from http_local import HttpServer, MAX_BODY, MAX_HEADER_LINES
+
+
+async def echo(request):
+    return 200, {"Content-Type": "text/plain"}, request.method.encode() + b" " + request.body
+
+
+async def boom(request):
+    raise RuntimeError("handler en échec")
+
+
+async def exchange(raw: bytes, responses: int = 1):
+    """Envoie `raw` tel quel et renvoie les codes des `responses` premières réponses."""
+    server = HttpServer("127.0.0.1", 0, {("POST", "/echo"): echo, ("GET", "/echo"): echo, ("GET", "/boom"): boom})
+    await server.start()
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        writer.write(raw)
+        await writer.drain()
+        statuses, bodies = [], []
+        for _ in range(responses):
+            status_line = await reader.readline()
+            if not status_line:
+                break
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode().partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            statuses.append(int(status_line.split()[1]))
+            bodies.append(await reader.readexactly(length))
+        writer.close()
+        return statuses, bodies
+    finally:
+        await server.stop()
+
+
+def run(raw: bytes, responses: int = 1):
+    return asyncio.run(exchange(raw, responses))
+
+
+def test_keep_alive_and_body():
+    raw = (b"POST /echo HTTP/1.1\r\nContent-Length: 5\r\n\r\nhello"
+           b"GET /echo?x=1 HTTP/1.1\r\n\r\n"
+           b"GET /absent HTTP/1.1\r\nConnection: close\r\n\r\n")
+    statuses, bodies = run(raw, responses=3)
+    assert statuses == [200, 200, 404]
+    assert bodies[:2] == [b"POST hello", b"GET "]
+
+
+def test_handler_error_is_500():
+    assert run(b"GET /boom HTTP/1.1\r\nConnection: close\r\n\r\n")[0] == [500]
+
+
+@pytest.mark.parametrize("raw, status", [
+    (b"GARBAGE\r\n\r\n", 400),
+    (b"POST /echo HTTP/1.1\r\nContent-Length: abc\r\n\r\n", 400),
+    (b"POST /echo HTTP/1.1\r\nContent-Length: -5\r\n\r\n", 400),
+    (b"POST /echo HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % (MAX_BODY + 1), 413),
+    # lignes au-delà de la limite du StreamReader (64 Kio)
+    (b"GET /" + b"a" * 70000 + b" HTTP/1.1\r\n\r\n", 414),
+    (b"GET /echo HTTP/1.1\r\nX-Long: " + b"a" * 70000 + b"\r\n\r\n", 431),
+    (b"GET /echo HTTP/1.1\r\n" + b"X-H: 1\r\n" * (MAX_HEADER_LINES + 1) + b"\r\n", 431),
+])
+def test_malformed_requests(raw, status):
+    assert run(raw)[0] == [status]
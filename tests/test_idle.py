@@ -0,0 +1,107 @@
+# tests/test_idle.py
+# IdleSweeper : fin des conversations inactives, user_data libéré seulement quand
+# l'utilisateur n'a plus de conversation en cours, avis d'expiration.
+import asyncio
+import logging
+
+from telegram.ext import CommandHandler, ConversationHandler
+
+import logs
+from idle import IdleSweeper, NOTICE_TEXT
+
+SAISIE, MENU = 1, 0
+TIMEOUT = 600
+
+
+class FakeBot:
+    def __init__(self, fail=False):
+        self.sent = []
+        self.fail = fail
+
+    async def send_message(self, chat_id, text):
+        if self.fail:
+            raise RuntimeError("bot bloqué")
+        self.sent.append((chat_id, text))
+
+
+class FakeApplication:
+    def __init__(self, fail=False):
+        self.bot = FakeBot(fail)
+        self.dropped = []
+
+    def drop_user_data(self, user_id):
+        self.dropped.append(user_id)
+
+
+def make_sweeper(**kwargs):
+    async def noop(update, context):
+        return None
+
+    conv = ConversationHandler(entry_points=[CommandHandler("start", noop)], states={SAISIE: [], MENU: []},
+                               fallbacks=[])
+    return IdleSweeper(conv, TIMEOUT, {SAISIE: "saisie", MENU: "menu"}, **kwargs), conv._conversations
+
+
+def sweep(sweeper, application, now):
+    return asyncio.run(sweeper.sweep(application, now=now))
+
+
+def test_expires_idle_conversation():
+    sweeper, conversations = make_sweeper()
+    conversations[(5, 5)] = SAISIE
+    conversations[(6, 6)] = SAISIE
+    sweeper._last_seen[(5, 5)] = 0.0
+    sweeper._last_seen[(6, 6)] = 500.0
+    app = FakeApplication()
+
+    assert sweep(sweeper, app, now=700.0) == [(5, 5)]
+    assert conversations == {(6, 6): SAISIE}
+    assert app.dropped == [5]
+    assert app.bot.sent == [(5, NOTICE_TEXT.format(minutes=10))]
+    assert (5, 5) not in sweeper._last_seen
+
+
+def test_keeps_user_data_while_another_conversation_lives():
+    # même utilisateur dans deux discussions : seule celle du groupe a expiré
+    sweeper, conversations = make_sweeper()
+    conversations[(-100, 5)] = SAISIE
+    conversations[(5, 5)] = SAISIE
+    sweeper._last_seen[(-100, 5)] = 0.0
+    sweeper._last_seen[(5, 5)] = 650.0
+    app = FakeApplication()
+
+    assert sweep(sweeper, app, now=700.0) == [(-100, 5)]
+    assert app.dropped == []
+    # la seconde expire à son tour : user_data libéré
+    assert sweep(sweeper, app, now=2000.0) == [(5, 5)]
+    assert app.dropped == [5]
+
+
+def test_quiet_state_and_restored_conversations():
+    sweeper, conversations = make_sweeper(quiet_states=(MENU,))
+    conversations[(7, 7)] = MENU
+    app = FakeApplication()
+    # conversation restaurée (jamais vue) : le délai part du premier balayage
+    assert sweep(sweeper, app, now=10000.0) == []
+    assert sweep(sweeper, app, now=10000.0 + TIMEOUT + 1) == [(7, 7)]
+    # au menu : pas d'avis
+    assert app.bot.sent == []
+    assert app.dropped == [7]
+
+
+def test_forgets_finished_conversations():
+    sweeper, conversations = make_sweeper()
+    sweeper._last_seen[(8, 8)] = 0.0
+    assert sweep(sweeper, FakeApplication(), now=1.0) == []
+    assert sweeper._last_seen == {}
+
+
+def test_notice_failure_logs_hashed_chat_id(caplog):
+    sweeper, conversations = make_sweeper()
+    conversations[(123456789, 123456789)] = SAISIE
+    sweeper._last_seen[(123456789, 123456789)] = 0.0
+    with caplog.at_level(logging.INFO, logger="idle"):
+        sweep(sweeper, FakeApplication(fail=True), now=TIMEOUT + 1.0)
+    messages = [r.getMessage() for r in caplog.records if r.name == "idle"]
+    assert any(logs.user_hash(123456789) in m for m in messages)
+    assert not any("123456789" in m for m in messages)
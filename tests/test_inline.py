@@ -0,0 +1,101 @@
+# tests/test_inline.py
+# InlineQuoter : seule la dernière requête d'une rafale est répondue (par utilisateur),
+# réponse chronométrée après la rafale, résultats mémorisés et oubliés au changement de tables.
+import asyncio
+
+import main
+import metrics
+import tarifs
+from flows import FlowEngine
+from inline import InlineQuoter
+
+ALIASES = {"fer": "fer", "emp": "emprunteur"}
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+
+
+class FakeInlineQuery:
+    def __init__(self, answers, user_id, text):
+        self.answers = answers
+        self.from_user = FakeUser(user_id)
+        self.query = text
+
+    async def answer(self, results, cache_time=None):
+        self.answers.append((self.from_user.id, self.query, results))
+
+
+class FakeUpdate:
+    def __init__(self, answers, user_id, text):
+        self.inline_query = FakeInlineQuery(answers, user_id, text)
+
+
+def make_quoter(tables, **kwargs):
+    current = {"tables": tables}
+    engine = FlowEngine(main.PRODUCTS, tables=lambda: current["tables"], back_to_menu=None, on_quote=None)
+    return InlineQuoter(engine, ALIASES, **kwargs), current
+
+
+def superseded_total():
+    return metrics.snapshot().get(("inline_queries_total", (("outcome", "superseded"),)), 0)
+
+
+def test_only_last_query_of_a_burst_is_answered(tables):
+    timed = []
+
+    def timer(callback):
+        async def wrapper(update, context):
+            timed.append(update.inline_query.query)
+            return await callback(update, context)
+        return wrapper
+
+    async def scenario():
+        quoter, _ = make_quoter(tables, debounce=0.05, timer=timer)
+        answers = []
+        before = superseded_total()
+        for text in ("f", "fer", "fer C", "fer C 10"):
+            await quoter.handle(FakeUpdate(answers, 1, text), None)
+            await asyncio.sleep(0.005)
+        # autre utilisateur : sa rafale ne remplace pas celle du premier
+        await quoter.handle(FakeUpdate(answers, 2, "emp 1980 240 3000000"), None)
+        await asyncio.sleep(0.15)
+        return quoter, answers, superseded_total() - before
+
+    quoter, answers, superseded = asyncio.run(scenario())
+    assert sorted((uid, text) for uid, text, _ in answers) == [(1, "fer C 10"), (2, "emp 1980 240 3000000")]
+    assert superseded == 3
+    # seules les réponses envoyées sont chronométrées
+    assert sorted(timed) == ["emp 1980 240 3000000", "fer C 10"]
+    assert quoter._pending == {} and quoter._tasks == set()
+
+
+def test_reply_goes_out_once_debounce_elapsed(tables):
+    async def scenario():
+        quoter, _ = make_quoter(tables, debounce=0.05)
+        answers = []
+        await quoter.handle(FakeUpdate(answers, 1, "fer C 10"), None)
+        # tâche gardée jusqu'à la fin de la réponse
+        assert len(quoter._tasks) == 1
+        await asyncio.sleep(0.1)
+        return quoter, answers
+
+    quoter, answers = asyncio.run(scenario())
+    assert [text for _, text, _ in answers] == ["fer C 10"]
+    assert quoter._tasks == set()
+
+
+def test_memo_is_cleared_when_tables_change(tables, frames):
+    quoter, current = make_quoter(tables, debounce=0)
+    first = quoter.results("fer C 10")
+    # même requête normalisée : servie par le mémo
+    assert quoter.results("FER  c 10") is first
+    assert len(quoter._memo) == 1
+
+    current["tables"] = tarifs.TarifTables(frames)
+    second = quoter.results("fer C 10")
+    assert second is not first
+    assert quoter._memo_tables is current["tables"]
+    assert list(quoter._memo) == ["fer c 10"]
+    assert second[0].description == first[0].description
@@ -0,0 +1,42 @@
+# tests/test_intents.py
+# IntentRouter : saisies exactes, commandes, fautes de frappe acceptées au-dessus des seuils
+# (FUZZY_MIN_SCORE, FUZZY_MARGIN), saisies sans rapport ou ambiguës rejetées.
+import pytest
+
+import main
+from intents import IntentRouter, fold
+
+ROUTER = main.MENU_INTENTS
+
+
+@pytest.mark.parametrize("text, target", [
+    ("1", main.start_assur),
+    ("Assur’Éducation", main.start_assur),
+    ("  FER+ ", main.start_fer),
+    ("/emp", main.start_emprunteur),
+    ("menu", main.back_to_menu),
+    # fautes de frappe
+    ("ibekalia", main.start_ibekelia),
+    ("emprunter", main.start_emprunteur),
+    ("selction medicale", main.info_selection),
+    ("annule", main.cancel),
+])
+def test_routes(text, target):
+    assert ROUTER.route(text) is target
+
+
+@pytest.mark.parametrize("text", ["oui", "non", "1985", "7", "fe", ""])
+def test_unrelated_input_is_not_routed(text):
+    # réponses d'une autre étape (année, oui/non) tapées au menu : pas de parcours lancé
+    assert ROUTER.route(text) is None
+
+
+def test_ambiguous_match_is_rejected():
+    router = IntentRouter({"a": ("produit alpha",), "b": ("produit alphb",)})
+    assert router.route("produit alph") is None
+    assert router.route("produit alpha") == "a"
+
+
+def test_fold():
+    assert fold("  Sélection   Médicale ") == "selection medicale"
+    assert fold("Assur’Education") == "assur'education"
@@ -0,0 +1,34 @@
+# tests/test_logs.py
+# SamplingFilter : rafale puis échantillonnage par site d'appel, erreurs jamais écartées.
+import logging
+
+from logs import SamplingFilter
+
+
+def record(level=logging.WARNING, msg="Aucun tarif pour %s", created=0.0):
+    rec = logging.LogRecord("flows", level, __file__, 1, msg, ("x",), None)
+    rec.created = created
+    return rec
+
+
+def test_burst_then_sampling():
+    f = SamplingFilter(burst=3, period=60, sample_every=5)
+    records = [record() for _ in range(20)]
+    kept = [i for i, rec in enumerate(records) if f.filter(rec)]
+    assert kept == [0, 1, 2, 7, 12, 17]
+    # le premier message gardé après des suppressions les compte
+    assert records[7].suppressed == 4 and records[7].sampled == "1/5"
+    assert not hasattr(records[2], "suppressed")
+
+
+def test_errors_always_pass():
+    f = SamplingFilter(burst=1, period=60, sample_every=1000)
+    assert all(f.filter(record(logging.ERROR)) for _ in range(50))
+    assert sum(f.filter(record()) for _ in range(50)) == 1
+
+
+def test_new_period_resets_burst():
+    f = SamplingFilter(burst=2, period=60, sample_every=1000)
+    assert [f.filter(record(created=0.0)) for _ in range(3)] == [True, True, False]
+    rec = record(created=61.0)
+    assert f.filter(rec) and rec.suppressed == 1
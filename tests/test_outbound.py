@@ -0,0 +1,100 @@
+# tests/test_outbound.py
+# OutboundScheduler : nouvel essai sur RetryAfter après une pause globale, abandon
+# après max_retries, envois des autres chats retenus pendant la pause.
+import asyncio
+import datetime
+
+import pytest
+from telegram.error import RetryAfter
+
+import metrics
+import outbound
+from outbound import OutboundScheduler
+
+PAUSE = 0.2
+
+# lecture de RetryAfter.retry_after (int ou timedelta selon PTB_TIMEDELTA, cf. outbound._seconds)
+pytestmark = pytest.mark.filterwarnings("ignore::telegram.warnings.PTBDeprecationWarning")
+
+
+def retries_total():
+    return metrics.snapshot().get(("outbound_retry_after_total", ()), 0)
+
+
+def send(scheduler, callback, chat_id=1):
+    return scheduler.process_request(callback, (), {}, "sendMessage", {"chat_id": chat_id}, None)
+
+
+class Api:
+    """Appel API factice : lève RetryAfter `failures` fois, puis réussit."""
+
+    def __init__(self, failures: int, loop_time):
+        self.failures = failures
+        self.calls = []
+        self.loop_time = loop_time
+
+    async def __call__(self):
+        self.calls.append(self.loop_time())
+        if self.failures:
+            self.failures -= 1
+            raise RetryAfter(datetime.timedelta(seconds=PAUSE))
+        return "ok"
+
+
+def test_retry_after_then_success():
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        api = Api(1, loop.time)
+        scheduler = OutboundScheduler(global_rate=0, chat_rate=0)
+        before = retries_total()
+        result = await send(scheduler, api)
+        return result, api.calls, retries_total() - before
+
+    result, calls, retries = asyncio.run(scenario())
+    assert result == "ok"
+    assert len(calls) == 2
+    # le second essai attend la pause demandée par Telegram
+    assert calls[1] - calls[0] >= PAUSE * 0.9
+    assert retries == 1
+
+
+def test_retry_after_gives_up_after_max_retries():
+    async def scenario():
+        api = Api(10, asyncio.get_running_loop().time)
+        scheduler = OutboundScheduler(global_rate=0, chat_rate=0, max_retries=2)
+        with pytest.raises(RetryAfter):
+            await send(scheduler, api)
+        return api.calls
+
+    assert len(asyncio.run(scenario())) == 3
+
+
+def test_pause_holds_other_chats():
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        scheduler = OutboundScheduler(global_rate=0, chat_rate=0)
+        flaky = Api(1, loop.time)
+        other = Api(0, loop.time)
+        first = loop.create_task(send(scheduler, flaky, chat_id=1))
+        # laisse le premier envoi recevoir RetryAfter et poser la pause globale
+        await asyncio.sleep(0.01)
+        t0 = loop.time()
+        with outbound.lane(outbound.HIGH):
+            await send(scheduler, other, chat_id=2)
+        await first
+        return other.calls[0] - t0
+
+    # l'autre chat n'est servi qu'à la fin de la pause
+    assert asyncio.run(scenario()) >= PAUSE * 0.8
+
+
+def test_requests_without_chat_skip_the_gate():
+    async def scenario():
+        scheduler = OutboundScheduler(global_rate=1, global_burst=1, chat_rate=0)
+        api = Api(0, asyncio.get_running_loop().time)
+        for _ in range(5):
+            await scheduler.process_request(api, (), {}, "answerCallbackQuery", {}, None)
+        return api.calls
+
+    calls = asyncio.run(scenario())
+    assert len(calls) == 5 and calls[-1] - calls[0] < 0.1
@@ -0,0 +1,85 @@
+# tests/test_pdf_pool.py
+# PdfRenderPool : file d'attente bornée (PdfQueueFull), slot gardé par un rendu qui a
+# dépassé le délai jusqu'à sa fin réelle, arrêt du pool.
+import asyncio
+import threading
+
+import pytest
+
+import pdf_recap
+from pdf_recap import PdfRenderPool, PdfQueueFull
+
+RECAP = {"produit": "test"}
+
+
+@pytest.fixture
+def gate(monkeypatch):
+    """Rendu factice bloqué jusqu'à gate.set()."""
+    event = threading.Event()
+
+    def render(recap):
+        event.wait(5)
+        return b"%PDF", 0.0
+
+    monkeypatch.setattr(pdf_recap, "_render_timed", render)
+    yield event
+    event.set()
+
+
+async def settle(condition, timeout=2.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition() and loop.time() < deadline:
+        await asyncio.sleep(0.01)
+
+
+def test_queue_full_rejects(gate):
+    async def scenario():
+        pool = PdfRenderPool(workers=1, max_queue=1, timeout=5)
+        loop = asyncio.get_running_loop()
+        try:
+            first = loop.create_task(pool.render(RECAP))
+            await settle(lambda: pool._in_flight == 1)
+            second = loop.create_task(pool.render(RECAP))
+            await settle(lambda: pool._waiting == 1)
+            with pytest.raises(PdfQueueFull):
+                await pool.render(RECAP)
+            gate.set()
+            return await asyncio.gather(first, second), pool._waiting, pool._in_flight
+        finally:
+            pool.shutdown()
+
+    results, waiting, in_flight = asyncio.run(scenario())
+    assert results == [b"%PDF", b"%PDF"]
+    assert waiting == 0 and in_flight == 0
+
+
+def test_timed_out_render_keeps_its_slot(gate):
+    async def scenario():
+        pool = PdfRenderPool(workers=1, max_queue=5, timeout=0.1)
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await pool.render(RECAP)
+            # le thread rend toujours : le slot reste pris, la demande suivante attend puis abandonne
+            assert pool._in_flight == 1
+            with pytest.raises(asyncio.TimeoutError):
+                await pool.render(RECAP)
+            assert pool._waiting == 0
+            gate.set()
+            await settle(lambda: pool._in_flight == 0)
+            assert pool._in_flight == 0
+            # slot rendu : la demande suivante passe
+            return await pool.render(RECAP)
+        finally:
+            pool.shutdown()
+
+    assert asyncio.run(scenario()) == b"%PDF"
+
+
+def test_shutdown_is_idempotent():
+    pool = PdfRenderPool(workers=1)
+    pool.shutdown()
+    pool._ensure_started()
+    pool.shutdown()
+    pool.shutdown()
+    assert pool._executor is None
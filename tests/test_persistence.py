@@ -0,0 +1,218 @@
+# tests/test_persistence.py
+# CompactPersistence : aller-retour user_data + états de conversation à travers le
+# stockage SQLite, éviction, enregistrements non sérialisables et écritures en échec.
+import asyncio
+import time
+
+import numpy as np
+
+from persistence import CompactPersistence, SqliteStateStore, MemoryStateStore, encode_record, decode_record
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def settle(persistence):
+    # laisse passer l'écriture différée (debounce) et son thread
+    await asyncio.sleep(persistence.debounce + 0.05)
+    if persistence._flush_task is not None:
+        await asyncio.gather(persistence._flush_task, return_exceptions=True)
+
+
+def test_encode_round_trip():
+    small = {"u": {"age": 41}}
+    big = {"u": {"recap": "x" * 1000}, "c": {"cotation": [[[1, 2], 5]]}}
+    assert encode_record(small)[:1] == b"j"
+    assert encode_record(big)[:1] == b"z"
+    assert decode_record(encode_record(small)) == small
+    assert decode_record(encode_record(big)) == big
+    # valeurs numpy des tables tarifaires
+    assert decode_record(encode_record({"u": {"taux": np.float64(0.5), "n": np.int64(3)}})) == {"u": {"taux": 0.5, "n": 3}}
+
+
+def test_sqlite_round_trip(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+
+    async def write():
+        p = CompactPersistence(SqliteStateStore(path), debounce=0.01)
+        await p.get_user_data()
+        await p.update_user_data(7, {"fer_choix": "C", "age": 41})
+        await p.update_conversation("cotation", (7, 7), 12)
+        await p.update_conversation("cotation", (-100, 7), 3)
+        await p.update_user_data(8, {"x": 1})
+        await p.update_conversation("cotation", (8, 8), 4)
+        await p.update_conversation("cotation", (8, 8), None)
+        await settle(p)
+        await p.flush()
+
+    async def read():
+        p = CompactPersistence(SqliteStateStore(path))
+        user_data = await p.get_user_data()
+        conversations = await p.get_conversations("cotation")
+        await p.flush()
+        return user_data, conversations
+
+    run(write())
+    user_data, conversations = run(read())
+    assert user_data == {7: {"fer_choix": "C", "age": 41}, 8: {"x": 1}}
+    # clés rendues en tuples, comme les attend ConversationHandler
+    assert conversations == {(7, 7): 12, (-100, 7): 3}
+
+
+def test_drop_user_data_evicts_idle_user(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+
+    async def scenario():
+        p = CompactPersistence(SqliteStateStore(path), debounce=0.01)
+        await p.get_user_data()
+        await p.update_user_data(1, {"a": 1})
+        await p.update_user_data(2, {"b": 2})
+        await p.update_conversation("cotation", (2, 2), 5)
+        await settle(p)
+        # 1 : plus rien -> supprimé du stockage ; 2 : conversation en cours -> conservé sans user_data
+        await p.drop_user_data(1)
+        await p.drop_user_data(2)
+        await settle(p)
+        await p.flush()
+        q = CompactPersistence(SqliteStateStore(path))
+        result = await q.get_user_data(), await q.get_conversations("cotation"), len(q.store.load(0))
+        await q.flush()
+        return result
+
+    user_data, conversations, rows = run(scenario())
+    assert user_data == {}
+    assert conversations == {(2, 2): 5}
+    assert rows == 1
+
+
+def test_ttl_eviction_on_load():
+    store = MemoryStateStore()
+    store.write([(1, time.time() - 3600, encode_record({"u": {"old": True}})),
+                 (2, time.time(), encode_record({"u": {"new": True}}))])
+    p = CompactPersistence(store, ttl=60)
+    assert run(p.get_user_data()) == {2: {"new": True}}
+
+
+def test_unserialisable_record_is_skipped_and_kept_dirty():
+    async def scenario():
+        p = CompactPersistence(debounce=0.01)
+        await p.get_user_data()
+        await p.update_user_data(1, {"ok": 1})
+        await p.update_user_data(2, {"bad": object()})
+        await settle(p)
+        stored = sorted(uid for uid, _, _ in p.store.load(0))
+        dirty = set(p._dirty)
+        # valeur corrigée : écrite au passage suivant
+        await p.update_user_data(2, {"ok": 2})
+        await settle(p)
+        return stored, dirty, sorted(uid for uid, _, _ in p.store.load(0)), set(p._dirty)
+
+    stored, dirty, stored_after, dirty_after = run(scenario())
+    assert stored == [1]
+    assert dirty == {2}
+    assert stored_after == [1, 2]
+    assert dirty_after == set()
+
+
+def test_failed_write_is_requeued():
+    class FlakyStore(MemoryStateStore):
+        fail = True
+
+        def write(self, rows):
+            if self.fail:
+                raise OSError("disque plein")
+            super().write(rows)
+
+    async def scenario():
+        p = CompactPersistence(FlakyStore(), debounce=0.01)
+        await p.get_user_data()
+        await p.update_user_data(1, {"a": 1})
+        await settle(p)
+        dirty = set(p._dirty)
+        p.store.fail = False
+        await p.update_user_data(2, {"b": 2})
+        await settle(p)
+        return dirty, sorted(uid for uid, _, _ in p.store.load(0))
+
+    dirty, stored = run(scenario())
+    assert dirty == {1}
+    assert stored == [1, 2]
+
+
+def test_evict_idle_ends_conversations():
+    from telegram.ext import CommandHandler, ConversationHandler
+
+    from persistence import evict_idle
+
+    class FakeApplication:
+        def __init__(self):
+            self.dropped = []
+
+        def drop_user_data(self, user_id):
+            self.dropped.append(user_id)
+
+    async def noop(update, context):
+        return None
+
+    async def scenario():
+        conv = ConversationHandler(entry_points=[CommandHandler("start", noop)], states={5: [], 3: []},
+                                   fallbacks=[], name="cotation")
+        conv._conversations.update({(1, 1): 5, (-100, 1): 3, (2, 2): 5})
+        p = CompactPersistence(ttl=60, debounce=0.01)
+        await p.get_user_data()
+        for key, state in conv._conversations.items():
+            await p.update_conversation("cotation", key, state)
+        p._touched[1] = time.time() - 3600
+        app = FakeApplication()
+        uids = evict_idle(app, p, [conv], now=time.time())
+        # mise à jour de persistance faite ensuite par PTB pour les clés terminées
+        await p.update_conversation("cotation", (1, 1), None)
+        await p.update_conversation("cotation", (-100, 1), None)
+        await settle(p)
+        return uids, dict(conv._conversations), app.dropped, await p.get_conversations("cotation"), p.store.load(0)
+
+    uids, live, dropped, persisted, rows = run(scenario())
+    assert uids == [1]
+    assert live == {(2, 2): 5}
+    assert dropped == [1]
+    assert persisted == {(2, 2): 5}
+    # l'utilisateur évincé n'est pas réécrit par les fins de conversation
+    assert [uid for uid, _, _ in rows] == [2]
+
+
+def test_flush_waits_for_write_in_progress():
+    import threading
+
+    class SlowStore(MemoryStateStore):
+        def __init__(self):
+            super().__init__()
+            self.writing = threading.Event()
+            self.active = self.overlap = 0
+            self.closed_during_write = False
+
+        def write(self, rows):
+            self.active += 1
+            self.overlap = max(self.overlap, self.active)
+            self.writing.set()
+            time.sleep(0.2)
+            super().write(rows)
+            self.active -= 1
+
+        def close(self):
+            self.closed_during_write = self.active > 0
+
+    async def scenario():
+        p = CompactPersistence(SlowStore(), debounce=0.01)
+        await p.get_user_data()
+        await p.update_user_data(1, {"a": 1})
+        # l'écriture différée est partie dans son thread
+        await asyncio.get_running_loop().run_in_executor(None, p.store.writing.wait, 2)
+        await p.update_user_data(2, {"b": 2})
+        await p.flush()
+        return p.store.overlap, p.store.closed_during_write, sorted(uid for uid, _, _ in p.store.load(0))
+
+    overlap, closed_during_write, stored = run(scenario())
+    # écriture finale après celle du thread, stockage fermé une fois tout écrit
+    assert overlap == 1 and not closed_during_write
+    assert stored == [1, 2]
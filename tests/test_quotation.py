@@ -0,0 +1,50 @@
+# tests/test_quotation.py
+# CLI de cotation par lots (python quotation.py demandes.csv) : statut de chaque ligne.
+import csv
+
+import quotation
+
+HEADER = ",".join(quotation.INPUT_COLUMNS)
+
+
+def run_cli(tmp_path, lines):
+    src, out = tmp_path / "demandes.csv", tmp_path / "resultats.csv"
+    src.write_text("\n".join([HEADER, *lines]) + "\n", encoding="utf-8")
+    quotation.main([str(src), "-o", str(out)])
+    with open(out, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def test_assur_typ_cot_must_be_1_or_2(tmp_path):
+    rows = run_cli(tmp_path, [
+        "assur,35,1,10,3,50000,,,",
+        "assur,35,,10,3,50000,,,",
+        "assur,35,7,10,3,50000,,,",
+        "assur,35,2,10,3,50000,,,",
+    ])
+    assert [r["statut"] for r in rows] == ["ok", "saisie_invalide", "saisie_invalide", "ok"]
+    # cotisation définie : la rente est déduite du montant, prestation définie : l'inverse
+    assert float(rows[0]["rente"]) == 50000.0
+    assert float(rows[3]["cotisation"]) == 50000.0
+    assert rows[1]["rente"] == rows[2]["rente"] == ""
+
+
+def test_numbers_out_of_range(tmp_path):
+    rows = run_cli(tmp_path, [
+        "assur,inf,1,10,3,50000,,,",
+        "assur,1e30,1,10,3,50000,,,",
+        "assur,35,1,10,3,1e400,,,",
+        "emprunteur,40,,240,,5000000,,,",
+    ])
+    assert [r["statut"] for r in rows] == ["hors_grille", "hors_grille", "saisie_invalide", "ok"]
+
+
+def test_fer_h_requires_amount(tmp_path):
+    rows = run_cli(tmp_path, [
+        "fer,,,10,,,,,H",
+        "fer,,,10,,100000,,,H",
+        "fer,,,10,,150000,,,H",
+        "fer,,,10,,,,,C",
+        "autre,,,,,,,,",
+    ])
+    assert [r["statut"] for r in rows] == ["saisie_invalide", "hors_grille", "ok", "ok", "produit_inconnu"]
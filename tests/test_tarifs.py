@@ -0,0 +1,93 @@
+# tests/test_tarifs.py
+# Grilles denses (TarifTables) : mêmes réponses que les recherches pandas d'origine
+# (df.loc sur les tables normalisées), cases présentes comme absentes.
+import numpy as np
+import pandas as pd
+
+import quotation
+import tarifs
+
+
+# recherches pandas telles qu'écrites avant les grilles denses
+def pandas_taux(df_taux, age, nb_rente, duree):
+    key, col = f"{age}-{nb_rente}", str(duree)
+    if key not in df_taux.index or col not in df_taux.columns:
+        return None
+    return float(df_taux.loc[key, col])
+
+
+def pandas_prime(df_prime, age, per_cot, cap_obsq):
+    key, col = f"{age}-{per_cot}", str(cap_obsq)
+    if key not in df_prime.index or col not in df_prime.columns:
+        return None
+    return float(df_prime.loc[key, col])
+
+
+def pandas_fer(df_fer_table, duree):
+    if duree not in df_fer_table.index:
+        return None
+    return float(df_fer_table.loc[duree, "tauxP"])
+
+
+def pandas_emp(df_emp, age, duree_mois):
+    if age not in df_emp.index or duree_mois not in df_emp.columns:
+        return None
+    val = df_emp.loc[age, duree_mois]
+    return float(val) if pd.notna(val) else None
+
+
+def assert_same(dense, reference):
+    if reference is None or reference != reference:
+        assert dense is None or dense != dense
+    else:
+        assert dense == reference
+
+
+def test_taux_parity(frames, tables):
+    df = frames["df_taux"]
+    ages = range(tables.taux_ages[0] - 2, tables.taux_ages[1] + 3)
+    durees = sorted(tables.taux_durees)
+    for age in ages:
+        for nb in range(0, 6):
+            for duree in [durees[0] - 1, *durees, durees[-1] + 1]:
+                assert_same(tables.taux(age, nb, duree), pandas_taux(df, age, nb, duree))
+
+
+def test_prime_parity(frames, tables):
+    df = frames["df_prime"]
+    for age in range(tables.prime_ages[0] - 2, tables.prime_ages[1] + 3):
+        for per in ("M", "A", "U", "X"):
+            for cap in (0, 1000000, 2000000, 3000000, 4000000, 5000000, 6000000):
+                assert_same(tables.prime(age, per, cap), pandas_prime(df, age, per, cap))
+
+
+def test_fer_parity(frames, tables):
+    df = frames["df_fer_table"]
+    for duree in range(-1, int(df.index.max()) + 3):
+        assert_same(tables.fer(duree), pandas_fer(df, duree))
+
+
+def test_emp_parity(frames, tables):
+    df = frames["df_emp"]
+    for age in range(min(tables.emp_ages) - 2, max(tables.emp_ages) + 3):
+        for mois in (0, 1, 12, 60, 120, 239, 240, 360, 361):
+            assert_same(tables.emp(age, mois), pandas_emp(df, age, mois))
+
+
+def test_batch_matches_unit_lookups(frames, tables):
+    # version vectorisée (quotation._gather) : même grille, NaN pour les cases absentes ou nulles
+    df = frames["df_taux"]
+    ages = np.arange(tables.taux_ages[0] - 2, tables.taux_ages[1] + 3)
+    n = len(ages)
+    taux = quotation.batch_assur(tables, np.full(n, 1), ages, np.full(n, 10), np.full(n, 2), np.full(n, 50000.0))["taux"]
+    for age, value in zip(ages, taux):
+        assert_same(None if np.isnan(value) else float(value), pandas_taux(df, int(age), 2, 10) or None)
+
+
+def test_cache_round_trip(frames, tmp_path):
+    # tables relues depuis le cache compilé : mêmes grilles qu'après lecture des classeurs
+    tarifs.write_cache(frames, "test", str(tmp_path))
+    cached = tarifs.TarifTables(tarifs.read_cache("test", str(tmp_path)))
+    direct = tarifs.TarifTables(frames)
+    for name in ("taux_grid", "prime_grid", "emp_grid", "fer_grid"):
+        np.testing.assert_array_equal(getattr(cached, name), getattr(direct, name))
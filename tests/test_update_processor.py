@@ -0,0 +1,97 @@
+# tests/test_update_processor.py
+# ChatOrderedUpdateProcessor : ordre d'arrivée strict dans un même chat, chats différents
+# traités en parallèle jusqu'à la limite, entrées par chat libérées une fois vides.
+import asyncio
+
+import pytest
+
+from update_processor import ChatOrderedUpdateProcessor, chat_key
+
+
+class FakeChat:
+    def __init__(self, chat_id):
+        self.id = chat_id
+
+
+class FakeUpdate:
+    def __init__(self, chat_id=None, user_id=None):
+        self.effective_chat = FakeChat(chat_id) if chat_id is not None else None
+        self.effective_user = FakeChat(user_id) if user_id is not None else None
+
+
+class Recorder:
+    """Coroutines de traitement factices : journal début/fin et concurrence maximale."""
+
+    def __init__(self):
+        self.events = []
+        self.active = {}
+        self.max_per_chat = 0
+        self.running = self.max_running = 0
+
+    async def handle(self, chat, name, duration):
+        self.events.append(("start", name))
+        self.active[chat] = self.active.get(chat, 0) + 1
+        self.max_per_chat = max(self.max_per_chat, self.active[chat])
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(duration)
+        self.running -= 1
+        self.active[chat] -= 1
+        self.events.append(("end", name))
+
+
+def process(processor, recorder, chat, name, duration):
+    update = FakeUpdate(chat)
+    return processor.process_update(update, recorder.handle(chat, name, duration))
+
+
+def test_same_chat_is_fifo():
+    async def scenario():
+        processor, recorder = ChatOrderedUpdateProcessor(8), Recorder()
+        # durées décroissantes : sans ordonnancement, c finirait avant a
+        await asyncio.gather(*(process(processor, recorder, 1, name, d)
+                               for name, d in (("a", 0.03), ("b", 0.02), ("c", 0.0))))
+        return recorder, processor.queue_depths()
+
+    recorder, depths = asyncio.run(scenario())
+    assert [name for kind, name in recorder.events if kind == "start"] == ["a", "b", "c"]
+    assert recorder.events == [("start", "a"), ("end", "a"), ("start", "b"), ("end", "b"),
+                               ("start", "c"), ("end", "c")]
+    assert recorder.max_per_chat == 1
+    assert depths == {}
+
+
+def test_chats_run_concurrently_up_to_the_limit():
+    async def scenario(limit):
+        processor, recorder = ChatOrderedUpdateProcessor(limit), Recorder()
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        await asyncio.gather(*(process(processor, recorder, chat, f"u{chat}", 0.05) for chat in range(4)))
+        return recorder.max_running, loop.time() - t0
+
+    running, elapsed = asyncio.run(scenario(4))
+    assert running == 4 and elapsed < 0.15
+    running, elapsed = asyncio.run(scenario(2))
+    assert running == 2 and elapsed >= 0.09
+
+
+def test_chat_waits_do_not_block_other_chats():
+    async def scenario():
+        processor, recorder = ChatOrderedUpdateProcessor(2), Recorder()
+        tasks = [asyncio.ensure_future(process(processor, recorder, 1, f"a{i}", 0.03)) for i in range(3)]
+        await asyncio.sleep(0)
+        # le chat 1 a deux updates en attente de son verrou : le chat 2 passe quand même
+        await process(processor, recorder, 2, "b", 0.0)
+        done_before = [name for kind, name in recorder.events if kind == "end"]
+        await asyncio.gather(*tasks)
+        return done_before
+
+    assert asyncio.run(scenario()) == ["b"]
+
+
+def test_chat_key_fallbacks():
+    assert chat_key(FakeUpdate(5, 7)) == 5
+    assert chat_key(FakeUpdate(user_id=7)) == ("user", 7)
+    assert chat_key(object()) is None
+    with pytest.raises(ValueError):
+        ChatOrderedUpdateProcessor(0)
@@ -0,0 +1,71 @@
+# tests/test_webhook.py
+# Serveur webhook : jeton secret obligatoire hors boucle locale, updates non
+# authentifiées refusées, updates valides placées dans la file de l'Application.
+import asyncio
+import json
+
+import pytest
+from telegram import Bot
+
+from webhook import WebhookServer, check_exposure, is_loopback, SECRET_HEADER
+
+UPDATE = {
+    "update_id": 1,
+    "message": {"message_id": 1, "date": 1, "chat": {"id": 5, "type": "private"},
+                "from": {"id": 5, "is_bot": False, "first_name": "x"}, "text": "/start"},
+}
+
+
+class FakeApplication:
+    def __init__(self):
+        self.bot = Bot("1:A")
+        self.update_queue = asyncio.Queue()
+
+
+def test_is_loopback():
+    assert is_loopback("127.0.0.1") and is_loopback("::1") and is_loopback("localhost")
+    assert not is_loopback("0.0.0.0") and not is_loopback("10.0.0.2") and not is_loopback("example.org")
+
+
+def test_secret_required_off_loopback():
+    assert check_exposure("0.0.0.0", "") is not None
+    assert check_exposure("0.0.0.0", "s3cret") is None
+    assert check_exposure("127.0.0.1", "") is None
+    with pytest.raises(ValueError):
+        WebhookServer(FakeApplication(), "", host="0.0.0.0", port=0)
+
+
+async def post(port, body: bytes, secret=None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    headers = f"POST /telegram HTTP/1.1\r\nConnection: close\r\nContent-Length: {len(body)}\r\n"
+    if secret is not None:
+        headers += f"{SECRET_HEADER}: {secret}\r\n"
+    writer.write(headers.encode() + b"\r\n" + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    writer.close()
+    return status
+
+
+def test_updates_authenticated_by_secret():
+    async def scenario():
+        app = FakeApplication()
+        server = WebhookServer(app, "s3cret", host="127.0.0.1", port=0)
+        await server.start()
+        try:
+            port = server.http.port
+            body = json.dumps(UPDATE).encode()
+            statuses = [
+                await post(port, body),
+                await post(port, body, secret="mauvais"),
+                await post(port, b"{pas du json", secret="s3cret"),
+                await post(port, body, secret="s3cret"),
+            ]
+        finally:
+            await server.stop()
+        return statuses, app.update_queue.qsize(), server.rejected
+
+    statuses, queued, rejected = asyncio.run(scenario())
+    assert statuses == [403, 403, 400, 200]
+    assert queued == 1
+    assert rejected == 2
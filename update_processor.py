@@ -0,0 +1,127 @@
+# update_processor.py
+# Traitement concurrent des updates : les chats différents avancent en parallèle
+# (jusqu'à `max_concurrent_updates`), les updates d'un même chat restent strictement
+# ordonnées pour que les états du ConversationHandler ne se chevauchent jamais.
+import time
+import asyncio
+
+from telegram.ext import BaseUpdateProcessor
+
+import metrics
+
+# borne haute du sémaphore de PTB : les updates en attente de leur chat ne doivent pas
+# occuper les places réservées au traitement (la vraie limite est appliquée ci-dessous)
+MAX_PENDING_UPDATES = 4096
+
+# bornes de l'histogramme de profondeur de file par chat (nombre d'updates devant soi)
+DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64)
+
+
+def chat_key(update):
+    """Clé d'ordonnancement : chat, à défaut utilisateur, sinon None (pas d'ordre imposé)."""
+    chat = getattr(update, "effective_chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(update, "effective_user", None)
+    if user is not None:
+        return ("user", user.id)
+    return None
+
+
+class _ChatSlot:
+    __slots__ = ("lock", "depth")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        # updates du chat en cours ou en attente
+        self.depth = 0
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Processeur d'updates : au plus `max_concurrent_updates` traitements simultanés,
+    un seul à la fois par chat, dans l'ordre d'arrivée (asyncio.Lock est FIFO).
+    """
+
+    __slots__ = ("_max", "_limit", "_slots", "_running", "_waiting")
+
+    def __init__(self, max_concurrent_updates: int):
+        if max_concurrent_updates < 1:
+            raise ValueError("max_concurrent_updates doit être un entier positif.")
+        # le sémaphore de la classe de base est dimensionné via max_concurrent_updates :
+        # on lui donne MAX_PENDING_UPDATES, puis on expose la vraie limite
+        self._max = max(MAX_PENDING_UPDATES, max_concurrent_updates)
+        super().__init__(self._max)
+        self._max = max_concurrent_updates
+        self._limit = asyncio.Semaphore(max_concurrent_updates)
+        self._slots = {}
+        self._running = 0
+        self._waiting = 0
+        metrics.gauge("updates_in_flight", fn=lambda: self._running)
+        metrics.gauge("updates_pending", fn=lambda: self._waiting)
+        metrics.gauge("updates_chats_active", fn=lambda: len(self._slots))
+        metrics.gauge("updates_chat_queue_max", fn=lambda: max((s.depth for s in self._slots.values()), default=0))
+
+    @property
+    def max_concurrent_updates(self) -> int:
+        return self._max
+
+    @property
+    def current_concurrent_updates(self) -> int:
+        return self._running
+
+    def queue_depths(self) -> dict:
+        """Profondeur de file actuelle par chat (updates en cours + en attente)."""
+        return {key: slot.depth for key, slot in self._slots.items()}
+
+    async def do_process_update(self, update, coroutine):
+        key = chat_key(update)
+        if key is None:
+            self._waiting += 1
+            try:
+                await self._limit.acquire()
+            finally:
+                self._waiting -= 1
+            try:
+                await self._run(coroutine)
+            finally:
+                self._limit.release()
+            return
+
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = _ChatSlot()
+        metrics.histogram("update_chat_queue_depth", DEPTH_BUCKETS).observe(slot.depth)
+        slot.depth += 1
+        self._waiting += 1
+        waiting = True
+        t0 = time.perf_counter()
+        try:
+            async with slot.lock:
+                async with self._limit:
+                    self._waiting -= 1
+                    waiting = False
+                    metrics.histogram("update_wait_seconds").observe(time.perf_counter() - t0)
+                    await self._run(coroutine)
+        finally:
+            if waiting:
+                # annulé avant d'avoir été traité
+                self._waiting -= 1
+                if hasattr(coroutine, "close"):
+                    coroutine.close()
+            slot.depth -= 1
+            if slot.depth == 0:
+                # plus rien pour ce chat : on libère l'entrée (mémoire bornée par les chats actifs)
+                self._slots.pop(key, None)
+
+    async def _run(self, coroutine):
+        self._running += 1
+        try:
+            await coroutine
+        finally:
+            self._running -= 1
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
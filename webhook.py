@@ -0,0 +1,153 @@
+# webhook.py
+# Mode webhook : Telegram POSTe les updates sur un serveur HTTP local qui les
+# transmet à l'Application (mêmes ConversationHandler qu'en polling).
+#
+# Test hors ligne : rejouer des updates enregistrées (JSON, une par fichier ou une liste)
+#   python webhook.py replay updates.json --url http://127.0.0.1:8443/telegram --secret XXX
+import os
+import sys
+import hmac
+import json
+import signal
+import asyncio
+import logging
+import argparse
+import ipaddress
+import urllib.request
+from http import HTTPStatus
+
+from http_local import HttpServer
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+
+def is_loopback(host: str) -> bool:
+    """Adresse d'écoute joignable seulement depuis la machine (127.0.0.1, ::1, localhost)."""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def check_exposure(host: str, secret_token: str):
+    """Message d'erreur si le serveur accepterait des updates non authentifiées depuis le réseau."""
+    if not secret_token and not is_loopback(host):
+        return (f"WEBHOOK_SECRET requis pour écouter sur {host} : sans jeton secret, "
+                "n'importe qui atteignant le port pourrait injecter des updates.")
+    return None
+
+
+class WebhookServer:
+    """Reçoit les updates Telegram en POST sur `path`, vérifie le jeton secret
+    (en-tête X-Telegram-Bot-Api-Secret-Token) et les place dans application.update_queue.
+    """
+
+    def __init__(self, application, secret_token: str = "", path: str = "/telegram", host: str = "0.0.0.0", port: int = 8443):
+        error = check_exposure(host, secret_token)
+        if error:
+            raise ValueError(error)
+        self.application = application
+        self.secret_token = secret_token
+        self.path = path
+        self.http = HttpServer(host, port)
+        self.http.route("POST", path, self._on_update)
+        self.received = 0
+        self.rejected = 0
+
+    async def _on_update(self, request):
+        from telegram import Update
+
+        if self.secret_token:
+            given = request.headers.get(SECRET_HEADER, "")
+            if not hmac.compare_digest(given.encode(), self.secret_token.encode()):
+                self.rejected += 1
+                return HTTPStatus.FORBIDDEN, {}, b""
+        try:
+            data = json.loads(request.body)
+            update = Update.de_json(data, self.application.bot)
+        except Exception:
+            logger.warning("Update webhook illisible (%d octets).", len(request.body))
+            return HTTPStatus.BAD_REQUEST, {}, b""
+        self.received += 1
+        # réponse immédiate : le traitement se fait dans la boucle de l'Application
+        await self.application.update_queue.put(update)
+        return HTTPStatus.OK, {}, b""
+
+    async def start(self):
+        await self.http.start()
+
+    async def stop(self):
+        await self.http.stop()
+
+
+async def run_webhook(application, url: str = "", secret_token: str = "", path: str = "/telegram",
+                      host: str = "0.0.0.0", port: int = 8443, stop_event: asyncio.Event = None):
+    """Démarre l'Application sans Updater, enregistre le webhook (si `url`) et sert jusqu'à l'arrêt."""
+    from telegram import Update
+
+    stop_event = stop_event or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    server = WebhookServer(application, secret_token, path, host, port)
+    # un échec au démarrage (connexion, post_init, port occupé) libère aussi ce qui a été ouvert
+    try:
+        await application.initialize()
+        # comme Application.run_polling : préchargement, tâches de fond (cf. main._post_init)
+        if application.post_init is not None:
+            await application.post_init(application)
+        await application.start()
+        await server.start()
+        if url:
+            await application.bot.set_webhook(url=url, secret_token=secret_token or None, allowed_updates=Update.ALL_TYPES)
+            logger.info("Webhook enregistré : %s", url)
+        await stop_event.wait()
+    finally:
+        await server.stop()
+        if application.running:
+            await application.stop()
+        # sans effet si initialize() n'a pas abouti
+        await application.shutdown()
+        # comme Application.run_polling (cf. main._post_shutdown)
+        if application.post_shutdown is not None:
+            await application.post_shutdown(application)
+
+
+# -------------------------
+# Rejeu d'updates enregistrées (test hors ligne)
+# -------------------------
+def replay(files, url: str, secret: str = ""):
+    headers = {"Content-Type": "application/json"}
+    if secret:
+        headers["X-Telegram-Bot-Api-Secret-Token"] = secret
+    for name in files:
+        with open(name, encoding="utf-8") as f:
+            payload = json.load(f)
+        for update in payload if isinstance(payload, list) else [payload]:
+            req = urllib.request.Request(url, data=json.dumps(update).encode(), headers=headers, method="POST")
+            try:
+                with urllib.request.urlopen(req, timeout=10) as resp:
+                    status = resp.status
+            except urllib.error.HTTPError as e:
+                status = e.code
+            print(f"update {update.get('update_id')} -> {status}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Outils du mode webhook.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("replay", help="POSTe des updates JSON enregistrées sur le serveur local")
+    p.add_argument("files", nargs="+")
+    p.add_argument("--url", default=f"http://127.0.0.1:{os.getenv('WEBHOOK_PORT', '8443')}{os.getenv('WEBHOOK_PATH', '/telegram')}")
+    p.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET", ""))
+    args = parser.parse_args()
+    replay(args.files, args.url, args.secret)
+    sys.exit(0)